@@ -0,0 +1,203 @@
+"""Benchmark the parsers on synthetic files
+
+python benchmark.py --receivers 10000 --rays 25 --interactions 4 --output results.json
+python benchmark.py --compare results.json  # rerun with the same settings and compare
+
+Reports, for each parser and InSite version, the parse time (best of
+--repeat), the rays parsed per second, the peak resident memory of a
+fresh process parsing the file, the memory of the parsed arrays per ray
+(in float64 and float32, see P2mFileParser.set_precision) and the mean
+latency of the getters.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+from rwiparsing import P2MDoA, P2mPaths, P2mCir
+from rwiparsing.synthetic import synthetic_rays, write_synthetic_files
+
+PARSERS = {'paths': P2mPaths, 'cir': P2mCir, 'doa': P2MDoA}
+
+# getters taking an antenna_number, timed over the receivers
+RECEIVER_GETTERS = {
+    'paths': ['get_total_received_power', 'get_arrival_time_ndarray', 'get_p_gain_ndarray',
+              'get_departure_angle_ndarray', 'get_arrival_angle_ndarray', 'get_interactions_list',
+              'is_los', 'get_6_parameters_for_all_rays', 'get_7_parameters_for_all_rays'],
+    'cir': ['get_phase_ndarray', 'get_receiver_arrays'],
+    'doa': ['get_receiver_arrays'],
+}
+# getters of the whole file
+FILE_GETTERS = {
+    'paths': ['get_data_dict'],
+    'cir': ['get_data_dict'],
+    'doa': ['get_data_ndarray', 'get_data_dict'],
+}
+
+
+def _peak_rss():
+    # on linux ru_maxrss survives exec, so a spawned child would start with
+    # the peak of its parent, VmHWM is the one of the process' own memory
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _parse_in_child(type_, filename):
+    """Run in a fresh process: the memory before parsing and the peak while parsing"""
+    before = _peak_rss()
+    parser = PARSERS[type_](filename)
+    return before, _peak_rss(), int(parser.ray_offsets[-1])
+
+
+def measure_memory(type_, filename):
+    # spawn, a forked child would inherit the peak of this process
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+        return executor.submit(_parse_in_child, type_, filename).result()
+
+
+def time_getters(parser, type_, max_receivers):
+    latencies = {}
+    receivers = parser.receiver_ids.tolist()[:max_receivers]
+    for name in RECEIVER_GETTERS[type_]:
+        if name == 'get_7_parameters_for_all_rays' and not parser.has_phase:
+            continue
+        getter = getattr(parser, name)
+        start = time.perf_counter()
+        for receiver in receivers:
+            getter(receiver)
+        latencies[name] = (time.perf_counter() - start) / max(1, len(receivers))
+    for name in FILE_GETTERS[type_]:
+        parser._data = None
+        start = time.perf_counter()
+        getattr(parser, name)()
+        latencies[name] = time.perf_counter() - start
+    return latencies
+
+
+def benchmark_file(type_, filename, version, repeat, max_receivers):
+    parse_seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser = PARSERS[type_](filename)
+        parse_seconds.append(time.perf_counter() - start)
+    n_rays = int(parser.ray_offsets[-1])
+    rss_before, rss_peak, _ = measure_memory(type_, filename)
+    getter_seconds = time_getters(parser, type_, max_receivers)
+    return {
+        'parser': PARSERS[type_].__name__,
+        'version': version,
+        'file_bytes': os.path.getsize(filename),
+        'n_receivers': parser.n_receivers,
+        'n_rays': n_rays,
+        'parse_seconds': min(parse_seconds),
+        'rays_per_second': n_rays / min(parse_seconds),
+        'peak_rss_bytes': rss_peak,
+        'parse_rss_bytes': rss_peak - rss_before,
+        'bytes_per_ray': parser.bytes_per_ray(),
+        'bytes_per_ray_float32': parser.set_precision(np.float32).bytes_per_ray(),
+        'getter_seconds': getter_seconds,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(config):
+    results = []
+    rays = synthetic_rays(config['receivers'], config['rays'], config['interactions'],
+                          seed=config['seed'])
+    with tempfile.TemporaryDirectory() as directory:
+        for version in config['versions']:
+            filenames = write_synthetic_files(os.path.join(directory, version), rays,
+                                              types=config['types'], version=version)
+            for type_, filename in filenames.items():
+                # only the paths files differ between versions
+                if type_ != 'paths' and version != config['versions'][0]:
+                    continue
+                results.append(benchmark_file(type_, filename, version, config['repeat'],
+                                              config['getter_receivers']))
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'config': config,
+        'results': results,
+    }
+
+
+def _key(result):
+    return result['parser'], result['version']
+
+
+def print_report(report, baseline=None):
+    previous = {_key(result): result for result in (baseline or {}).get('results', [])}
+    for result in report['results']:
+        line = '{parser:8s} {version}  {n_rays:9d} rays  {parse_seconds:8.3f} s  ' \
+               '{rays_per_second:12.0f} rays/s  {parse_rss_bytes:12d} B  ' \
+               '{bytes_per_ray:6.1f} B/ray ({bytes_per_ray_float32:.1f} in float32)'.format(**result)
+        old = previous.get(_key(result))
+        if old is not None:
+            line += '  x{:.2f} faster'.format(old['parse_seconds'] / result['parse_seconds'])
+        print(line)
+        for name, seconds in result['getter_seconds'].items():
+            line = '    {:32s} {:10.2f} us'.format(name, seconds * 1e6)
+            if old is not None and name in old['getter_seconds']:
+                line += '  x{:.2f} faster'.format(old['getter_seconds'][name] / seconds)
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--receivers', type=int, default=2000)
+    parser.add_argument('--rays', type=int, default=25, help='maximum number of rays per receiver')
+    parser.add_argument('--interactions', type=int, default=4, help='maximum number of interactions per ray')
+    parser.add_argument('--versions', nargs='+', default=['3.3', '3.2'], choices=['3.2', '3.3'])
+    parser.add_argument('--types', nargs='+', default=['paths', 'cir', 'doa'], choices=sorted(PARSERS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--getter-receivers', type=int, default=1000,
+                        help='number of receivers the getters are timed on')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json results of a previous run, rerun with its settings')
+    args = parser.parse_args()
+
+    baseline = None
+    config = {name: getattr(args, name) for name in
+              ('receivers', 'rays', 'interactions', 'versions', 'types', 'repeat', 'getter_receivers', 'seed')}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        config = baseline['config']
+
+    report = run(config)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,36 @@
 from rwiparsing import p2mdoa
+from rwiparsing.beams import BeamCodebook
 
 
 class ClusterRays():
     # Cluster rays into beams
-    #something here
-    
-    def __init__(self):
+
+    def __init__(self, numBeams=16, numElevationBeams=1):
         #self.doa = p2mdoa.P2MDoA(filename)
         #print(self.doa.get_data_ndarray())
-        self.numBeams = 16 #number of beams
+        self.numBeams = numBeams #number of beams in azimuth
         self.beamAzimuthWidth=360/self.numBeams
+        self.codebook = BeamCodebook(numBeams, numElevationBeams)
 
     def processRays(self,azimuth,ellevation):
-        #currently we will assume the beam is given by the azimuth only, and ignore ellevation
-        beamNumber = int(azimuth / self.beamAzimuthWidth)
-        return beamNumber
+        #the beam of a single ray, ellevation only matters with numElevationBeams > 1
+        return int(self.codebook.beam_index(azimuth, ellevation))
+
+    def processAllRays(self, data_ndarray, mask=None):
+        #the beams of all the rays of a P2MDoA.get_data_ndarray(), -1 for the padding
+        return self.codebook.assign(data_ndarray, mask)
+
+    def bestBeams(self, data_ndarray, mask=None):
+        #the beam receiving most power for each receiver, -1 if it has no paths
+        beams = self.processAllRays(data_ndarray, mask)
+        return self.codebook.best_beam(beams, data_ndarray[..., 2])
 
 if __name__=='__main__':
     #doa = p2mdoa.P2MDoA('example/iter0.dod.t001_05.r006.p2m') #angle of departure
     doa = p2mdoa.P2MDoA('example/iter0.doa.t001_05.r006.p2m') #angle of arrival
     clusterrays = ClusterRays()
-    
+
     data_ndarray = doa.get_data_ndarray()
-    for rx in range(15):
-        for path in range(25):
-            print(clusterrays.processRays(data_ndarray[rx][path][0],data_ndarray[rx][path][1]))
\ No newline at end of file
+    mask = doa.get_mask_ndarray()
+    print(clusterrays.processAllRays(data_ndarray, mask))
+    print(clusterrays.bestBeams(data_ndarray, mask))
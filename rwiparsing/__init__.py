@@ -1,3 +1,12 @@
-from .p2mdoa import P2MDoA
+from .p2mdoa import P2MDoA, P2MDoD
 from .p2mpaths import P2mPaths
 from .p2mcir import P2mCir
+from .p2mpositions import P2mPositions
+from .formats import open_p2m
+from .study import load_study
+from .p2mbin import write_p2mbin, open_p2mbin
+from .p2mindex import LazyP2mFile, parse_parallel
+from .link import P2mLink
+from .dataset import RayTensorBuilder
+from .ingest import StudyIngestor, load_dataset
+from .episodes import EpisodeIndex
@@ -0,0 +1,86 @@
+"""Assign rays to beams of a fixed codebook, for all rays at once
+
+> doa = P2MDoA('iter0.doa.t001_05.r006.p2m')
+> codebook = BeamCodebook(n_azimuth=16)
+> beams = codebook.assign(doa.get_data_ndarray(), doa.get_mask_ndarray())
+> best = codebook.best_beam(beams, doa.get_data_ndarray()[..., 2])
+
+The beams split the azimuth [0, 360) in n_azimuth sectors and the
+elevation [0, 180] (from the zenith) in n_elevation sectors, the beam
+index is elevation_sector * n_azimuth + azimuth_sector. Angles are in
+degrees and powers in dB, rays outside the mask get the beam -1.
+"""
+import numpy as np
+
+
+class BeamCodebook:
+    """Uniform azimuth x elevation codebook of n_azimuth * n_elevation beams"""
+
+    def __init__(self, n_azimuth=16, n_elevation=1):
+        self.n_azimuth = n_azimuth
+        self.n_elevation = n_elevation
+        self.n_beams = n_azimuth * n_elevation
+        self.azimuth_width = 360 / n_azimuth
+        self.elevation_width = 180 / n_elevation
+
+    def beam_index(self, azimuth, elevation=None):
+        """Beam of each direction, elevation is only needed if n_elevation > 1"""
+        azimuth = np.mod(azimuth, 360)
+        azimuth_sector = np.minimum((azimuth // self.azimuth_width).astype(np.int64), self.n_azimuth - 1)
+        if self.n_elevation == 1:
+            return azimuth_sector
+        elevation_sector = np.clip((np.asarray(elevation) // self.elevation_width).astype(np.int64),
+                                   0, self.n_elevation - 1)
+        return elevation_sector * self.n_azimuth + azimuth_sector
+
+    def assign(self, directions, mask=None):
+        """Beams of a (receiver, path, 3) array of (azimuth, elevation, power)
+        as returned by P2MDoA.get_data_ndarray()
+
+        mask tells the valid paths (see P2MDoA.get_mask_ndarray), by default
+        the paths that are not all zeros, the padding of get_data_ndarray.
+        """
+        directions = np.asarray(directions)
+        if mask is None:
+            mask = np.any(directions != 0, axis=-1)
+        beams = self.beam_index(directions[..., 0], directions[..., 1])
+        return np.where(mask, beams, -1)
+
+    def beam_power(self, beams, power):
+        """Linear power received in each beam, (receiver, n_beams)
+
+        beams and power (in dB) are (receiver, path) arrays, paths with the
+        beam -1 are ignored.
+        """
+        beams = np.asarray(beams)
+        n_receivers = beams.shape[0]
+        valid = beams >= 0
+        receiver = np.broadcast_to(np.arange(n_receivers)[:, np.newaxis], beams.shape)
+        flat_beam = receiver[valid] * self.n_beams + beams[valid]
+        linear_power = 10 ** (np.asarray(power, dtype=np.float64)[valid] / 10)
+        return np.bincount(flat_beam, weights=linear_power,
+                           minlength=n_receivers * self.n_beams).reshape((n_receivers, self.n_beams))
+
+    def best_beam(self, beams, power):
+        """Beam receiving most power for each receiver, -1 for receivers without paths"""
+        beam_power = self.beam_power(beams, power)
+        best = np.argmax(beam_power, axis=1)
+        best[~np.any(np.asarray(beams) >= 0, axis=1)] = -1
+        return best
+
+    def assign_paths(self, paths, departure=False):
+        """Beams of the rays of a P2mPaths, in the layout of its arrays
+
+        Use the arrival angles, or the departure ones if departure. Return
+        the (n_rays,) beams and the (n_receivers,) best beams.
+        """
+        angles = paths.departure_angle if departure else paths.arrival_angle
+        beams = self.beam_index(angles[:, 1], angles[:, 0])
+        n_paths = np.diff(paths.ray_offsets)
+        receiver = np.repeat(np.arange(len(n_paths)), n_paths)
+        beam_power = np.bincount(receiver * self.n_beams + beams,
+                                 weights=10 ** (paths.srcvdpower / 10),
+                                 minlength=len(n_paths) * self.n_beams).reshape((len(n_paths), self.n_beams))
+        best = np.argmax(beam_power, axis=1)
+        best[n_paths == 0] = -1
+        return beams, best
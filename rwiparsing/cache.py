@@ -0,0 +1,150 @@
+"""On-disk cache of parsed p2m files
+
+> cache = ParseCache('~/.cache/rwiparsing', max_bytes=2**30)
+> P2mPaths('model.paths.t001_01.r002.p2m', cache=cache)
+
+The first call parses the file and stores its arrays (see
+P2mFileParser.to_arrays) in a .npz file, the next ones load them back
+without touching the text parser. An entry is used only if the size and
+modification time of the source are unchanged, or if they changed but
+its content hash is still the same.
+"""
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+
+# bump when the arrays stored by the parsers change
+CACHE_FORMAT = 2
+
+_FINGERPRINT = ('__size__', '__mtime_ns__', '__content_hash__')
+
+
+def content_hash(filename, block_size=2**20):
+    """blake2b digest of the file content"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """Cache of parsed p2m files in directory, evicting the least recently
+    used entries once they take more than max_bytes (no limit if None)
+
+    The directory defaults to $RWIPARSING_CACHE_DIR or ~/.cache/rwiparsing.
+    """
+
+    def __init__(self, directory=None, max_bytes=2**32):
+        if directory is None:
+            directory = os.environ.get('RWIPARSING_CACHE_DIR',
+                                       os.path.join('~', '.cache', 'rwiparsing'))
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def entry_path(self, parser_class, filename):
+        """Path of the cache entry of filename parsed with parser_class"""
+        key = '{}\0{}\0{}'.format(CACHE_FORMAT, parser_class.__name__,
+                                  os.path.abspath(filename))
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode()).hexdigest() + '.npz')
+
+    def parse(self, parser):
+        """Fill parser from the cache or parse its file and store the result"""
+        with parser._phase('cache_load'):
+            arrays = self.load(type(parser), parser.filename)
+        if arrays is not None:
+            filename = parser.filename
+            parser._set_arrays(arrays)
+            parser.filename = filename
+            if parser._stats is not None:
+                parser._stats.count('cache_hits', 1)
+            return
+        with parser._phase('cache_load'):
+            stat = os.stat(parser.filename)
+            fingerprint = (stat.st_size, stat.st_mtime_ns, content_hash(parser.filename))
+        parser._parse()
+        if parser.truncation is not None:
+            # a partial result, the complete file would be found in the cache
+            return
+        with parser._phase('cache_store'):
+            self.store(parser, fingerprint)
+
+    def load(self, parser_class, filename):
+        """Return the cached arrays of filename or None if it is missing or stale"""
+        entry = self.entry_path(parser_class, filename)
+        try:
+            with np.load(entry) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            size, mtime_ns, digest = (arrays.pop(name).item() for name in _FINGERPRINT)
+        except (OSError, ValueError, KeyError):
+            # missing or unreadable entries are misses
+            return None
+        stat = os.stat(filename)
+        if stat.st_size != size:
+            return None
+        if stat.st_mtime_ns != mtime_ns:
+            # touched or copied, but maybe not modified
+            if content_hash(filename) != digest:
+                return None
+            self._write(entry, arrays, (size, stat.st_mtime_ns, digest))
+        # the modification time of the entry is its last use, for the LRU eviction
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            # evicted meanwhile by another process, the arrays are still good
+            pass
+        return arrays
+
+    def store(self, parser, fingerprint):
+        """Store the arrays of parser, fingerprint is the (size, mtime_ns,
+        content_hash) of its file before it was parsed"""
+        entry = self.entry_path(type(parser), parser.filename)
+        self._write(entry, parser.to_arrays(), fingerprint)
+        self.evict()
+
+    def _write(self, entry, arrays, fingerprint):
+        arrays = dict(arrays)
+        for name, value in zip(_FINGERPRINT, fingerprint):
+            arrays[name] = np.asarray(value)
+        # write aside and rename, so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.savez(file, **arrays)
+            os.replace(tmp, entry)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def evict(self):
+        """Remove the least recently used entries above max_bytes"""
+        if self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove all the entries"""
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                os.unlink(os.path.join(self.directory, name))
@@ -0,0 +1,205 @@
+"""Channel synthesis from the rays of a paths or cir file
+
+> rays = ChannelRays.from_paths(P2mPaths('model.paths.t001_01.r002.p2m'))
+> h = rays.frequency_response(ofdm_frequencies(64, 240e3))  # (receiver, subcarrier)
+> H = rays.mimo_narrowband(ULA(8), ULA(32))  # (receiver, 8, 32)
+
+Everything is computed for all the receivers of the file at once, the
+receiver without paths get zero channels.
+
+Conventions: srcvdpower is in dB (dBm in InSite) and the complex gain of
+a ray is 10**(srcvdpower/20) * exp(1j*phase), phases and angles are in
+degrees, delays in seconds. The angle1 of the rays is the elevation from
+the zenith (90 is the horizon) and angle2 the azimuth from the x axis.
+"""
+import numpy as np
+
+# bound on the number of complex values computed at once, to limit memory
+_BLOCK_ELEMENTS = 2**22
+
+
+def ofdm_frequencies(n_subcarriers, spacing):
+    """Baseband frequencies of n_subcarriers centered on the carrier"""
+    return (np.arange(n_subcarriers) - n_subcarriers // 2) * spacing
+
+
+class ULA:
+    """Uniform linear array of n elements along the y axis, spacing in wavelengths"""
+
+    def __init__(self, n, spacing=0.5):
+        self.n = n
+        self.spacing = spacing
+        self.n_elements = n
+
+    def steering(self, elevation, azimuth):
+        """Return the (..., n) steering vectors of the directions (in degrees)"""
+        theta = np.radians(elevation)[..., np.newaxis]
+        phi = np.radians(azimuth)[..., np.newaxis]
+        return np.exp(2j * np.pi * self.spacing * np.arange(self.n) * np.sin(theta) * np.sin(phi))
+
+
+class UPA:
+    """Uniform planar array of ny x nz elements in the y-z plane, spacing in wavelengths
+
+    The elements are ordered with z varying fastest.
+    """
+
+    def __init__(self, ny, nz, spacing=0.5):
+        self.ny = ny
+        self.nz = nz
+        self.spacing = spacing
+        self.n_elements = ny * nz
+
+    def steering(self, elevation, azimuth):
+        """Return the (..., ny * nz) steering vectors of the directions (in degrees)"""
+        theta = np.radians(elevation)[..., np.newaxis]
+        phi = np.radians(azimuth)[..., np.newaxis]
+        y = np.repeat(np.arange(self.ny), self.nz)
+        z = np.tile(np.arange(self.nz), self.ny)
+        return np.exp(2j * np.pi * self.spacing *
+                      (y * np.sin(theta) * np.sin(phi) + z * np.cos(theta)))
+
+
+class ChannelRays:
+    """The per ray channel parameters of all the receivers of a file
+
+    ray_offsets maps the receivers to their rays as in the parsers. The
+    angles are (n_rays, 2) arrays of (elevation, azimuth) and may be None
+    for cir files, which only allow SISO channels.
+    """
+
+    def __init__(self, ray_offsets, power, phase, delay, arrival_angle=None, departure_angle=None):
+        self.ray_offsets = ray_offsets
+        self.power = power
+        self.phase = phase
+        self.delay = delay
+        self.arrival_angle = arrival_angle
+        self.departure_angle = departure_angle
+        self.n_receivers = len(ray_offsets) - 1
+
+    @classmethod
+    def from_paths(cls, paths, cir=None):
+        """Rays of a P2mPaths. InSite 3.2 paths files have no phase, it is taken
+        from cir (the P2mCir of the same transmitter and receivers) if given
+        and is zero otherwise."""
+        if paths.phase is not None:
+            phase = paths.phase
+        elif cir is not None:
+            if not np.array_equal(cir.ray_offsets, paths.ray_offsets):
+                raise ValueError('The cir and paths files do not have the same rays')
+            phase = cir.phase
+        else:
+            phase = np.zeros_like(paths.srcvdpower)
+        return cls(paths.ray_offsets, paths.srcvdpower, phase, paths.arrival_time,
+                   paths.arrival_angle, paths.departure_angle)
+
+    @classmethod
+    def from_cir(cls, cir):
+        return cls(cir.ray_offsets, cir.srcvdpower, cir.phase, cir.arrival_time)
+
+    def complex_gains(self):
+        return 10 ** (np.asarray(self.power, dtype=np.float64) / 20) * np.exp(1j * np.radians(self.phase))
+
+    def _delays(self, relative_delay):
+        """Delays, relative to the first arrival of each receiver if relative_delay"""
+        delay = np.asarray(self.delay, dtype=np.float64)
+        if not relative_delay or len(delay) == 0:
+            return delay
+        n_paths = np.diff(self.ray_offsets)
+        first = np.zeros((self.n_receivers,))
+        has_paths = n_paths > 0
+        first[has_paths] = np.minimum.reduceat(delay, self.ray_offsets[:-1][has_paths])
+        return delay - np.repeat(first, n_paths)
+
+    def _sum_per_receiver(self, shape, elements_per_ray, ray_values):
+        """Sum ray_values(rays), the (n_rays_in_block,) + shape contributions
+        of the rays of a block of receivers, into a (n_receivers,) + shape array
+
+        The receivers are processed in blocks of about _BLOCK_ELEMENTS values.
+        """
+        out = np.zeros((self.n_receivers,) + shape, dtype=np.complex128)
+        n_paths = np.diff(self.ray_offsets)
+        rays_per_block = max(1, _BLOCK_ELEMENTS // max(1, elements_per_ray))
+        start = 0
+        while start < self.n_receivers:
+            # take receivers until the block is full, at least one
+            stop = np.searchsorted(self.ray_offsets, self.ray_offsets[start] + rays_per_block,
+                                   side='right') - 1
+            stop = min(max(stop, start + 1), self.n_receivers)
+            first, last = self.ray_offsets[start], self.ray_offsets[stop]
+            has_paths = n_paths[start:stop] > 0
+            if last > first:
+                values = ray_values(slice(first, last))
+                out[start:stop][has_paths] = np.add.reduceat(
+                    values, self.ray_offsets[start:stop][has_paths] - first, axis=0)
+            start = stop
+        return out
+
+    def cir(self, sample_period, n_taps, pulse='sinc', relative_delay=False):
+        """Discrete-time channel impulse response, (receiver, n_taps)
+
+        pulse is 'sinc' for a band-limited channel sampled every
+        sample_period or 'nearest' to add each ray to its closest tap.
+        Rays beyond the last tap are dropped with 'nearest'.
+        """
+        gains = self.complex_gains()
+        delays = self._delays(relative_delay) / sample_period
+        taps = np.arange(n_taps)
+
+        def ray_values(rays):
+            if pulse == 'sinc':
+                return gains[rays, np.newaxis] * np.sinc(taps - delays[rays, np.newaxis])
+            elif pulse == 'nearest':
+                values = np.zeros((rays.stop - rays.start, n_taps), dtype=np.complex128)
+                tap = np.rint(delays[rays]).astype(np.int64)
+                inside = (tap >= 0) & (tap < n_taps)
+                values[np.flatnonzero(inside), tap[inside]] = gains[rays][inside]
+                return values
+            raise ValueError('Unknown pulse {}'.format(pulse))
+        return self._sum_per_receiver((n_taps,), n_taps, ray_values)
+
+    def frequency_response(self, frequencies, relative_delay=False):
+        """Frequency response at the baseband frequencies (e.g. the OFDM
+        subcarriers of ofdm_frequencies), (receiver, len(frequencies))"""
+        gains = self.complex_gains()
+        delays = self._delays(relative_delay)
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+
+        def ray_values(rays):
+            return gains[rays, np.newaxis] * np.exp(
+                -2j * np.pi * delays[rays, np.newaxis] * frequencies)
+        return self._sum_per_receiver(frequencies.shape, len(frequencies), ray_values)
+
+    def _check_angles(self):
+        if self.arrival_angle is None or self.departure_angle is None:
+            raise ValueError('MIMO channels need the angles of a paths file')
+
+    def mimo_narrowband(self, rx_array, tx_array):
+        """Narrowband MIMO channel matrices, (receiver, rx elements, tx elements)
+
+        H = sum over the rays of gain * a_rx(arrival) a_tx(departure)^H
+        """
+        self._check_angles()
+        gains = self.complex_gains()
+        shape = (rx_array.n_elements, tx_array.n_elements)
+
+        def ray_values(rays):
+            a_rx = rx_array.steering(self.arrival_angle[rays, 0], self.arrival_angle[rays, 1])
+            a_tx = tx_array.steering(self.departure_angle[rays, 0], self.departure_angle[rays, 1])
+            return gains[rays, np.newaxis, np.newaxis] * a_rx[:, :, np.newaxis] * a_tx.conj()[:, np.newaxis, :]
+        return self._sum_per_receiver(shape, shape[0] * shape[1], ray_values)
+
+    def mimo_wideband(self, rx_array, tx_array, frequencies, relative_delay=False):
+        """MIMO channel matrices per frequency, (receiver, frequency, rx elements, tx elements)"""
+        self._check_angles()
+        gains = self.complex_gains()
+        delays = self._delays(relative_delay)
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        shape = (len(frequencies), rx_array.n_elements, tx_array.n_elements)
+
+        def ray_values(rays):
+            a_rx = rx_array.steering(self.arrival_angle[rays, 0], self.arrival_angle[rays, 1])
+            a_tx = tx_array.steering(self.departure_angle[rays, 0], self.departure_angle[rays, 1])
+            response = gains[rays, np.newaxis] * np.exp(-2j * np.pi * delays[rays, np.newaxis] * frequencies)
+            return np.einsum('lk,li,lj->lkij', response, a_rx, a_tx.conj())
+        return self._sum_per_receiver(shape, shape[0] * shape[1] * shape[2], ray_values)
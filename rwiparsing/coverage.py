@@ -0,0 +1,185 @@
+"""Coverage of several transmitters over the receivers of a receiver set
+
+> coverage = Coverage()
+> for filename in glob.glob('run00000/study/model.paths.t*_01.r002.p2m'):
+>     coverage.add_file(filename)
+> coverage.received_power  # (transmitter, receiver) in dBm, NaN without paths
+> servers, power = coverage.best_server()
+> coverage.sinr(noise_dbm=-100)
+> coverage.refresh()  # reparse the files that changed since
+
+or for all the receiver sets of a study:
+> coverages = coverage_of_study(load_study('results', types=('paths',)))
+
+A P2mPaths holds one transmitter: its per receiver totals (the
+received_power, mean_arrival_time and spread_delay lines) are a row of
+the matrices, whose columns are the union of the receivers of the files.
+Adding or replacing a transmitter only touches its row.
+"""
+import os
+import collections
+
+import numpy as np
+
+from .p2mpaths import P2mPaths
+
+# per receiver totals of the P2mPaths kept for each transmitter
+FIELDS = ('received_power', 'mean_arrival_time', 'spread_delay')
+
+
+def _dbm_to_mw(power):
+    return np.power(10.0, power / 10)
+
+
+class Coverage:
+    """The (transmitter, receiver) matrices of the FIELDS of several P2mPaths
+
+    The transmitters are the (transmitter, transmitter_set) of the files
+    unless given to add. receiver_ids are the sorted receivers of all the
+    files, entries of a receiver missing from a file or without paths are
+    NaN.
+    """
+
+    def __init__(self):
+        self.transmitters = []
+        self.receiver_ids = np.zeros((0,), dtype=np.int32)
+        self._rows = {}
+        # transmitter -> (filename, size, mtime_ns) of the files of add_file
+        self._files = {}
+        self._matrices = None
+
+    def add(self, paths, transmitter=None):
+        """Add the totals of paths, replacing the ones of the same transmitter"""
+        if transmitter is None:
+            transmitter = (paths.transmitter, paths.transmitter_set)
+        receivers = np.union1d(self.receiver_ids, paths.receiver_ids).astype(np.int32)
+        if len(receivers) != len(self.receiver_ids):
+            # new receivers, widen the rows already there
+            columns = np.searchsorted(receivers, self.receiver_ids)
+            for key, row in self._rows.items():
+                wide = np.full((len(FIELDS), len(receivers)), np.nan)
+                wide[:, columns] = row
+                self._rows[key] = wide
+            self.receiver_ids = receivers
+        row = np.full((len(FIELDS), len(self.receiver_ids)), np.nan)
+        row[:, np.searchsorted(self.receiver_ids, paths.receiver_ids)] = [
+            getattr(paths, field) for field in FIELDS]
+        if transmitter not in self._rows:
+            self.transmitters.append(transmitter)
+        self._rows[transmitter] = row
+        self._matrices = None
+        return transmitter
+
+    def remove(self, transmitter):
+        self.transmitters.remove(transmitter)
+        del self._rows[transmitter]
+        self._files.pop(transmitter, None)
+        self._matrices = None
+
+    def add_file(self, filename, transmitter=None, cache=None):
+        """Parse a paths file and add it, refresh will reparse it if it changes"""
+        stat = os.stat(filename)
+        transmitter = self.add(P2mPaths(filename, cache=cache), transmitter)
+        self._files[transmitter] = (filename, stat.st_size, stat.st_mtime_ns)
+        return transmitter
+
+    def refresh(self, cache=None):
+        """Reparse the files of add_file modified since they were added and
+        return their transmitters, the other rows are left as they are"""
+        changed = []
+        for transmitter, (filename, size, mtime_ns) in list(self._files.items()):
+            stat = os.stat(filename)
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self.add_file(filename, transmitter, cache)
+                changed.append(transmitter)
+        return changed
+
+    def _matrix(self, field):
+        if self._matrices is None:
+            if self.transmitters:
+                self._matrices = np.stack([self._rows[t] for t in self.transmitters], axis=1)
+            else:
+                self._matrices = np.zeros((len(FIELDS), 0, len(self.receiver_ids)))
+        return self._matrices[FIELDS.index(field)]
+
+    @property
+    def received_power(self):
+        """(transmitter, receiver) received power in dBm"""
+        return self._matrix('received_power')
+
+    @property
+    def mean_arrival_time(self):
+        return self._matrix('mean_arrival_time')
+
+    @property
+    def spread_delay(self):
+        return self._matrix('spread_delay')
+
+    def best_server(self):
+        """The index in transmitters of the strongest transmitter of each
+        receiver, -1 for the receivers with no paths, and its power"""
+        power = self.received_power
+        covered = (~np.isnan(power)).any(axis=0)
+        servers = np.full(covered.shape, -1, dtype=np.int64)
+        if covered.any():
+            servers[covered] = np.nanargmax(power[:, covered], axis=0)
+        best = np.full(covered.shape, np.nan)
+        best[covered] = power[servers[covered], np.flatnonzero(covered)]
+        return servers, best
+
+    def sinr(self, noise_dbm=None):
+        """Signal to interference plus noise ratio of each receiver in dB
+
+        The signal is the best server, the interference the sum in mW of
+        the other transmitters. Without noise_dbm receivers with a single
+        transmitter are +inf, receivers without paths are NaN.
+        """
+        servers, best = self.best_server()
+        total = np.nansum(_dbm_to_mw(self.received_power), axis=0)
+        interference = total - np.where(np.isnan(best), 0, _dbm_to_mw(best))
+        # rounding can leave a tiny negative interference
+        interference = np.maximum(interference, 0)
+        if noise_dbm is not None:
+            interference = interference + _dbm_to_mw(noise_dbm)
+        with np.errstate(divide='ignore'):
+            sinr = best - 10 * np.log10(interference)
+        sinr[servers < 0] = np.nan
+        return sinr
+
+    def serving_spread_delay(self):
+        """Spread delay of each receiver from its best server, NaN without one"""
+        servers, _ = self.best_server()
+        spread = np.full(servers.shape, np.nan)
+        served = servers >= 0
+        spread[served] = self.spread_delay[servers[served], np.flatnonzero(served)]
+        return spread
+
+    def spread_delay_statistics(self, percentiles=(50, 90, 95)):
+        """Statistics of the spread delay over the covered receivers of each
+        transmitter, as an OrderedDict of (transmitter,) arrays: count, mean,
+        std, min, max and the percentiles, NaN for a transmitter covering
+        no receiver"""
+        spread = self.spread_delay
+        count = np.sum(~np.isnan(spread), axis=1)
+        statistics = collections.OrderedDict([('count', count)])
+        covering = count > 0
+        reductions = [('mean', np.nanmean), ('std', np.nanstd), ('min', np.nanmin), ('max', np.nanmax)]
+        reductions += [('p{:g}'.format(q), lambda a, axis, q=q: np.nanpercentile(a, q, axis=axis))
+                       for q in percentiles]
+        for name, reduce in reductions:
+            values = np.full((len(count),), np.nan)
+            if covering.any():
+                values[covering] = reduce(spread[covering], axis=1)
+            statistics[name] = values
+        return statistics
+
+
+def coverage_of_study(study, file_type='paths'):
+    """One Coverage per (run, receiver_set) of a load_study result, with
+    the transmitters (transmitter, transmitter_set) of its files"""
+    coverages = collections.OrderedDict()
+    for (run, transmitter, transmitter_set, receiver_set), files in study.items():
+        if file_type in files:
+            coverage = coverages.setdefault((run, receiver_set), Coverage())
+            coverage.add(files[file_type], (transmitter, transmitter_set))
+    return coverages
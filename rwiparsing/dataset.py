@@ -0,0 +1,142 @@
+"""Fixed-shape ray tensors for machine learning from many paths files
+
+> builder = RayTensorBuilder((n_episodes, n_scenes, n_receivers), max_rays=25,
+>                            sort_by_power=True, los_channel=True)
+> for episode, scene, filename in files:
+>     builder.add(episode, scene, P2mPaths(filename))
+> builder.save_npz('rays.npz')
+
+Each ray holds the 7 parameters of P2mPaths.get_7_parameters_for_all_rays
+and, with los_channel, is_los as an 8th channel.
+"""
+import numpy as np
+
+N_PARAMETERS = 7
+
+
+class RayTensorBuilder:
+    """Fill a (episode, scene, receiver, max_rays, channels) array of rays
+
+    mask[episode, scene, receiver, ray] tells the rays that exist, the
+    others are zero. With sort_by_power the rays of each receiver are the
+    max_rays strongest (top-K by srcvdpower) in decreasing power, otherwise
+    the first max_rays in file order. InSite 3.2 files have no phase, its
+    channel is left at zero.
+
+    rays and mask are preallocated with zeros unless given, e.g. as
+    numpy.memmap or h5py datasets (see create_hdf5). dtype float16 cannot
+    represent arrival times in seconds, prefer float32 for them.
+    """
+
+    def __init__(self, shape, max_rays, sort_by_power=False, dtype=np.float32,
+                 los_channel=False, rays=None, mask=None):
+        self.shape = tuple(shape)
+        self.max_rays = max_rays
+        self.sort_by_power = sort_by_power
+        self.dtype = np.dtype(dtype)
+        self.los_channel = los_channel
+        self.n_channels = N_PARAMETERS + 1 if los_channel else N_PARAMETERS
+        if rays is None:
+            rays = np.zeros(self.shape + (max_rays, self.n_channels), dtype=self.dtype)
+        if mask is None:
+            mask = np.zeros(self.shape + (max_rays,), dtype=bool)
+        self.rays = rays
+        self.mask = mask
+        self._file = None
+
+    @classmethod
+    def create_hdf5(cls, filename, shape, max_rays, compression=None, **kwargs):
+        """Builder writing directly to the 'rays' and 'mask' datasets of a new
+        HDF5 file, one scene at a time. Requires h5py, call close() at the end."""
+        import h5py
+        file = h5py.File(filename, 'w')
+        shape = tuple(shape)
+        n_channels = N_PARAMETERS + 1 if kwargs.get('los_channel') else N_PARAMETERS
+        # one chunk per scene, the unit add() writes
+        chunks = (1, 1) + shape[2:] + (max_rays,)
+        rays = file.create_dataset('rays', shape=shape + (max_rays, n_channels),
+                                   dtype=np.dtype(kwargs.get('dtype', np.float32)),
+                                   chunks=chunks + (n_channels,), compression=compression)
+        mask = file.create_dataset('mask', shape=shape + (max_rays,), dtype=bool,
+                                   chunks=chunks, compression=compression)
+        builder = cls(shape, max_rays, rays=rays, mask=mask, **kwargs)
+        builder._file = file
+        return builder
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def ray_values(self, paths):
+        """Return the channels of all the rays of a P2mPaths as a (n_rays, channels) array"""
+        values = np.zeros((len(paths.srcvdpower), self.n_channels))
+        values[:, 0] = paths.srcvdpower
+        values[:, 1] = paths.arrival_time
+        values[:, 2:4] = paths.departure_angle
+        values[:, 4:6] = paths.arrival_angle
+        if paths.phase is not None:
+            values[:, 6] = paths.phase
+        if self.los_channel:
+            values[:, 7] = paths.interactions.los()
+        return values
+
+    def add(self, episode, scene, paths, receivers=None):
+        """Fill the scene of an episode with the rays of a P2mPaths
+
+        receivers are the antenna numbers in the order of the receiver axis,
+        all the receivers of the file by default.
+        """
+        if receivers is None:
+            receiver_idx = np.arange(paths.n_receivers)
+        else:
+            receiver_idx = np.array([paths._receiver_index[r] for r in receivers], dtype=np.int64)
+        if len(receiver_idx) > self.shape[2]:
+            raise ValueError('{} receivers do not fit in {}'.format(len(receiver_idx), self.shape[2]))
+
+        # the rays of the selected receivers, with their position on the receiver axis
+        n_paths = np.diff(paths.ray_offsets)[receiver_idx]
+        ray_receiver = np.repeat(np.arange(len(receiver_idx)), n_paths)
+        first_ray = np.cumsum(n_paths) - n_paths
+        rays = (np.arange(len(ray_receiver)) - np.repeat(first_ray, n_paths) +
+                np.repeat(paths.ray_offsets[receiver_idx], n_paths))
+        if self.sort_by_power:
+            order = np.lexsort((-paths.srcvdpower[rays], ray_receiver))
+            rays = rays[order]
+        ray_slot = np.arange(len(rays)) - np.repeat(first_ray, n_paths)
+        keep = ray_slot < self.max_rays
+        rays, ray_receiver, ray_slot = rays[keep], ray_receiver[keep], ray_slot[keep]
+        values = self.ray_values(paths)[rays]
+
+        if isinstance(self.rays, np.ndarray):
+            scene_rays = self.rays[episode, scene]
+            scene_mask = self.mask[episode, scene]
+            scene_rays[:] = 0
+            scene_mask[:] = False
+            scene_rays[ray_receiver, ray_slot] = values
+            scene_mask[ray_receiver, ray_slot] = True
+        else:
+            # datasets without fancy indexing, write the whole scene at once
+            scene_rays = np.zeros(self.shape[2:] + (self.max_rays, self.n_channels), dtype=self.dtype)
+            scene_mask = np.zeros(self.shape[2:] + (self.max_rays,), dtype=bool)
+            scene_rays[ray_receiver, ray_slot] = values
+            scene_mask[ray_receiver, ray_slot] = True
+            self.rays[episode, scene] = scene_rays
+            self.mask[episode, scene] = scene_mask
+
+    def save_npz(self, filename, compressed=False):
+        """Write rays and mask to a npz file, numpy streams them without copying"""
+        save = np.savez_compressed if compressed else np.savez
+        save(filename, rays=self.rays, mask=self.mask)
+
+
+def build_ray_tensor(paths, max_rays, **kwargs):
+    """Build the (rays, mask) arrays from paths[episode][scene], a nested
+    sequence of P2mPaths with the same number of scenes per episode.
+    kwargs are the ones of RayTensorBuilder."""
+    n_receivers = max(p.n_receivers for episode in paths for p in episode)
+    builder = RayTensorBuilder((len(paths), len(paths[0]), n_receivers), max_rays, **kwargs)
+    for episode, scenes in enumerate(paths):
+        for scene, scene_paths in enumerate(scenes):
+            builder.add(episode, scene, scene_paths)
+    return builder.rays, builder.mask
@@ -0,0 +1,219 @@
+"""Index of the vehicles of the episodes of a vehicular study
+
+> index = EpisodeIndex.build('results', episode_of=lambda run: divmod(run, 50))
+> index.save('episodes.json')
+> index = EpisodeIndex.load('episodes.json')
+> index.lookup(0, 3, 'car1')  # receiver and files of car1 in scene 3 of episode 0
+> for scene, rays in index.iter_vehicle(0, 'car1'):  # the next scenes parse meanwhile
+>     rays['srcvdpower']
+
+Each run directory holds a scene, and episode_of maps the run to its
+(episode, scene), one episode by default. The run is the number of the
+runXXXXX directory of the files, or their directory relative to the root
+(a str) when they are not inside one, as in find_study_files. The vehicles of a scene are
+the ones of the first time of the positions file of its run. Unless
+receiver_of tells it, the receiver of a vehicle is the receiver of the
+paths file closest to it in the x, y plane, within max_distance meters:
+the antennas are on top of the vehicles.
+
+The mapping is built once, from the positions files and the receiver
+positions, and stored as json. Lookups are dictionary accesses; the
+parsers of the scenes are kept in a small cache and those of the next
+scenes of a vehicle are parsed in a pool of threads while the current
+one is used.
+"""
+import os
+import json
+import warnings
+import collections
+import concurrent.futures
+
+import numpy as np
+
+from .formats import FORMATS
+from .study import find_study_files
+from .spatial import receiver_positions
+from .util import replace_atomically
+
+INDEX_VERSION = 1
+
+
+def _one_episode(run):
+    return 0, run
+
+
+def _match_receivers(positions, paths, max_distance):
+    """The receiver of paths nearest to each vehicle position in x, y, None
+    if it is further than max_distance"""
+    receivers = receiver_positions(paths)
+    has_rays = ~np.isnan(receivers).any(axis=1)
+    if not has_rays.any():
+        return [None] * len(positions)
+    distances = np.linalg.norm(positions[:, np.newaxis, :2] - receivers[np.newaxis, has_rays, :2], axis=2)
+    nearest = distances.argmin(axis=1)
+    ids = paths.receiver_ids[has_rays][nearest]
+    return [int(receiver) if distance <= max_distance else None
+            for receiver, distance in zip(ids.tolist(), distances[np.arange(len(nearest)), nearest].tolist())]
+
+
+class EpisodeIndex:
+    """Mapping (episode, scene, vehicle) -> receiver id and files
+
+    entries are dicts with episode, scene, vehicle, run, receiver and files
+    (file type -> path relative to root). Use build or load to create one.
+    cache_size parsers are kept, prefetch scenes ahead are parsed by
+    workers threads.
+    """
+
+    def __init__(self, root, entries, cache_size=8, prefetch=2, workers=2):
+        self.root = root
+        self.entries = list(entries)
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self.workers = workers
+        self._by_key = {}
+        scenes = collections.defaultdict(list)
+        for entry in self.entries:
+            self._by_key[(entry['episode'], entry['scene'], entry['vehicle'])] = entry
+            scenes[(entry['episode'], entry['vehicle'])].append(entry)
+        self._scenes = {key: sorted(found, key=lambda entry: entry['scene'])
+                        for key, found in scenes.items()}
+        self._executor = None
+        # (run, file type) -> future of its parser, in use order
+        self._parsers = collections.OrderedDict()
+
+    @classmethod
+    def build(cls, root, episode_of=None, types=('paths', 'cir'), sets=None, receiver_of=None,
+              max_distance=2.0, **kwargs):
+        """Index the study under root
+
+        sets is the (transmitter, transmitter_set, receiver_set) of the
+        files to use, the first with a paths file in each run if None. The
+        positions file of a run is its first one, whatever its sets. Runs
+        without positions or paths file are skipped with a warning.
+        episode_of(run) returns the (episode, scene) of a run. receiver_of(run,
+        positions, vehicles, paths), if given, returns the receiver id of
+        each vehicle (or None) instead of matching their positions.
+        """
+        episode_of = episode_of or _one_episode
+        # run -> file sets -> file type -> path relative to root
+        found = collections.OrderedDict()
+        positions_files = {}
+        for key, file_type, filename in find_study_files(root, ('positions', 'paths') + tuple(types)):
+            run, file_sets = key[0], key[1:]
+            if file_type == 'positions':
+                # the vehicles move the same whatever the transmitter and receiver sets
+                positions_files.setdefault(run, os.path.relpath(filename, root))
+                continue
+            if sets is not None and file_sets != tuple(sets):
+                continue
+            files = found.setdefault(run, collections.OrderedDict()).setdefault(file_sets, {})
+            files.setdefault(file_type, os.path.relpath(filename, root))
+        for run in positions_files:
+            found.setdefault(run, collections.OrderedDict())
+        runs = collections.OrderedDict()
+        for run, by_sets in found.items():
+            with_paths = [files for files in by_sets.values() if 'paths' in files]
+            if not with_paths:
+                warnings.warn('run {} has no paths file, it is not indexed'.format(run))
+            elif run not in positions_files:
+                warnings.warn('run {} has no positions file, it is not indexed'.format(run))
+            else:
+                runs[run] = dict(with_paths[0], positions=positions_files[run])
+        entries = []
+        for run, files in runs.items():
+            positions_file = FORMATS['positions'](os.path.join(root, files['positions']))
+            if positions_file.n_receivers == 0:
+                continue
+            time = int(positions_file.times[0])
+            vehicles = positions_file.get_vehicle_names(time)
+            positions = positions_file.get_positions_ndarray(time)
+            paths = FORMATS['paths'](os.path.join(root, files['paths']))
+            if receiver_of is None:
+                receivers = _match_receivers(positions, paths, max_distance)
+            else:
+                receivers = receiver_of(run, positions, vehicles, paths)
+            episode, scene = episode_of(run)
+            linked = collections.OrderedDict((file_type, files[file_type])
+                                             for file_type in ('paths',) + tuple(types) if file_type in files)
+            for vehicle, receiver in zip(vehicles, receivers):
+                if receiver is None:
+                    continue
+                entries.append(collections.OrderedDict([
+                    ('episode', episode), ('scene', scene), ('vehicle', vehicle), ('run', run),
+                    ('receiver', int(receiver)), ('files', linked)]))
+        return cls(root, entries, **kwargs)
+
+    def save(self, filename):
+        def write(tmp):
+            with open(tmp, 'w') as file:
+                json.dump({'version': INDEX_VERSION, 'root': os.path.abspath(self.root),
+                           'entries': self.entries}, file, indent=1)
+        replace_atomically(os.path.abspath(filename), write)
+
+    @classmethod
+    def load(cls, filename, root=None, **kwargs):
+        """Load a saved index, root overrides the saved one if the study moved"""
+        with open(filename) as file:
+            saved = json.load(file)
+        if saved.get('version') != INDEX_VERSION:
+            raise ValueError('{} has index version {}, expected {}'.format(
+                filename, saved.get('version'), INDEX_VERSION))
+        for entry in saved['entries']:
+            entry['files'] = collections.OrderedDict(entry['files'])
+        return cls(root or saved['root'], saved['entries'], **kwargs)
+
+    def lookup(self, episode, scene, vehicle):
+        """The entry of vehicle in a scene, KeyError if it is not there"""
+        return self._by_key[(episode, scene, vehicle)]
+
+    def episodes(self):
+        return sorted(set(entry['episode'] for entry in self.entries))
+
+    def vehicles(self, episode):
+        return sorted(set(vehicle for e, vehicle in self._scenes if e == episode))
+
+    def scenes(self, episode, vehicle):
+        """The entries of vehicle in the scenes of episode, in scene order"""
+        return self._scenes.get((episode, vehicle), [])
+
+    def _submit(self, entry, file_type):
+        key = (entry['run'], file_type)
+        if key in self._parsers:
+            self._parsers.move_to_end(key)
+            return self._parsers[key]
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self._parsers[key] = self._executor.submit(
+            FORMATS[file_type], os.path.join(self.root, entry['files'][file_type]))
+        while len(self._parsers) > self.cache_size:
+            self._parsers.popitem(last=False)
+        return self._parsers[key]
+
+    def parser(self, entry, file_type='paths'):
+        """The parser of the file_type file of the scene of entry"""
+        return self._submit(entry, file_type).result()
+
+    def iter_vehicle(self, episode, vehicle, file_type='paths'):
+        """Yield (scene, arrays) of the receiver of vehicle in each scene of
+        episode, in order, the arrays are as get_receiver_arrays"""
+        entries = self.scenes(episode, vehicle)
+        for i, entry in enumerate(entries):
+            if file_type not in entry['files']:
+                continue
+            current = self._submit(entry, file_type)
+            for upcoming in entries[i + 1:i + 1 + self.prefetch]:
+                if file_type in upcoming['files']:
+                    self._submit(upcoming, file_type)
+            yield entry['scene'], current.result().get_receiver_arrays(entry['receiver'])
+
+    def vehicle_rays(self, episode, vehicle, file_type='paths'):
+        """The list of the (scene, arrays) of iter_vehicle"""
+        return list(self.iter_vehicle(episode, vehicle, file_type))
+
+    def close(self):
+        """Stop the prefetching threads and drop the cached parsers"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._parsers.clear()
@@ -0,0 +1,82 @@
+"""Registry of the p2m formats and a factory parsing any of them
+
+> paths = open_p2m('model.paths.t001_01.r002.p2m')  # a P2mPaths
+> open_p2m('renamed.p2m')  # the format is told by the content
+
+Every format is a P2mFileParser subclass sharing the same core: the file
+is read at once, the comments removed and the numeric values converted in
+bulk, only the layout of the records (_parse_body) changes. InSite 3.2
+and 3.3 paths files are both handled by P2mPaths, which tells them apart
+by the number of values of their ray lines.
+"""
+import os
+import re
+import collections
+
+from .p2mdoa import P2mFileParser, ParsingError, P2MDoA, P2MDoD
+from .p2mpaths import P2mPaths
+from .p2mcir import P2mCir
+from .p2mpositions import P2mPositions
+
+FORMATS = collections.OrderedDict([
+    ('paths', P2mPaths),
+    ('cir', P2mCir),
+    ('doa', P2MDoA),
+    ('dod', P2MDoD),
+    ('positions', P2mPositions),
+])
+
+# enough of a file to see its first records
+_SNIFF_BYTES = 2**16
+
+
+def register_format(file_type, parser_class):
+    """Make parser_class, a P2mFileParser subclass, the parser of file_type"""
+    FORMATS[file_type] = parser_class
+
+
+def parser_class_of(name):
+    """The registered parser class whose class name is name"""
+    for parser_class in FORMATS.values():
+        if parser_class.__name__ == name:
+            return parser_class
+    raise KeyError(name)
+
+
+def sniff_format(text):
+    """Tell the format of a p2m file from its first bytes
+
+    Positions files have one value per header line, paths files have
+    interactions lists and cir files have the arrival time, in seconds, as
+    their third value where doa files have an elevation in degrees. dod
+    files look like doa files and are reported as such.
+    """
+    # the comments hold the name of the receiver set, which may look like anything
+    body = P2mFileParser._strip_comments(text)
+    lines = [line.split() for line in body.split(b'\n')]
+    lines = [line for line in lines if line]
+    if len(lines) < 2:
+        raise ParsingError('Cannot tell the format of a file of {} lines'.format(len(lines)))
+    if len(lines[1]) == 1:
+        return 'positions'
+    if re.search(rb'Tx\S*Rx', body):
+        return 'paths'
+    for header, row in zip(lines[1:], lines[2:]):
+        if len(header) == 2 and int(header[1]) > 0 and len(row) == 4:
+            return 'cir' if abs(float(row[2])) < 1e-2 else 'doa'
+    raise ParsingError('Cannot tell the format, no path found in the first {} bytes'.format(len(text)))
+
+
+def detect_format(filename):
+    """The format of filename, from its name if InSite named it, else from its content"""
+    match = re.match(P2mFileParser._filename_match_re, os.path.basename(filename))
+    if match is not None and match.group('type') in FORMATS:
+        return match.group('type')
+    with open(filename, 'rb') as file:
+        return sniff_format(file.read(_SNIFF_BYTES))
+
+
+def open_p2m(filename, cache=None, dtype=None, recover=False):
+    """Parse filename with the parser of its format, cache, dtype and
+    recover as in P2mFileParser"""
+    return FORMATS[detect_format(filename)](filename, cache=cache, dtype=dtype, recover=recover)
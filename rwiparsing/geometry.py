@@ -0,0 +1,207 @@
+"""Geometry of the rays of a paths file, computed on all the rays at once
+
+> paths = P2mPaths('model.paths.t001_01.r002.p2m')
+> lengths = path_lengths(paths)  # meters, one per ray
+> rays = rays_bouncing_in(paths, (0, 0, 0), (50, 20, 10), code='R')
+> write_geojson(paths, 'rays.geojson', rays=rays)
+
+The points of a ray are its Tx, interaction and Rx coordinates,
+paths.points[paths.point_offsets[ray]:paths.point_offsets[ray + 1]], and
+its segments join consecutive points. The bounces are the points between
+the Tx and the Rx, with the interaction code of each (R, D, T...).
+"""
+import json
+import collections
+
+import numpy as np
+
+
+def _point_rays(paths):
+    """Ray of each point"""
+    return np.repeat(np.arange(len(paths.point_offsets) - 1), np.diff(paths.point_offsets))
+
+
+def _selected(paths, rays):
+    """Indices of the rays selected by rays: None for all of them, a boolean
+    mask or indices"""
+    n_rays = len(paths.point_offsets) - 1
+    if rays is None:
+        return np.arange(n_rays)
+    rays = np.asarray(rays)
+    if rays.dtype == bool:
+        return np.flatnonzero(rays)
+    return rays.astype(np.int64)
+
+
+def ray_receivers(paths):
+    """Receiver id of each ray"""
+    return np.repeat(paths.receiver_ids, np.diff(paths.ray_offsets))
+
+
+def segment_offsets(paths):
+    """Offsets of the segments of each ray, as point_offsets: a ray of n
+    points has n - 1 segments"""
+    return paths.point_offsets - np.arange(len(paths.point_offsets))
+
+
+def segments(paths):
+    """Start and end points of all the segments, two (n_segments, 3) arrays"""
+    # a segment starts at every point but the last of its ray
+    last = np.zeros((len(paths.points),), dtype=bool)
+    last[paths.point_offsets[1:][np.diff(paths.point_offsets) > 0] - 1] = True
+    starts = np.flatnonzero(~last)
+    return paths.points[starts], paths.points[starts + 1]
+
+
+def segment_lengths(paths):
+    """Length of each segment, ordered as segment_offsets"""
+    start, end = segments(paths)
+    return np.linalg.norm(end - start, axis=1)
+
+
+def path_lengths(paths):
+    """Total length of each ray, from the Tx to the Rx"""
+    lengths = segment_lengths(paths)
+    n_segments = np.diff(segment_offsets(paths))
+    return np.bincount(np.repeat(np.arange(len(n_segments)), n_segments), weights=lengths,
+                       minlength=len(n_segments))
+
+
+def bounce_points(paths):
+    """The interaction points, without the Tx and Rx
+
+    Return the (n_bounces, 3) points and their (n_rays + 1,) offsets.
+    """
+    n_points = np.diff(paths.point_offsets)
+    inner = np.ones((len(paths.points),), dtype=bool)
+    inner[paths.point_offsets[:-1][n_points > 0]] = False
+    inner[paths.point_offsets[1:][n_points > 0] - 1] = False
+    offsets = np.zeros_like(paths.point_offsets)
+    np.cumsum(np.maximum(n_points - 2, 0), out=offsets[1:])
+    return paths.points[inner], offsets
+
+
+def bounce_codes(paths):
+    """Interaction code (R, D, T...) of each bounce, ordered as bounce_points"""
+    table = paths.interactions
+    # the codes of each distinct sequence, then gathered for the rays
+    sequence_codes = [sequence.split('-')[1:-1] for sequence in table.sequences]
+    sequence_offsets = np.zeros((len(sequence_codes) + 1,), dtype=np.int64)
+    np.cumsum([len(codes) for codes in sequence_codes], out=sequence_offsets[1:])
+    flat = np.array([code for codes in sequence_codes for code in codes], dtype=object)
+    n_bounces = np.diff(sequence_offsets)[table.ids]
+    first = np.repeat(sequence_offsets[table.ids], n_bounces)
+    offsets = np.zeros((len(n_bounces) + 1,), dtype=np.int64)
+    np.cumsum(n_bounces, out=offsets[1:])
+    return flat[first + np.arange(offsets[-1]) - np.repeat(offsets[:-1], n_bounces)]
+
+
+def bounding_boxes(paths):
+    """(n_rays, 3) lower and upper corners of the box holding each ray, NaN
+    for the rays without points"""
+    n_points = np.diff(paths.point_offsets)
+    lower = np.full((len(n_points), 3), np.nan)
+    upper = np.full((len(n_points), 3), np.nan)
+    has_points = n_points > 0
+    if has_points.any():
+        starts = paths.point_offsets[:-1][has_points]
+        lower[has_points] = np.minimum.reduceat(paths.points, starts)
+        upper[has_points] = np.maximum.reduceat(paths.points, starts)
+    return lower, upper
+
+
+def in_box(points, lower, upper):
+    """Tell the points inside the box of corners lower and upper, borders included"""
+    return np.all((points >= np.asarray(lower)) & (points <= np.asarray(upper)), axis=-1)
+
+
+def rays_bouncing_in(paths, lower, upper, code=None):
+    """Boolean mask of the rays with an interaction (of the given code, any
+    if None) inside the box of corners lower and upper"""
+    points, offsets = bounce_points(paths)
+    inside = in_box(points, lower, upper)
+    if code is not None:
+        inside &= bounce_codes(paths) == code
+    n_bounces = np.diff(offsets)
+    return np.bincount(np.repeat(np.arange(len(n_bounces)), n_bounces), weights=inside,
+                       minlength=len(n_bounces)) > 0
+
+
+def rays_crossing_box(paths, lower, upper):
+    """Boolean mask of the rays with a point, Tx and Rx included, inside the box"""
+    inside = in_box(paths.points, lower, upper)
+    return np.bincount(_point_rays(paths), weights=inside, minlength=len(paths.point_offsets) - 1) > 0
+
+
+def _ray_segments(paths, rays):
+    """Ray, index in its ray, start and end of the segments of the selected rays"""
+    offsets = segment_offsets(paths)
+    n_segments = np.diff(offsets)[rays]
+    segment_ray = np.repeat(rays, n_segments)
+    index = np.arange(n_segments.sum()) - np.repeat(np.cumsum(n_segments) - n_segments, n_segments)
+    start = paths.point_offsets[segment_ray] + index
+    return segment_ray, index, paths.points[start], paths.points[start + 1]
+
+
+def write_segments_csv(paths, filename, rays=None):
+    """Write one line per segment: receiver, ray_n, segment, the start and
+    end coordinates and the length"""
+    rays = _selected(paths, rays)
+    segment_ray, index, start, end = _ray_segments(paths, rays)
+    columns = np.column_stack((ray_receivers(paths)[segment_ray], paths.ray_n[segment_ray], index,
+                               start, end, np.linalg.norm(end - start, axis=1)))
+    np.savetxt(filename, columns, delimiter=',', comments='',
+               fmt=['%d', '%d', '%d'] + ['%.6f'] * 7,
+               header='receiver,ray_n,segment,x0,y0,z0,x1,y1,z1,length')
+
+
+def write_ply(paths, filename, rays=None):
+    """Write the points of the rays as the vertices of an ascii PLY file and
+    their segments as edges, with the receiver and ray number of each edge"""
+    rays = _selected(paths, rays)
+    n_points = np.diff(paths.point_offsets)[rays]
+    first = np.repeat(paths.point_offsets[rays], n_points)
+    vertex_offsets = np.cumsum(n_points) - n_points
+    vertices = paths.points[first + np.arange(n_points.sum()) - np.repeat(vertex_offsets, n_points)]
+    segment_ray, index, _, _ = _ray_segments(paths, rays)
+    # the segments of each ray join its consecutive vertices
+    position = np.repeat(np.arange(len(rays)), np.maximum(n_points - 1, 0))
+    vertex1 = vertex_offsets[position] + index
+    edges = np.column_stack((vertex1, vertex1 + 1, ray_receivers(paths)[segment_ray],
+                             paths.ray_n[segment_ray]))
+    with open(filename, 'wb') as file:
+        file.write('\n'.join([
+            'ply', 'format ascii 1.0',
+            'element vertex {}'.format(len(vertices)),
+            'property double x', 'property double y', 'property double z',
+            'element edge {}'.format(len(edges)),
+            'property int vertex1', 'property int vertex2',
+            'property int receiver', 'property int ray_n',
+            'end_header', '']).encode())
+        np.savetxt(file, vertices, fmt='%.6f')
+        np.savetxt(file, edges, fmt='%d')
+
+
+def write_geojson(paths, filename, rays=None):
+    """Write a GeoJSON FeatureCollection of one LineString per ray, with its
+    receiver, ray number, interactions and length as properties
+
+    The coordinates are the ones of the paths file, in the local frame of
+    the InSite study, not longitude and latitude.
+    """
+    rays = _selected(paths, rays)
+    points = paths.points.tolist()
+    offsets = paths.point_offsets.tolist()
+    receivers = ray_receivers(paths)[rays].tolist()
+    ray_n = paths.ray_n[rays].tolist()
+    interactions = paths.interactions[rays].strings().tolist()
+    lengths = path_lengths(paths)[rays].tolist()
+    features = [collections.OrderedDict([
+        ('type', 'Feature'),
+        ('geometry', {'type': 'LineString', 'coordinates': points[offsets[ray]:offsets[ray + 1]]}),
+        ('properties', collections.OrderedDict([
+            ('receiver', receiver), ('ray_n', number), ('interactions', sequence), ('length', length)])),
+    ]) for ray, receiver, number, sequence, length in zip(rays.tolist(), receivers, ray_n,
+                                                          interactions, lengths)]
+    with open(filename, 'w') as file:
+        json.dump({'type': 'FeatureCollection', 'features': features}, file)
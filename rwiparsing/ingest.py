@@ -0,0 +1,246 @@
+"""Incremental ingestion of the p2m files of a study while it runs
+
+> ingestor = StudyIngestor('results', 'dataset', types=('paths', 'cir'))
+> ingestor.watch(interval=30)  # until interrupted
+> load_dataset('dataset')[(0, 1, 1, 2)]['paths'].get_p_gain_ndarray(1)
+
+or from the command line: python -m rwiparsing.ingest results dataset
+
+Each poll looks for the files of the study that are new or changed since
+they were ingested (by size and modification time) and were not modified
+in the last settle_seconds, which would mean InSite is still writing
+them. Only those are parsed. Each one is stored in the dataset directory
+as a p2mbin file (see p2mbin) at the same relative path as its source,
+and the manifest (dataset/manifest.json) lists the ingested files and the
+ones that failed to parse, which are not parsed again until they change,
+also after a restart. It is
+rewritten every manifest_seconds during a poll, and when the poll ends or
+is interrupted, so a long first poll shows its progress. The p2mbin
+files and the manifest are written aside and renamed, so a reader or a
+crash never sees a partial file. A restart reads the manifest and parses
+nothing that was already ingested.
+"""
+import os
+import json
+import time
+import collections
+import concurrent.futures
+
+from .p2mbin import write_p2mbin, open_p2mbin
+from .study import find_study_files
+from .util import parse_file, replace_atomically
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def _read(dataset):
+    try:
+        with open(os.path.join(dataset, MANIFEST)) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return {'files': [], 'failed': []}
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError('{} has manifest version {}, expected {}'.format(
+            dataset, manifest.get('version'), MANIFEST_VERSION))
+    return manifest
+
+
+def read_manifest(dataset):
+    """Return the entries of the manifest of dataset, an OrderedDict indexed
+    by the path of the sources relative to the study root, empty if there is
+    no manifest yet"""
+    return collections.OrderedDict((entry['source'], entry) for entry in _read(dataset)['files'])
+
+
+def read_failures(dataset):
+    """Return the records of the files of the manifest of dataset that
+    failed to parse, an OrderedDict indexed as read_manifest"""
+    # the manifests written before failures were recorded have none
+    return collections.OrderedDict((record['source'], record) for record in _read(dataset).get('failed', []))
+
+
+def write_manifest(dataset, entries, failed=None):
+    def write(tmp):
+        with open(tmp, 'w') as file:
+            json.dump({'version': MANIFEST_VERSION, 'files': list(entries.values()),
+                       'failed': list((failed or {}).values())}, file, indent=1)
+    replace_atomically(os.path.join(dataset, MANIFEST), write)
+
+
+def load_dataset(dataset, types=None):
+    """Open the ingested files of dataset as memory mapped parsers
+
+    Return an OrderedDict indexed by (run, transmitter, transmitter_set,
+    receiver_set) mapping the file type to its parser, as load_study.
+    """
+    loaded = collections.OrderedDict()
+    for entry in read_manifest(dataset).values():
+        if types is not None and entry['type'] not in types:
+            continue
+        key = tuple(entry['key'])
+        loaded.setdefault(key, collections.OrderedDict())[entry['type']] = open_p2mbin(
+            os.path.join(dataset, entry['data']))
+    return loaded
+
+
+class StudyIngestor:
+    """Ingest the p2m files of the given types under root into dataset
+
+    workers and cache are as in load_study. Files that fail to parse,
+    whatever the error, are recorded in failed (source -> record with the
+    key, type, size, mtime_ns, error class name and message) and in the
+    manifest, they are retried once they change.
+    """
+
+    def __init__(self, root, dataset, types=('paths', 'cir', 'doa'), settle_seconds=10,
+                 workers=1, cache=None, manifest_seconds=10):
+        self.root = os.path.abspath(root)
+        self.dataset = os.path.abspath(dataset)
+        self.types = tuple(types)
+        self.settle_seconds = settle_seconds
+        self.workers = workers
+        self.cache = cache
+        self.manifest_seconds = manifest_seconds
+        os.makedirs(self.dataset, exist_ok=True)
+        self.entries = read_manifest(self.dataset)
+        self.failed = read_failures(self.dataset)
+
+    def pending(self):
+        """Return the (key, type, filename, stat) of the files to ingest"""
+        now = time.time()
+        pending = []
+        for key, file_type, filename in find_study_files(self.root, self.types):
+            source = os.path.relpath(filename, self.root)
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                # removed since it was listed
+                continue
+            fingerprint = (stat.st_size, stat.st_mtime_ns)
+            entry = self.entries.get(source)
+            if entry is not None and (entry['size'], entry['mtime_ns']) == fingerprint:
+                continue
+            failure = self.failed.get(source)
+            if failure is not None and (failure['size'], failure['mtime_ns']) == fingerprint:
+                continue
+            if now - stat.st_mtime < self.settle_seconds:
+                continue
+            pending.append((key, file_type, filename, stat))
+        return pending
+
+    def _parse_all(self, pending):
+        """Parse the pending files, yield the parser or the exception of each"""
+        if self.workers == 1 or len(pending) <= 1:
+            for _, file_type, filename, _ in pending:
+                try:
+                    yield parse_file(file_type, filename, self.cache)
+                except Exception as error:
+                    yield error
+            return
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(parse_file, file_type, filename, self.cache)
+                       for _, file_type, filename, _ in pending]
+            for future in futures:
+                try:
+                    yield future.result()
+                except Exception as error:
+                    yield error
+
+    def ingest(self):
+        """Ingest the pending files and return their new manifest entries"""
+        pending = self.pending()
+        ingested = []
+        # pending files done, and when the manifest was last written
+        done = saved = 0
+        written = time.monotonic()
+        try:
+            for (key, file_type, filename, stat), parser in zip(pending, self._parse_all(pending)):
+                source = os.path.relpath(filename, self.root)
+                done += 1
+                self.failed.pop(source, None)
+                if isinstance(parser, Exception):
+                    self.failed[source] = collections.OrderedDict([
+                        ('source', source),
+                        ('key', list(key)),
+                        ('type', file_type),
+                        ('size', stat.st_size),
+                        ('mtime_ns', stat.st_mtime_ns),
+                        ('error', type(parser).__name__),
+                        ('message', str(parser)),
+                        ('failed', time.time()),
+                    ])
+                else:
+                    ingested.append(self._store(key, file_type, source, stat, parser))
+                if time.monotonic() - written >= self.manifest_seconds:
+                    write_manifest(self.dataset, self.entries, self.failed)
+                    saved = done
+                    written = time.monotonic()
+        finally:
+            # also when interrupted, a restart does not parse these files again
+            if saved < done:
+                write_manifest(self.dataset, self.entries, self.failed)
+        return ingested
+
+    def _store(self, key, file_type, source, stat, parser):
+        """Write the p2mbin file of parser and return its manifest entry"""
+        data = source + 'bin'
+        replace_atomically(os.path.join(self.dataset, data),
+                           lambda tmp: write_p2mbin(parser, tmp))
+        entry = collections.OrderedDict([
+            ('source', source),
+            ('key', list(key)),
+            ('type', file_type),
+            ('parser', type(parser).__name__),
+            ('data', data),
+            ('size', stat.st_size),
+            ('mtime_ns', stat.st_mtime_ns),
+            ('n_receivers', int(parser.n_receivers)),
+            ('n_rays', int(parser.ray_offsets[-1])),
+            ('ingested', time.time()),
+        ])
+        # a changed file replaces its previous entry
+        self.entries.pop(source, None)
+        self.entries[source] = entry
+        return entry
+
+    def watch(self, interval=30, callback=None, max_polls=None):
+        """Ingest every interval seconds, calling callback(entries) after
+        each poll, max_polls times or forever if None"""
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            entries = self.ingest()
+            if callback is not None:
+                callback(entries)
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(interval)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Ingest the p2m files of a running study')
+    parser.add_argument('root', help='root of the study, holding the runXXXXX directories')
+    parser.add_argument('dataset', help='directory of the ingested files and manifest')
+    parser.add_argument('--types', nargs='+', default=['paths', 'cir', 'doa'])
+    parser.add_argument('--interval', type=float, default=30, help='seconds between polls')
+    parser.add_argument('--settle', type=float, default=10,
+                        help='seconds a file must be left unmodified before it is ingested')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--manifest-seconds', type=float, default=10,
+                        help='seconds between the updates of the manifest during a poll')
+    parser.add_argument('--once', action='store_true', help='ingest the pending files and exit')
+    args = parser.parse_args()
+
+    ingestor = StudyIngestor(args.root, args.dataset, args.types, args.settle, args.workers,
+                             manifest_seconds=args.manifest_seconds)
+    reported = set()
+
+    def report(entries):
+        for entry in entries:
+            print('ingested {source} ({n_receivers} receivers, {n_rays} rays)'.format(**entry))
+        for source, failure in ingestor.failed.items():
+            if (source, failure['size'], failure['mtime_ns']) not in reported:
+                reported.add((source, failure['size'], failure['mtime_ns']))
+                print('failed {}: {}'.format(source, failure['message']))
+    ingestor.watch(args.interval, report, max_polls=1 if args.once else None)
@@ -0,0 +1,111 @@
+"""Interaction sequences of the rays as a compact code table
+
+A paths file has few distinct interactions lists (Tx-Rx, Tx-R-Rx,
+Tx-R-D-Rx...) shared by many rays. InteractionTable keeps each distinct
+list once, with the number of interactions of each type it has, and each
+ray as the index of its list. The queries are then array operations on
+the rays of a receiver, a file or a whole campaign:
+
+> paths = P2mPaths('model.paths.t001_01.r002.p2m')
+> paths.interactions.los()                      # LOS mask of all the rays
+> paths.interactions.count('R') <= 2            # at most two reflections
+> paths.interactions.contains('F')              # through foliage
+> paths.interactions.matches('Tx-R-R-Rx')
+> InteractionTable.concatenate([p.interactions for p in files]).los()
+
+InSite codes the interactions as R (reflection), D and d (diffraction),
+DS (diffuse scattering), T (transmission), F (foliage) and X. The codes
+of a table are the ones found in its sequences, compared case-sensitively.
+"""
+import numpy as np
+
+
+class InteractionTable:
+    """Interactions of a set of rays
+
+    sequences are the distinct interactions lists, such as 'Tx-R-Rx', and
+    ids the index in sequences of the list of each ray. codes are the
+    interaction types found in sequences and counts[s, c] the number of
+    interactions of type codes[c] of the list sequences[s].
+    """
+
+    def __init__(self, sequences, ids):
+        self.sequences = np.asarray(sequences, dtype=object)
+        self.ids = np.asarray(ids, dtype=np.int32)
+        split = [sequence.split('-')[1:-1] for sequence in self.sequences.tolist()]
+        self.codes = tuple(sorted(set(code for interactions in split for code in interactions)))
+        code_index = {code: i for i, code in enumerate(self.codes)}
+        self.counts = np.zeros((len(self.sequences), len(self.codes)), dtype=np.int16)
+        for s, interactions in enumerate(split):
+            for code in interactions:
+                self.counts[s, code_index[code]] += 1
+
+    @classmethod
+    def from_strings(cls, strings):
+        """Intern the interactions list of each ray, str or bytes"""
+        # the distinct strings in order of appearance, then their index
+        table = dict.fromkeys(strings)
+        for i, s in enumerate(table):
+            table[s] = i
+        ids = np.fromiter(map(table.__getitem__, strings), dtype=np.int32, count=len(strings))
+        return cls([s.decode() if isinstance(s, bytes) else s for s in table], ids)
+
+    @classmethod
+    def concatenate(cls, tables):
+        """One table for the rays of several tables, in order"""
+        table = {}
+        ids = []
+        for other in tables:
+            remap = np.array([table.setdefault(s, len(table)) for s in other.sequences.tolist()],
+                             dtype=np.int32)
+            ids.append(remap[other.ids])
+        return cls(list(table), np.concatenate(ids) if ids else np.zeros((0,), dtype=np.int32))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, rays):
+        """The table of a subset of the rays, such as the slice of a receiver"""
+        subset = InteractionTable.__new__(InteractionTable)
+        subset.sequences = self.sequences
+        subset.codes = self.codes
+        subset.counts = self.counts
+        subset.ids = self.ids[rays]
+        return subset
+
+    def strings(self):
+        """The interactions list of each ray, as an object array of str"""
+        return self.sequences[self.ids]
+
+    def count(self, code=None):
+        """Number of interactions of type code of each ray, of any type if code is None"""
+        if code is None:
+            return self.counts.sum(axis=1, dtype=np.int32)[self.ids]
+        if code not in self.codes:
+            return np.zeros((len(self.ids),), dtype=np.int32)
+        return self.counts[:, self.codes.index(code)].astype(np.int32)[self.ids]
+
+    def los(self):
+        """Mask of the rays going straight from Tx to Rx"""
+        return self.count() == 0
+
+    def max_bounces(self, n, code=None):
+        """Mask of the rays with at most n interactions (of type code if given)"""
+        return self.count(code) <= n
+
+    def contains(self, code):
+        """Mask of the rays with at least one interaction of type code"""
+        return self.count(code) > 0
+
+    def only(self, codes):
+        """Mask of the rays whose interactions are all of the given types,
+        codes is a code or an iterable of codes"""
+        # 'DS' is one code, not the codes D and S
+        codes = {codes} if isinstance(codes, str) else set(codes)
+        other = [i for i, code in enumerate(self.codes) if code not in codes]
+        return (self.counts[:, other].sum(axis=1) == 0)[self.ids]
+
+    def matches(self, *sequences):
+        """Mask of the rays whose interactions list is one of sequences"""
+        wanted = np.isin(self.sequences, list(sequences))
+        return wanted[self.ids]
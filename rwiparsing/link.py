@@ -0,0 +1,242 @@
+"""The doa, dod, paths and cir files of one transmitter and receiver set, joined
+
+> link = P2mLink.from_directory('run00000/study', transmitter=1, transmitter_set=1, receiver_set=2)
+> link.receiver(1)['arrival_direction']  # as the doa file, parsed from the paths file
+> link.check(types=('paths', 'doa'))  # parses the doa file to compare it
+
+The paths file holds the angles of the doa and dod files and, from InSite
+3.3, the phase, arrival time and power of the cir file. P2mLink parses
+each file at most once, on first use, and does not parse the doa, dod and
+cir files when the paths file can stand in for them. The arrays of the
+rays are aligned: one row per ray of the group, in file order, with the
+receivers of receiver_ids and ray_offsets.
+"""
+import os
+import re
+import collections
+
+import numpy as np
+
+from .p2mdoa import P2mFileParser, ParsingError
+from .formats import FORMATS
+from .study import find_study_files
+
+LINK_TYPES = ('paths', 'cir', 'doa', 'dod')
+
+# per ray values of the link and the files providing them, best first
+_SOURCES = collections.OrderedDict([
+    ('ray_n', ('paths', 'cir', 'doa', 'dod')),
+    ('srcvdpower', ('paths', 'cir', 'doa', 'dod')),
+    ('arrival_time', ('paths', 'cir')),
+    ('phase', ('paths', 'cir')),
+    ('arrival_direction', ('paths', 'doa')),
+    ('departure_direction', ('paths', 'dod')),
+])
+
+# values written with few decimals: compared to atol, arrival times to rtol
+_ABSOLUTE = ('srcvdpower', 'phase', 'arrival_direction', 'departure_direction')
+
+
+def _directions(angles, power):
+    """(phi, theta, power) rows of the doa and dod files from the (theta, phi)
+    angles of the paths file"""
+    return np.column_stack((angles[:, 1], angles[:, 0], power))
+
+
+class P2mLink:
+    """The files of one (transmitter, transmitter_set, receiver_set)
+
+    filenames maps the file types (paths, cir, doa, dod) to their files,
+    cache and dtype are passed to the parsers.
+    """
+
+    def __init__(self, filenames, cache=None, dtype=None):
+        unknown = set(filenames) - set(LINK_TYPES)
+        if unknown:
+            raise ValueError('Unknown p2m types {}, expected some of {}'.format(
+                ', '.join(sorted(unknown)), ', '.join(LINK_TYPES)))
+        if not filenames:
+            raise ValueError('A link needs at least one file')
+        self.filenames = collections.OrderedDict(
+            (file_type, filenames[file_type]) for file_type in LINK_TYPES if file_type in filenames)
+        self.cache = cache
+        self.dtype = dtype
+        self._parsers = {}
+        self._arrays = {}
+
+    @classmethod
+    def from_directory(cls, directory, transmitter, transmitter_set, receiver_set,
+                       project=None, **kwargs):
+        """Link the files of directory named as InSite does for the given sets"""
+        filenames = {}
+        for filename in sorted(os.listdir(directory)):
+            match = re.match(P2mFileParser._filename_match_re, filename)
+            if (match is None or match.group('type') not in LINK_TYPES or
+                    (project is not None and match.group('project') != project)):
+                continue
+            if ((int(match.group('transmitter')), int(match.group('transmitter_set')),
+                 int(match.group('receiver_set'))) != (transmitter, transmitter_set, receiver_set)):
+                continue
+            if match.group('type') in filenames:
+                raise ValueError('Several {} files for t{:03d}_{:02d}.r{:03d} in {}, give the project'.format(
+                    match.group('type'), transmitter, transmitter_set, receiver_set, directory))
+            filenames[match.group('type')] = os.path.join(directory, filename)
+        if not filenames:
+            raise ValueError('No p2m file for t{:03d}_{:02d}.r{:03d} in {}'.format(
+                transmitter, transmitter_set, receiver_set, directory))
+        return cls(filenames, **kwargs)
+
+    @property
+    def types(self):
+        return tuple(self.filenames)
+
+    @property
+    def parsed(self):
+        """The types whose file was parsed so far"""
+        return tuple(file_type for file_type in self.filenames if file_type in self._parsers)
+
+    def parser(self, file_type):
+        """The parser of the file_type file, parsed on first use"""
+        if file_type not in self._parsers:
+            if file_type not in self.filenames:
+                raise KeyError('The link has no {} file'.format(file_type))
+            self._parsers[file_type] = FORMATS[file_type](
+                self.filenames[file_type], cache=self.cache, dtype=self.dtype)
+        return self._parsers[file_type]
+
+    def _source(self, name):
+        """The file type providing the per ray value name, None if none can"""
+        for file_type in _SOURCES[name]:
+            if file_type not in self.filenames:
+                continue
+            if name == 'phase' and file_type == 'paths' and not self.parser('paths').has_phase:
+                # InSite 3.2 paths files have no phase
+                continue
+            return file_type
+        return None
+
+    def _value(self, file_type, name):
+        """The per ray value name as read from the file_type file"""
+        parser = self.parser(file_type)
+        if name == 'ray_n':
+            return parser.path_n if file_type in ('doa', 'dod') else parser.ray_n
+        if file_type in ('doa', 'dod'):
+            if name == 'srcvdpower':
+                return parser.directions[:, 2]
+            return parser.directions
+        if name == 'arrival_direction':
+            return _directions(parser.arrival_angle, parser.srcvdpower)
+        if name == 'departure_direction':
+            return _directions(parser.departure_angle, parser.srcvdpower)
+        return getattr(parser, name)
+
+    def _first_parser(self):
+        return self.parser(next(iter(self.filenames)))
+
+    @property
+    def receiver_ids(self):
+        return self._first_parser().receiver_ids
+
+    @property
+    def ray_offsets(self):
+        return self._first_parser().ray_offsets
+
+    @property
+    def n_receivers(self):
+        return self._first_parser().n_receivers
+
+    def get(self, name):
+        """The per ray array name, one of ray_n, srcvdpower, arrival_time,
+        phase, arrival_direction and departure_direction, None if no file
+        of the link has it"""
+        if name not in _SOURCES:
+            raise KeyError('Unknown ray value {}, expected one of {}'.format(name, ', '.join(_SOURCES)))
+        if name not in self._arrays:
+            file_type = self._source(name)
+            self._arrays[name] = None if file_type is None else self._value(file_type, name)
+        return self._arrays[name]
+
+    def to_arrays(self):
+        """All the per ray arrays the files provide, with receiver_ids and ray_offsets"""
+        arrays = collections.OrderedDict([('receiver_ids', self.receiver_ids),
+                                          ('ray_offsets', self.ray_offsets)])
+        for name in _SOURCES:
+            value = self.get(name)
+            if value is not None:
+                arrays[name] = value
+        return arrays
+
+    def receiver(self, antenna_number):
+        """The per ray arrays of one receiver, empty arrays if it has no paths"""
+        idx = self._first_parser()._receiver_index[antenna_number]
+        rays = slice(self.ray_offsets[idx], self.ray_offsets[idx + 1])
+        return collections.OrderedDict((name, value[rays]) for name, value in self.to_arrays().items()
+                                       if name not in ('receiver_ids', 'ray_offsets'))
+
+    def _compare(self, reference, file_type, atol, rtol):
+        """The differences between two files, as check"""
+        first = self.parser(reference)
+        other = self.parser(file_type)
+        if (len(other.receiver_ids) != len(first.receiver_ids) or
+                np.any(other.receiver_ids != first.receiver_ids)):
+            return ['{} and {} have different receivers'.format(reference, file_type)]
+        differ = np.flatnonzero(np.diff(other.ray_offsets) != np.diff(first.ray_offsets))
+        if len(differ):
+            return ['{} receivers have a different number of rays in {} and {}, first {}'.format(
+                len(differ), reference, file_type, first.receiver_ids[differ[0]])]
+        problems = []
+        for name, sources in _SOURCES.items():
+            if reference not in sources or file_type not in sources:
+                continue
+            if name == 'phase' and not (getattr(first, 'has_phase', True) and
+                                        getattr(other, 'has_phase', True)):
+                continue
+            expected = self._value(reference, name)
+            value = self._value(file_type, name)
+            if name == 'ray_n':
+                bad = value != expected
+            elif name in _ABSOLUTE:
+                bad = ~np.isclose(value, expected, rtol=0, atol=atol)
+            else:
+                bad = ~np.isclose(value, expected, rtol=rtol, atol=0)
+            if bad.ndim > 1:
+                bad = bad.any(axis=1)
+            if bad.any():
+                ray = np.flatnonzero(bad)[0]
+                idx = np.searchsorted(first.ray_offsets, ray, side='right') - 1
+                problems.append('{} of {} rays differ between {} and {}, first ray {} of receiver {}'.format(
+                    name, int(bad.sum()), reference, file_type,
+                    self._value(reference, 'ray_n')[ray], first.receiver_ids[idx]))
+        return problems
+
+    def check(self, types=None, atol=1e-2, rtol=1e-4):
+        """Compare the files of the given types (all by default, parsing them)
+
+        The receivers, their number of rays and the rays numbers must be
+        the same, the values present in several files must be within atol
+        (degrees and dB, the files round them differently) and the arrival
+        times within rtol. Return the list of the differences found, empty
+        if the files agree.
+        """
+        types = [file_type for file_type in (types or self.filenames) if file_type in self.filenames]
+        problems = []
+        for file_type in types[1:]:
+            problems.extend(self._compare(types[0], file_type, atol, rtol))
+        return problems
+
+    def validate(self, types=None, **kwargs):
+        """Raise a ParsingError if check finds differences, return self"""
+        problems = self.check(types, **kwargs)
+        if problems:
+            raise ParsingError('Inconsistent files: ' + '; '.join(problems))
+        return self
+
+
+def find_links(root, types=LINK_TYPES, **kwargs):
+    """One P2mLink per (run, transmitter, transmitter_set, receiver_set) of
+    the study under root, as an OrderedDict indexed by that key"""
+    grouped = collections.OrderedDict()
+    for key, file_type, filename in find_study_files(root, types):
+        grouped.setdefault(key, {})[file_type] = filename
+    return collections.OrderedDict((key, P2mLink(filenames, **kwargs))
+                                   for key, filenames in grouped.items())
@@ -0,0 +1,107 @@
+"""Binary container for parsed p2m files, readable with numpy.memmap
+
+> write_p2mbin(P2mPaths('model.paths.t001_01.r002.p2m'), 'model.paths.t001_01.r002.p2mbin')
+> paths = open_p2mbin('model.paths.t001_01.r002.p2mbin')
+> paths.get_p_gain_ndarray(3)  # reads only the pages holding the rays of receiver 3
+
+Layout (all integers little-endian):
+
+    offset 0   magic b'P2MBIN\\0\\0'
+    offset 8   uint32 format version
+    offset 12  uint32 length of the header
+    offset 16  header, utf-8 json:
+               {"parser": "P2mPaths",
+                "scalars": {"n_receivers": 15, "project": "model", ...},
+                "arrays": [{"name": "srcvdpower", "dtype": "<f8",
+                            "shape": [361], "offset": 128}, ...]}
+    then the arrays, C-contiguous, each one starting at a multiple of
+    ALIGNMENT bytes from the beginning of the file (the "offset" above)
+
+The arrays are the ones of the parser's to_arrays(): receiver_ids and
+ray_offsets (receiver -> rays), one column per ray field and, for paths
+files, point_offsets (ray -> points), the (N, 3) points, the '\\n'
+separated distinct interactions lists as bytes and the index of the list
+of each ray. Version 1 files stored the interactions list of every ray
+and can still be read.
+"""
+import json
+import struct
+
+import numpy as np
+
+from .formats import parser_class_of
+
+MAGIC = b'P2MBIN\0\0'
+VERSION = 2
+ALIGNMENT = 64
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_p2mbin(parser, filename):
+    """Write the arrays of a parsed file, of any of the formats of formats.FORMATS"""
+    scalars = {}
+    arrays = []
+    for name, value in parser.to_arrays().items():
+        if value.ndim == 0:
+            scalars[name] = value.item()
+        else:
+            arrays.append((name, np.ascontiguousarray(value)))
+
+    # the offsets depend on the header length and the other way around,
+    # so lay the arrays out for a header length and grow it until it fits
+    header_length = 0
+    while True:
+        offset = _align(16 + header_length)
+        layout = []
+        for name, value in arrays:
+            layout.append({'name': name, 'dtype': value.dtype.str,
+                           'shape': list(value.shape), 'offset': offset})
+            offset = _align(offset + value.nbytes)
+        header = json.dumps({'parser': type(parser).__name__,
+                             'scalars': scalars,
+                             'arrays': layout}).encode()
+        if len(header) <= header_length:
+            break
+        header_length = len(header) + 256
+    header = header.ljust(header_length)
+
+    with open(filename, 'wb') as file:
+        file.write(MAGIC + struct.pack('<II', VERSION, header_length) + header)
+        for (_, value), block in zip(arrays, layout):
+            file.write(b'\0' * (block['offset'] - file.tell()))
+            file.write(value.data)
+
+
+def read_p2mbin_header(filename):
+    """Return the json header of a p2mbin file as a dict"""
+    with open(filename, 'rb') as file:
+        prefix = file.read(16)
+        if len(prefix) < 16 or prefix[:8] != MAGIC:
+            raise ValueError('{} is not a p2mbin file'.format(filename))
+        version, header_length = struct.unpack('<II', prefix[8:])
+        if version not in (1, VERSION):
+            raise ValueError('{} has p2mbin version {}, expected {}'.format(
+                filename, version, VERSION))
+        return json.loads(file.read(header_length).decode())
+
+
+def open_p2mbin(filename, mode='r'):
+    """Open a p2mbin file as a parser whose arrays are memory mapped
+
+    Nothing but the header is read here: the arrays are views of a
+    numpy.memmap of the file (mode as in numpy.memmap), pages are loaded
+    when they are accessed. The interactions lists of paths files are
+    the exception and are decoded when the file is opened.
+    """
+    header = read_p2mbin_header(filename)
+    mapped = np.memmap(filename, dtype=np.uint8, mode=mode)
+    arrays = {name: np.asarray(value) for name, value in header['scalars'].items()}
+    for block in header['arrays']:
+        dtype = np.dtype(block['dtype'])
+        n_bytes = dtype.itemsize * int(np.prod(block['shape']))
+        offset = block['offset']
+        arrays[block['name']] = mapped[offset:offset + n_bytes].view(dtype).reshape(block['shape'])
+    return parser_class_of(header['parser']).from_arrays(arrays)
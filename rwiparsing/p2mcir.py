@@ -7,33 +7,45 @@ from .p2mdoa import P2mFileParser
 class P2mCir(P2mFileParser):
     """Parse a p2m cir file"""
 
-    def _parse_receiver(self):
-        """Get receiver and number of paths (pair Tx-Rx)"""
-        line = self._get_next_line()
-        receiver, n_paths = [int(i) for i in line.split()]
-        self.data[receiver] = collections.OrderedDict()
-        self.data[receiver]['paths_number'] = n_paths
-        if n_paths == 0:
-            self.data[receiver] = None
-            return
+    _ray_fields = ('ray_n', 'phase', 'arrival_time', 'srcvdpower')
+
+    def _parse_body(self, body):
         """Read: phase, arrival_time and power of a ray"""
-        for rays in range(n_paths):
-            line = self._get_next_line()
-            ray_n, phase, arrival_time, srcvdpower = [float(i) for i in line.split()]
-            self.data[receiver][ray_n] = collections.OrderedDict()
-            self.data[receiver][ray_n]['ray_n'] = ray_n
-            self.data[receiver][ray_n]['phase'] = phase
-            self.data[receiver][ray_n]['arrival_time'] = arrival_time
-            self.data[receiver][ray_n]['srcvdpower'] = srcvdpower
+        with self._phase('tokenize'):
+            tokens = self._tokenize(body)
+        with self._phase('locate'):
+            _, ray_pos = self._locate_receivers(tokens, 4)
+        with self._phase('arrays'):
+            rays = tokens[ray_pos[:, np.newaxis] + np.arange(4)]
+            self.ray_n = rays[:, 0].astype(np.int32)
+            self.phase = rays[:, 1].copy()
+            self.arrival_time = rays[:, 2].copy()
+            self.srcvdpower = rays[:, 3].copy()
+
+    def _build_data_dict(self):
+        data = collections.OrderedDict()
+        for idx, receiver in enumerate(self.receiver_ids.tolist()):
+            start, stop = self.ray_offsets[idx], self.ray_offsets[idx + 1]
+            if start == stop:
+                data[receiver] = None
+                continue
+            data[receiver] = collections.OrderedDict()
+            data[receiver]['paths_number'] = int(stop - start)
+            for ray in range(start, stop):
+                ray_n = float(self.ray_n[ray])
+                data[receiver][ray_n] = collections.OrderedDict()
+                data[receiver][ray_n]['ray_n'] = ray_n
+                data[receiver][ray_n]['phase'] = float(self.phase[ray])
+                data[receiver][ray_n]['arrival_time'] = float(self.arrival_time[ray])
+                data[receiver][ray_n]['srcvdpower'] = float(self.srcvdpower[ray])
+        return data
             
     def get_phase_ndarray(self, antenna_number):
         '''Returns all phases in degrees. antenna_number starts with 1 (not 0).'''
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        data_ndarray = np.zeros((self.data[antenna_number]['paths_number'],))
-        for paths in range(self.data[antenna_number]['paths_number']):
-            data_ndarray[paths] = self.data[antenna_number][paths+1]['phase']
-        return data_ndarray
+        return self.phase[rays]
         
 if __name__=='__main__':
     #cir  = P2mCir('../example/model.cir.t001_01.r002.p2m')
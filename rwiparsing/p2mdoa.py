@@ -1,21 +1,30 @@
 import re
+import io
 import os
+import sys
+import warnings
+import contextlib
 import collections
 
 import numpy as np
 
+from . import profiling
+
+# returned by _phase when profiling is off, entering it costs next to nothing
+_NOT_TIMED = contextlib.nullcontext()
+
 
 class ParsingError(Exception):
     pass
 
 
 class P2mFileParser:
-    """Parser for p2m files. It currently support doa, paths and cir. Notice the regular expression in the code."""
+    """Parser for p2m files. It currently support doa, dod, paths, cir and positions. Notice the regular expression in the code."""
 
     # project.type.tx_y.rz.p2m
     _filename_match_re = (r'^(?P<project>.*)' +
                           r'\.' +
-                          r'(?P<type>((doa)|(paths)|(cir)))' +
+                          r'(?P<type>((doa)|(dod)|(paths)|(cir)|(positions)))' +
                           r'\.' +
                           r't(?P<transmitter>\d+)'+
                           r'_' +
@@ -25,17 +34,429 @@ class P2mFileParser:
                           r'\.' +
                           r'p2m$')
 
-    def __init__(self, filename):
+    # names of the arrays with one entry per receiver and per ray, set by the subclasses
+    _receiver_fields = ()
+    _ray_fields = ()
+
+    # from the file name, None if it is not named as InSite does
+    project = None
+    transmitter = None
+    transmitter_set = None
+    receiver_set = None
+
+    # left in float64 by set_precision: in float32 the delays of rays a few
+    # nanoseconds apart, microseconds after the transmission, are the same
+    _float64_fields = ('arrival_time', 'mean_arrival_time', 'spread_delay')
+
+    # ParseStats of the file being parsed, only while a profiling hook is registered
+    _stats = None
+    # see recover in __init__
+    _recover = False
+    _truncation = None
+
+    def __init__(self, filename, cache=None, dtype=None, recover=False):
+        """Parse filename, or load it from cache (a rwiparsing.cache.ParseCache)
+        if it was already parsed and did not change since. dtype is as in
+        set_precision, the cache keeps the full precision.
+
+        With recover, a file cut while InSite was writing it is parsed up
+        to its last complete receiver instead of raising a ParsingError,
+        and truncation reports what was left out. Such files are not
+        cached. Only the structure of the file is checked (see
+        validate_file): an invalid value, such as -12x.21, still raises
+        a ParsingError.
+        """
         self.filename = filename
-        self.file = None
-        self._parse()
+        self._data = None
+        self._recover = recover
+        if profiling.enabled():
+            self._stats = profiling.ParseStats(type(self).__name__, filename)
+        if cache is None:
+            self._parse()
+        else:
+            cache.parse(self)
+        if dtype is not None:
+            with self._phase('precision'):
+                self.set_precision(dtype)
+        if self._stats is not None:
+            self._count_rays(self._stats)
+            profiling.emit(self._stats)
+            self._stats = None
+
+    def _phase(self, name):
+        """Context timing a phase of the parsing when profiling"""
+        if self._stats is None:
+            return _NOT_TIMED
+        return self._stats.phase(name)
+
+    def _count_rays(self, stats):
+        stats.count('receivers', self.n_receivers)
+        stats.count('rays', self.ray_offsets[-1])
+        if getattr(self, 'point_offsets', None) is not None:
+            stats.count('interaction_points', self.point_offsets[-1])
+
+    def set_precision(self, dtype):
+        """Convert the floating point arrays to dtype, such as np.float32 to
+        halve their memory, except the _float64_fields. Return self."""
+        dtype = np.dtype(dtype)
+        for name, value in list(self.__dict__.items()):
+            if (isinstance(value, np.ndarray) and value.dtype.kind == 'f' and
+                    name not in self._float64_fields):
+                self.__dict__[name] = value.astype(dtype, copy=False)
+        self._data = None
+        return self
+
+    def memory_usage(self):
+        """Return the bytes used by each array as an OrderedDict
+
+        The str of object arrays are counted once even if they are shared
+        by several rays or arrays, as the interned interactions lists. The
+        dictionaries of get_data_dict are not counted.
+        """
+        usage = collections.OrderedDict()
+        seen = set()
+        for name, value in self.__dict__.items():
+            if name.startswith('_') or not isinstance(value, np.ndarray):
+                continue
+            size = value.nbytes
+            if value.dtype == object:
+                for item in value.ravel().tolist():
+                    if id(item) not in seen:
+                        seen.add(id(item))
+                        size += sys.getsizeof(item)
+            usage[name] = size
+        return usage
+
+    def bytes_per_ray(self):
+        """Memory of the arrays divided by the number of rays"""
+        return sum(self.memory_usage().values()) / max(1, int(self.ray_offsets[-1]))
+
+    def to_records(self):
+        """Return the rays as a numpy structured array, one record per ray
+
+        The fields are the numeric per ray fields, the angles and points
+        like fields are sub-arrays. Records are a copy of the arrays.
+        """
+        fields = []
+        for name in self._ray_fields:
+            value = getattr(self, name)
+            if value is None or value.dtype == object:
+                continue
+            fields.append((name, value.dtype, value.shape[1:]))
+        records = np.empty((int(self.ray_offsets[-1]),), dtype=fields)
+        for name, _, _ in fields:
+            records[name] = getattr(self, name)
+        return records
+
+    @property
+    def data(self):
+        """Nested dictionary view of the parsed file, built on first access"""
+        if self._data is None:
+            if profiling.enabled():
+                stats = profiling.ParseStats(type(self).__name__, self.filename)
+                with stats.phase('data_dict'):
+                    self._data = self._build_data_dict()
+                profiling.emit(stats)
+            else:
+                self._data = self._build_data_dict()
+        return self._data
 
     def get_data_dict(self):
         return self.data
 
+    def to_arrays(self):
+        """Return the parsed data as a dict of ndarrays
+
+        Scalars such as n_receivers are 0-d arrays. The private attributes,
+        such as the dictionaries, are left out since they are rebuilt on
+        demand, see from_arrays.
+        """
+        arrays = collections.OrderedDict()
+        for name, value in self.__dict__.items():
+            if name.startswith('_') or value is None:
+                continue
+            arrays[name] = np.asarray(value)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Create a parser from the output of to_arrays"""
+        parser = cls.__new__(cls)
+        parser._set_arrays(arrays)
+        return parser
+
+    def _set_arrays(self, arrays):
+        for name, value in arrays.items():
+            self.__dict__[name] = value.item() if value.ndim == 0 else value
+        self._data = None
+        self._receiver_index = {receiver: i for i, receiver in enumerate(self.receiver_ids.tolist())}
+
+    # pickle only the arrays, which keeps the parsers cheap to send between processes
+    def __getstate__(self):
+        return self.to_arrays()
+
+    def __setstate__(self, state):
+        self._set_arrays(state)
+
+    def _build_data_dict(self):
+        raise NotImplementedError()
+
+    def get_receiver_arrays(self, antenna_number):
+        """Return the arrays of a single receiver as an OrderedDict
+
+        The per receiver fields are scalars and the per ray fields are
+        slices of the rays of the receiver.
+        """
+        return self._receiver_arrays(self._receiver_index[antenna_number])
+
+    @classmethod
+    def _concatenate(cls, parts):
+        """Join parsers of consecutive receivers of the same file, in order"""
+        parser = cls.__new__(cls)
+        parser.filename = parts[0].filename
+        parser._data = None
+        parser._parse_meta()
+        parser.n_receivers = sum(part.n_receivers for part in parts)
+        parser._set_receivers(np.concatenate([part.receiver_ids for part in parts]),
+                              np.concatenate([part._n_paths() for part in parts]))
+        for name in cls._receiver_fields + cls._ray_fields:
+            values = [getattr(part, name) for part in parts]
+            setattr(parser, name, None if values[0] is None else np.concatenate(values))
+        return parser
+
+    def _receiver_arrays(self, idx):
+        start, stop = self.ray_offsets[idx], self.ray_offsets[idx + 1]
+        arrays = collections.OrderedDict()
+        for name in self._receiver_fields:
+            arrays[name] = getattr(self, name)[idx]
+        for name in self._ray_fields:
+            value = getattr(self, name)
+            if value is not None:
+                arrays[name] = value[start:stop]
+        return arrays
+
+    @classmethod
+    def iter_receivers(cls, filename, batch_bytes=2**22):
+        """Parse a file one receiver at a time
+
+        Yield (receiver, arrays) for each receiver, arrays as in
+        get_receiver_arrays. The receivers are read and converted in batches
+        of about batch_bytes of text, so the memory used does not depend on
+        the size of the file.
+        > sum(a['received_power'] for _, a in P2mPaths.iter_receivers(f) if len(a['srcvdpower']))
+        """
+        batch = cls.__new__(cls)
+        batch.filename = filename
+        batch._parse_meta()
+        batch.__dict__.update(cls._file_layout(filename))
+        with open(filename, 'rb') as file:
+            lines = (line for line in file if not line.lstrip().startswith(b'#'))
+            n_receivers = int(cls._next_line(lines))
+            while n_receivers > 0:
+                records = []
+                size = 0
+                batch.n_receivers = 0
+                while batch.n_receivers < n_receivers and size < batch_bytes:
+                    record = cls._read_receiver_lines(lines)
+                    records.extend(record)
+                    size += sum(len(line) for line in record)
+                    batch.n_receivers += 1
+                n_receivers -= batch.n_receivers
+                batch._parse_body(b''.join(records))
+                for idx, receiver in enumerate(batch.receiver_ids.tolist()):
+                    yield receiver, batch._receiver_arrays(idx)
+
+    @staticmethod
+    def _line_starts(text):
+        """Return the byte offset of the beginning of each uncommented line"""
+        newlines = np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == ord('\n'))
+        starts = np.concatenate(([0], newlines + 1))
+        if starts[-1] == len(text):
+            starts = starts[:-1]
+        comments = []
+        pos = text.find(b'#')
+        while pos != -1:
+            line = np.searchsorted(starts, pos, side='right') - 1
+            if not text[starts[line]:pos].strip():
+                comments.append(line)
+            pos = text.find(b'#', pos + 1)
+        return np.delete(starts, comments)
+
+    @classmethod
+    def _scan_receivers(cls, text, line_starts, partial=False):
+        """Find the receivers without parsing their paths
+
+        line_starts are the offsets of the lines of text (see _line_starts).
+        Return the receiver ids, their number of paths and the byte offsets of
+        their first line, with one more offset for the end of the last one.
+        With partial, stop at the first receiver that is cut or invalid
+        instead of raising and return the complete receivers before it.
+        """
+        n_receivers = int(text[line_starts[0]:line_starts[1] if len(line_starts) > 1 else len(text)])
+        receiver_lines = cls._receiver_lines_counter(text, line_starts)
+        receivers = np.zeros((n_receivers,), dtype=np.int32)
+        n_paths = np.zeros((n_receivers,), dtype=np.int64)
+        lines = np.zeros((n_receivers + 1,), dtype=np.int64)
+        line = 1
+        for rec in range(n_receivers):
+            try:
+                if line >= len(line_starts):
+                    raise ParsingError('Unexpected end of file')
+                receiver, n, header_lines = cls._receiver_header(text, line_starts, line)
+                end = line + header_lines + receiver_lines(line, n)
+                if end > len(line_starts):
+                    raise ParsingError('Unexpected end of file')
+            except (ParsingError, ValueError, IndexError):
+                if not partial:
+                    raise
+                n_receivers = rec
+                break
+            lines[rec] = line
+            receivers[rec] = receiver
+            n_paths[rec] = n
+            line = end
+        lines[n_receivers] = line
+        offsets = np.append(line_starts, len(text))[lines[:n_receivers + 1]]
+        return receivers[:n_receivers], n_paths[:n_receivers], offsets
+
+    @staticmethod
+    def _receiver_header(text, line_starts, line):
+        """Read the header of the receiver starting at line: its id, its
+        number of paths and the number of lines of the header"""
+        header = text[line_starts[line]:line_starts[line] + 64].split()
+        return int(header[0]), int(header[1]), 1
+
+    @classmethod
+    def _receiver_lines_counter(cls, text, line_starts):
+        """Return a function giving the number of lines of a receiver after
+        its header, from the line of the header and its number of paths.
+        It is called for each receiver in order."""
+        return lambda line, n_paths: n_paths
+
+    @classmethod
+    def _file_layout(cls, filename):
+        """Attributes of the whole file that a part of it may not tell, set on
+        the parsers of its receivers parsed apart (see p2mindex) before
+        their _parse_body"""
+        return {}
+
+    @staticmethod
+    def _next_line(lines):
+        line = next(lines, None)
+        if line is None:
+            raise ParsingError('Unexpected end of file')
+        return line
+
+    @classmethod
+    def _read_receiver_lines(cls, lines):
+        """Read the lines of the next receiver: 'receiver n_paths' and one line per path"""
+        header = cls._next_line(lines)
+        n_paths = int(header.split()[1])
+        return [header] + [cls._next_line(lines) for _ in range(n_paths)]
+
+    @classmethod
+    def validate_file(cls, filename):
+        """Check the structure of a file without converting its values
+
+        The receivers are located from their headers and numbers of paths,
+        which is much cheaper than parsing the file. Return a report as an
+        OrderedDict: filename, bytes, expected_receivers (of the first line),
+        complete_receivers, rays (of the complete receivers), complete_bytes
+        (the end of the last complete receiver), truncated and error, None
+        if the structure is valid. Invalid values are not looked for. The
+        last line of a file without an end of line is taken as complete if
+        it has all the values of its row, even if its last number was cut.
+        """
+        with open(filename, 'rb') as file:
+            text = file.read()
+        report = cls._check_structure(text)
+        report['filename'] = filename
+        report.move_to_end('filename', last=False)
+        return report
+
+    @classmethod
+    def _check_structure(cls, text):
+        report = collections.OrderedDict([
+            ('bytes', len(text)), ('expected_receivers', None), ('complete_receivers', 0),
+            ('rays', 0), ('complete_bytes', 0), ('truncated', False), ('error', None)])
+        end = len(text)
+        scanned = cls._scan_structure(text)
+        if not text.endswith(b'\n') and not cls._ends_complete(text, scanned):
+            # the last line, without its end of line, was cut in a row
+            end = text.rfind(b'\n') + 1
+            scanned = cls._scan_structure(text[:end])
+        if scanned is None:
+            report['truncated'] = True
+            report['error'] = 'Unexpected end of file'
+            return report
+        line_starts, scanned = scanned
+        if scanned is None:
+            report['error'] = 'Invalid number of receivers {!r}'.format(
+                text[line_starts[0]:line_starts[0] + 64].split(b'\n')[0].decode(errors='replace'))
+            return report
+        receivers, n_paths, offsets = scanned
+        report['expected_receivers'] = int(text[line_starts[0]:end].split(b'\n', 1)[0])
+        report['complete_receivers'] = len(receivers)
+        report['rays'] = int(n_paths.sum())
+        report['complete_bytes'] = int(offsets[-1])
+        if len(receivers) < report['expected_receivers']:
+            report['truncated'] = True
+            report['error'] = 'Unexpected end of file after {} of {} receivers'.format(
+                len(receivers), report['expected_receivers'])
+        elif text[offsets[-1]:].strip():
+            report['error'] = 'Unexpected data after the last receiver'
+        return report
+
+    @classmethod
+    def _scan_structure(cls, text):
+        """line_starts and the partial _scan_receivers of text, None if it has
+        no line, the scan is None if the number of receivers is invalid"""
+        line_starts = cls._line_starts(text)
+        if len(line_starts) == 0:
+            return None
+        try:
+            return line_starts, cls._scan_receivers(text, line_starts, partial=True)
+        except ValueError:
+            return line_starts, None
+
+    @classmethod
+    def _ends_complete(cls, text, scanned):
+        """Whether the last line of text ends the last receiver of the file
+        with all the values of its row"""
+        if scanned is None or scanned[1] is None:
+            return False
+        line_starts, (receivers, n_paths, offsets) = scanned
+        n_receivers = int(text[line_starts[0]:len(text) if len(line_starts) == 1 else line_starts[1]])
+        if len(receivers) < n_receivers or offsets[-1] != len(text):
+            return False
+        values = len(text[line_starts[-1]:].split())
+        if len(receivers) == 0:
+            # the last line is the number of receivers
+            return values == 1
+        try:
+            return values == cls._last_row_width(text, line_starts, int(n_paths[-1]))
+        except ParsingError:
+            return False
+
+    @classmethod
+    def _last_row_width(cls, text, line_starts, n_paths):
+        """Number of values of the last line of a receiver with n_paths paths"""
+        if n_paths == 0:
+            return 2
+        return cls._row_width(cls._strip_comments(text[line_starts[1]:]))
+
+    @property
+    def truncation(self):
+        """The validate_file report of a file parsed with recover=True that
+        was cut, None otherwise"""
+        return self._truncation
+
     def _parse_meta(self):
         match = re.match(P2mFileParser._filename_match_re,
                          os.path.basename(self.filename))
+        if match is None:
+            # the format was told by the content, see formats.open_p2m
+            return
 
         self.project = match.group('project')
         self.transmitter_set = int(match.group('transmitter_set'))
@@ -43,59 +464,197 @@ class P2mFileParser:
         self.receiver_set = int(match.group('receiver_set'))
 
     def _parse(self):
-        with open(self.filename) as self.file:
-            self._parse_meta()
-            self._parse_header()
-            self.data = collections.OrderedDict()
-            for rec in range(self.n_receivers):
-                self._parse_receiver()
-
-    def _parse_header(self):
-        """read the first line of the file, indicating the number of receivers"""
-        line = self._get_next_line()
+        """Read the whole file at once and convert it in bulk
+
+        Comment lines are removed from the buffer and the numeric body is
+        handed to _parse_body, which converts it to arrays in one pass.
+        """
+        self._parse_meta()
+        with self._phase('read'):
+            with open(self.filename, 'rb') as file:
+                text = file.read()
+        if self._recover:
+            with self._phase('validate'):
+                report = self._check_structure(text)
+            if report['error'] is not None:
+                if report['expected_receivers'] is None:
+                    raise ParsingError(report['error'])
+                report['filename'] = self.filename
+                report.move_to_end('filename', last=False)
+                self._truncation = report
+                text = text[:report['complete_bytes']]
+        with self._phase('comments'):
+            stripped = self._strip_comments(text)
+        if self._stats is not None:
+            lines = text.count(b'\n') + (not text.endswith(b'\n'))
+            self._stats.count('bytes', len(text))
+            self._stats.count('lines', lines)
+            self._stats.count('comment_lines', lines - stripped.count(b'\n') -
+                              (not stripped.endswith(b'\n')))
+        body = self._parse_header(stripped)
+        if self._truncation is not None:
+            self.n_receivers = self._truncation['complete_receivers']
+        self._parse_body(body)
+
+    @staticmethod
+    def _strip_comments(text):
+        """Remove the lines starting with #
+
+        Comments are rare (usually only the first line), so look for them
+        with find instead of running a regular expression over every line.
+        """
+        pieces = []
+        last = 0
+        pos = text.find(b'#')
+        while pos != -1:
+            line_start = text.rfind(b'\n', 0, pos) + 1
+            line_end = text.find(b'\n', pos)
+            line_end = len(text) if line_end == -1 else line_end + 1
+            if not text[line_start:pos].strip():
+                if line_start > last:
+                    pieces.append(text[last:line_start])
+                last = line_end
+            pos = text.find(b'#', line_end)
+        if last == 0:
+            return text
+        pieces.append(text[last:])
+        # join returns a single piece as is, without copying it again
+        return b''.join(pieces)
+
+    def _parse_header(self, text):
+        """read the first line of the file, indicating the number of receivers
+
+        Return the rest of the file"""
+        line, _, body = text.partition(b'\n')
+        if not line.strip():
+            raise ParsingError('Unexpected end of file')
         self.n_receivers = int(line.strip())
+        return body
 
-    def _parse_receiver(self):
+    def _parse_body(self, body):
         raise NotImplementedError()
 
-    def _get_next_line(self):
-        """Get the next uncommedted line of the file
+    @staticmethod
+    def _join_strings(strings):
+        """Store a sequence of str as a single uint8 buffer, '\\n' separated"""
+        return np.frombuffer('\n'.join(strings).encode(), dtype=np.uint8)
 
-        Call this only if a new line is expected
-        """
-        if self.file is None:
-            raise ParsingError('File is closed')
+    @staticmethod
+    def _split_strings(buffer):
+        """The list of str stored by _join_strings"""
+        text = buffer.tobytes().decode()
+        return text.split('\n') if text else []
+
+    @staticmethod
+    def _tokenize(text):
+        """Convert a whitespace separated numeric text into a float64 ndarray"""
+        if not text or text.isspace():
+            # numpy returns [-1.] for blank strings
+            return np.zeros((0,))
+        with warnings.catch_warnings():
+            # older numpy only warns when the text is not entirely numeric
+            warnings.simplefilter('error', DeprecationWarning)
+            try:
+                return np.fromstring(text, sep=' ')
+            except (ValueError, DeprecationWarning) as e:
+                raise ParsingError('Invalid numeric data: {}'.format(e))
+
+    @staticmethod
+    def _row_width(body):
+        """Number of values in the first path line following a receiver header"""
+        lines = io.BytesIO(body)
         while True:
-            next_line = self.file.readline()
-            if next_line == '':
-                raise ParsingError('Unexpected end of file')
-            if re.search(r'^\s*#', next_line, re.DOTALL):
+            line = lines.readline()
+            if line == b'':
+                return None
+            header = line.split()
+            if not header:
+                # a blank line, such as the end of a cut file
                 continue
+            try:
+                n_paths = int(header[1])
+            except (IndexError, ValueError):
+                raise ParsingError('Invalid receiver header {!r}'.format(line.strip().decode(errors='replace')))
+            if n_paths > 0:
+                return len(lines.readline().split())
+
+    def _locate_receivers(self, tokens, ray_size, stats_size=0):
+        """Locate the receivers and their paths in the flat token array
+
+        For each receiver the tokens hold its id and number of paths, then
+        stats_size values if it has any path and then its paths. ray_size is
+        the number of tokens of a path, either a scalar or one per path.
+
+        Set the receiver index and return the position in tokens of the
+        receiver stats and of each path.
+        """
+        fixed_size = np.ndim(ray_size) == 0
+        if fixed_size:
+            ray_size = int(ray_size)
+        else:
+            size_cumsum = np.concatenate(([0], np.cumsum(ray_size, dtype=np.int64)))
+            ray_ends = memoryview(size_cumsum)
+        # each header tells where the next one is: only the headers are walked,
+        # through a memoryview whose items are python scalars, cheaper to
+        # index than numpy ones
+        values = memoryview(tokens)
+        n_tokens = len(tokens)
+        headers = []
+        pos = 0
+        n_rays = 0
+        for _ in range(self.n_receivers):
+            if pos + 2 > n_tokens:
+                raise ParsingError('Unexpected end of file')
+            headers.append(pos)
+            n = int(values[pos + 1])
+            pos += 2 + stats_size if n > 0 else 2
+            if fixed_size:
+                pos += n * ray_size
+            elif n_rays + n < len(ray_ends):
+                pos += ray_ends[n_rays + n] - ray_ends[n_rays]
             else:
-                return next_line
+                raise ParsingError('Unexpected end of file')
+            n_rays += n
+        if pos > n_tokens:
+            raise ParsingError('Unexpected end of file')
+
+        headers = np.array(headers, dtype=np.int64)
+        n_paths = tokens[headers + 1].astype(np.int64)
+        bodies = headers + 2 + stats_size * (n_paths > 0)
+        self._set_receivers(tokens[headers], n_paths)
+        first_ray = self.ray_offsets[:-1]
+        if fixed_size:
+            ray_pos = (np.repeat(bodies - first_ray * ray_size, n_paths) +
+                       np.arange(n_rays) * ray_size)
+        else:
+            ray_pos = (np.repeat(bodies - size_cumsum[first_ray], n_paths) +
+                       size_cumsum[:n_rays])
+        return bodies - stats_size, ray_pos
+
+    def _set_receivers(self, receivers, n_paths):
+        self.receiver_ids = np.asarray(receivers, dtype=np.int32)
+        self._receiver_index = {receiver: i for i, receiver in enumerate(self.receiver_ids.tolist())}
+        self.ray_offsets = np.zeros((len(n_paths) + 1,), dtype=np.int64)
+        np.cumsum(n_paths, out=self.ray_offsets[1:])
+
+    def _ray_slice(self, antenna_number):
+        """Return the slice of the rays of a receiver, None if it has no paths"""
+        idx = self._receiver_index[antenna_number]
+        start, stop = self.ray_offsets[idx], self.ray_offsets[idx + 1]
+        if start == stop:
+            return None
+        return slice(start, stop)
+
+    def _n_paths(self):
+        """Number of paths of each receiver"""
+        return np.diff(self.ray_offsets)
 
 class P2MDoA(P2mFileParser):
     """Parse a p2m direction of arrival file
     > P2MDoA('iter0.doa.t001_05.r006.p2m').get_data_ndarray()
     """
-    # project.type.tx_y.rz.p2m
-    _filename_match_re = (r'^(?P<project>.*)' +
-                          r'\.' + 
-                          r'doa' + 
-                          r'\.' + 
-                          r't(?P<transmitter>\d+)'+
-                          r'_' +
-                          r'(?P<transmitter_set>\d+)' +
-                          r'\.' + 
-                          r'r(?P<receiver_set>\d+)' + 
-                          r'\.' +
-                          r'p2m$')
-    
-    def __init__(self, filename):
-        self.filename = filename
-        self.file = None
-        self._parse()
-        
+    _ray_fields = ('path_n', 'directions')
+
     def get_data_ndarray(self):
         ''' return the DoA as a ndarray
         
@@ -103,31 +662,48 @@ class P2MDoA(P2mFileParser):
         
         If a receiver has less paths than another its path is populated with zeros
         '''
-        data_ndarray = np.zeros((self.n_receivers, self.biggest_n_paths(), 3))
-        for rec_idx, path_dict in enumerate(self.data.values()):
-            for path_idx, direction in enumerate(path_dict.values()):
-                data_ndarray[rec_idx][path_idx][:] = direction
+        n_paths = self._n_paths()
+        data_ndarray = np.zeros((self.n_receivers, self.biggest_n_paths(), self.directions.shape[1]))
+        receivers = np.repeat(np.arange(self.n_receivers), n_paths)
+        paths = np.arange(len(self.directions)) - np.repeat(self.ray_offsets[:-1], n_paths)
+        data_ndarray[receivers, paths] = self.directions
         return data_ndarray
-    
+
+    def get_mask_ndarray(self):
+        ''' return a (receiver, path) boolean ndarray telling which paths of
+        get_data_ndarray exist, False for the zeros padding'''
+        return np.arange(max(self.biggest_n_paths(), 0)) < self._n_paths()[:, np.newaxis]
+
     def biggest_n_paths(self):
         ''' find the reciever with the biggest number of received paths'''
-        biggest = -np.inf
-        for receiver, receiver_v in self.data.items():
-            n_paths = len(receiver_v)
-            if n_paths > biggest:
-                biggest = n_paths
-        return biggest
-
-    def _parse_receiver(self):
-        line = self._get_next_line()
-        receiver, n_paths = [int(i) for i in line.split()]
-        self.data[receiver] = collections.OrderedDict()
-        for i in range(n_paths):
-            line = self._get_next_line()
-            sp_line = line.split()
-            path = int(sp_line[0])
-            direction = np.array([float(j) for j in sp_line[1:]])
-            self.data[receiver][path] = direction
+        if self.n_receivers == 0:
+            return -np.inf
+        return int(self._n_paths().max())
+
+    def _parse_body(self, body):
+        with self._phase('tokenize'):
+            tokens = self._tokenize(body)
+        with self._phase('locate'):
+            width = self._row_width(body) or 4
+            _, ray_pos = self._locate_receivers(tokens, width)
+        with self._phase('arrays'):
+            rows = tokens[ray_pos[:, np.newaxis] + np.arange(width)]
+            self.path_n = rows[:, 0].astype(np.int32)
+            self.directions = rows[:, 1:]
+
+    def _build_data_dict(self):
+        data = collections.OrderedDict()
+        for idx, receiver in enumerate(self.receiver_ids.tolist()):
+            data[receiver] = collections.OrderedDict()
+            for ray in range(self.ray_offsets[idx], self.ray_offsets[idx + 1]):
+                data[receiver][int(self.path_n[ray])] = self.directions[ray]
+        return data
+
+
+class P2MDoD(P2MDoA):
+    """Parse a p2m direction of departure file, laid out as the doa files
+    > P2MDoD('iter0.dod.t001_05.r006.p2m').get_data_ndarray()
+    """
 
 if __name__=='__main__':
     doa = P2MDoA('example/iter0.doa.t001_05.r006.p2m')
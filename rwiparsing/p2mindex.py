@@ -0,0 +1,177 @@
+"""Receiver index of p2m files, lazy parsing of single receivers and
+parallel parsing of large files
+
+> paths = LazyP2mFile(P2mPaths, 'model.paths.t001_01.r002.p2m', index_file=True)
+> paths.get_7_parameters_for_all_rays(3)  # parses only the receiver 3
+> paths = parse_parallel(P2mPaths, 'model.paths.t001_01.r002.p2m', workers=8)
+
+The index is the byte offset of each receiver header, found by a quick
+scan of the file that does not convert any path. It can be kept next to
+the file (filename + '.idx.npz') so reopening the file takes milliseconds.
+"""
+import os
+import inspect
+import collections
+import concurrent.futures
+
+import numpy as np
+
+from .p2mdoa import ParsingError
+
+
+class P2mIndex:
+    """Receiver ids, number of paths and byte offsets of the receivers of a file
+
+    offsets has one more entry than receiver_ids: the receiver k spans the
+    bytes offsets[k]:offsets[k+1] of the file.
+    """
+
+    def __init__(self, receiver_ids, n_paths, offsets, size, mtime_ns):
+        self.receiver_ids = receiver_ids
+        self.n_paths = n_paths
+        self.offsets = offsets
+        # of the indexed file, to know when the index is stale
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def build(cls, parser_class, filename):
+        """Scan filename, a file of parser_class (P2MDoA, P2mPaths, P2mCir or P2mPositions)"""
+        stat = os.stat(filename)
+        with open(filename, 'rb') as file:
+            text = file.read()
+        line_starts = parser_class._line_starts(text)
+        if len(line_starts) == 0:
+            raise ParsingError('Unexpected end of file')
+        receiver_ids, n_paths, offsets = parser_class._scan_receivers(text, line_starts)
+        return cls(receiver_ids, n_paths, offsets, stat.st_size, stat.st_mtime_ns)
+
+    def is_current(self, filename):
+        """Whether filename did not change since it was indexed"""
+        stat = os.stat(filename)
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+    def save(self, index_file):
+        with open(index_file, 'wb') as file:
+            np.savez(file, receiver_ids=self.receiver_ids, n_paths=self.n_paths,
+                     offsets=self.offsets, size=self.size, mtime_ns=self.mtime_ns)
+
+    @classmethod
+    def load(cls, index_file):
+        with np.load(index_file) as npz:
+            return cls(npz['receiver_ids'], npz['n_paths'], npz['offsets'],
+                       npz['size'].item(), npz['mtime_ns'].item())
+
+    @classmethod
+    def open(cls, parser_class, filename, index_file=None):
+        """Load the index of filename, building it if needed
+
+        index_file is where the index is kept: None keeps it only in memory,
+        True next to the file (filename + '.idx.npz'). A stale or unreadable
+        index file is rebuilt and overwritten.
+        """
+        if index_file is True:
+            index_file = filename + '.idx.npz'
+        if index_file is not None and os.path.exists(index_file):
+            try:
+                index = cls.load(index_file)
+            except (OSError, ValueError, KeyError):
+                index = None
+            if index is not None and index.is_current(filename):
+                return index
+        index = cls.build(parser_class, filename)
+        if index_file is not None:
+            index.save(index_file)
+        return index
+
+
+def _parse_range(parser_class, filename, start, stop, n_receivers, layout=None):
+    """Parse the n_receivers receivers in the bytes start:stop of filename,
+    layout is the _file_layout of the file"""
+    with open(filename, 'rb') as file:
+        file.seek(start)
+        body = file.read(stop - start)
+    parser = parser_class.__new__(parser_class)
+    parser.filename = filename
+    parser._data = None
+    parser._parse_meta()
+    parser.__dict__.update(layout or {})
+    parser.n_receivers = n_receivers
+    # comment lines may be anywhere in the file, as _parse removes them
+    parser._parse_body(parser_class._strip_comments(body))
+    return parser
+
+
+def parse_parallel(parser_class, filename, workers=None, index_file=None, chunks_per_worker=4):
+    """Parse a single large file with a pool of worker processes
+
+    The receivers found by the index (index_file as in P2mIndex.open) are
+    split in chunks of about the same number of bytes, which the workers
+    (os.cpu_count() if None, this process if 1) parse independently. The
+    chunks are then joined in file order, the result is the same as
+    parser_class(filename). Only worth it for files of hundreds of MB,
+    below that starting the workers and sending the arrays back costs
+    more than it saves.
+    > paths = parse_parallel(P2mPaths, 'model.paths.t001_01.r002.p2m', workers=8)
+    """
+    index = P2mIndex.open(parser_class, filename, index_file)
+    n_workers = workers or os.cpu_count() or 1
+    n_chunks = max(1, min(n_workers * chunks_per_worker, len(index.receiver_ids)))
+    # chunk boundaries at the receivers closest to equal byte splits
+    targets = np.linspace(index.offsets[0], index.offsets[-1], n_chunks + 1)
+    bounds = np.searchsorted(index.offsets, targets)
+    bounds[0], bounds[-1] = 0, len(index.receiver_ids)
+    bounds = np.unique(bounds)
+    layout = parser_class._file_layout(filename)
+    ranges = [(parser_class, filename, int(index.offsets[first]), int(index.offsets[last]), int(last - first),
+               layout) for first, last in zip(bounds[:-1], bounds[1:])]
+    if n_workers == 1 or len(ranges) <= 1:
+        parts = [_parse_range(*arguments) for arguments in ranges]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            parts = list(executor.map(_parse_range, *zip(*ranges)))
+    if not parts:
+        # a file without receivers
+        return _parse_range(parser_class, filename, index.offsets[0], index.offsets[0], 0, layout)
+    return parser_class._concatenate(parts)
+
+
+class LazyP2mFile:
+    """A p2m file whose receivers are parsed when they are first accessed
+
+    The methods of parser_class taking an antenna_number (get_p_gain_ndarray,
+    is_los, get_receiver_arrays...) are available and parse only that
+    receiver. index_file is as in P2mIndex.open.
+    """
+
+    def __init__(self, parser_class, filename, index_file=None):
+        self.parser_class = parser_class
+        self.filename = filename
+        self.index = P2mIndex.open(parser_class, filename, index_file)
+        self.receiver_ids = self.index.receiver_ids
+        self.n_receivers = len(self.receiver_ids)
+        self._receiver_index = {receiver: i for i, receiver in enumerate(self.receiver_ids.tolist())}
+        self._layout = parser_class._file_layout(filename)
+        self._receivers = collections.OrderedDict()
+
+    def receiver(self, antenna_number):
+        """Return a parser_class holding only the receiver antenna_number"""
+        parser = self._receivers.get(antenna_number)
+        if parser is None:
+            idx = self._receiver_index[antenna_number]
+            parser = _parse_range(self.parser_class, self.filename,
+                                  self.index.offsets[idx], self.index.offsets[idx + 1], 1, self._layout)
+            self._receivers[antenna_number] = parser
+        return parser
+
+    def __getattr__(self, name):
+        method = getattr(self.parser_class, name, None)
+        if not callable(method) or name.startswith('_'):
+            raise AttributeError(name)
+        parameters = list(inspect.signature(method).parameters)
+        if parameters[1:2] != ['antenna_number']:
+            raise AttributeError('{} is not available lazily, it needs the whole file'.format(name))
+
+        def receiver_method(antenna_number, *args, **kwargs):
+            return getattr(self.receiver(antenna_number), name)(antenna_number, *args, **kwargs)
+        return receiver_method
@@ -2,193 +2,387 @@
 Change log:
 AK - April 19, 2019 - provided support to InSite version 3.3, which includes path phase into p2m file.
 '''
+import re
 import collections
 
 import numpy as np
 
-from .p2mdoa import P2mFileParser  #use this option to run from command line
+from .p2mdoa import P2mFileParser, ParsingError  #use this option to run from command line
+from .interactions import InteractionTable
 #from p2mdoa import P2mFileParser  #use this option to run from within IntelliJ IDE and debug
 
 class P2mPaths(P2mFileParser):
-    """Parse a p2m paths file"""
+    """Parse a p2m paths file
 
-    def _parse_receiver(self):
-        """Get receiver and number of paths (pair Tx-Rx)"""
-        line = self._get_next_line()
-        receiver, n_paths = [int(i) for i in line.split()]
-        self.data[receiver] = collections.OrderedDict() #note we use a dictionary (hash table) to store information
-        if n_paths == 0:
-            self.data[receiver] = None
-            return
-        """Read: received_power -self.data[receiver][0]-, arrival_time -self.data[receiver][1]-,
-         spread_delay -self.data[receiver][2]-"""
-        #These are statistics per receiver (accounts for all paths)
-        line = self._get_next_line()
-        received_power, arrival_time, spread_delay = [float(i) for i in line.split()]
-        self.data[receiver]['received_power'] = received_power
-        self.data[receiver]['arrival_time'] = arrival_time
-        self.data[receiver]['spread_delay'] = spread_delay
-        self.data[receiver]['paths_number'] = n_paths
-        """Read for version 3.2: srcvdpower, arrival_time, arrival_angle1, arrival_angle2, departure_angle1, departure_angle2"""
-        """or read for version 3.3: srcvdpower, phase, arrival_time, arrival_angle1, arrival_angle2, departure_angle1, departure_angle2"""
-        #now get statistics per path
-        for rays in range(0,n_paths):
-            line = self._get_next_line()
-            line_values_as_list = line.split() #split line and organize values as list
-            if len(line_values_as_list) == 8: #version 3.2
-                ray_n, n_interactions, srcvdpower, arrival_time, arrival_angle1, arrival_angle2, departure_angle1, departure_angle2 = [float(i) for i in line.split()]
-            elif len(line_values_as_list) == 9: #version 3.3
-                ray_n, n_interactions, srcvdpower, phase, arrival_time, arrival_angle1, arrival_angle2, departure_angle1, departure_angle2  = [float(i) for i in line.split()]
+    The rays are stored column-wise instead of one dictionary per ray:
+    every per-ray field is a flat array in file order, ray_offsets maps each
+    receiver to its rays (CSR style, the rays of the receiver at index k are
+    ray_offsets[k]:ray_offsets[k+1]) and point_offsets maps each ray to its
+    interaction points (Tx and Rx included) in the (N, 3) points array.
+    The interactions lists are interned: interaction_sequences holds the
+    distinct ones and interaction_ids the index of the list of each ray,
+    see the interactions property for vectorized queries on them, and
+    interactions_list, one str per ray, is only built when accessed.
+    The nested dictionary of get_data_dict() is only built when requested.
+    """
+
+    _receiver_fields = ('received_power', 'mean_arrival_time', 'spread_delay')
+    # interactions_list is built from interaction_ids when accessed
+    _ray_fields = ('ray_n', 'n_interactions', 'srcvdpower', 'phase', 'arrival_time',
+                   'arrival_angle', 'departure_angle')
+
+    # the interactions of a ray, such as Tx-R-Rx, always start at the Tx,
+    # captured so that split also returns them
+    _interactions_re = re.compile(rb'(Tx\S*)')
+
+    # InSite 3.3 files have the phase of the rays, told by their first ray
+    has_phase = False
+
+    def _parse_body(self, body):
+        """Convert all receivers at once
+
+        The interactions lines are the only non numeric ones: a single split
+        on a regular expression separates them from the rest of the text,
+        which is converted to a single float array. Each receiver is 'receiver n_paths',
+        then 'received_power arrival_time spread_delay' if n_paths > 0 and
+        for each ray its line of values, its interactions line and the
+        coordinates of the n_interactions + 2 points (Tx and Rx included).
+        """
+        with self._phase('interactions'):
+            pieces = self._interactions_re.split(body)
+            self._set_interactions(InteractionTable.from_strings(pieces[1::2]))
+            n_points = np.array([s.count('-') + 1 for s in self.interaction_sequences.tolist()],
+                                dtype=np.int64)[self.interaction_ids]
+        #Read for version 3.2: ray_n, n_interactions, srcvdpower, arrival_time, arrival_angle1, arrival_angle2, departure_angle1, departure_angle2
+        #or read for version 3.3: ray_n, n_interactions, srcvdpower, phase, arrival_time, arrival_angle1, arrival_angle2, departure_angle1, departure_angle2
+        width = self._ray_width(body)
+        self.has_phase = width == 9
+        with self._phase('tokenize'):
+            tokens = self._tokenize(b''.join(pieces[0::2]))
+
+        with self._phase('locate'):
+            stats_pos, ray_pos = self._locate_receivers(tokens, width + 3 * n_points, stats_size=3)
+        if len(ray_pos) != len(self.interaction_ids):
+            raise ParsingError('Found {} interactions lines for {} rays'.format(
+                len(self.interaction_ids), len(ray_pos)))
+
+        with self._phase('arrays'):
+            #These are statistics per receiver (accounts for all paths)
+            stats = np.full((self.n_receivers, 3), np.nan)
+            has_paths = self._n_paths() > 0
+            stats[has_paths] = tokens[stats_pos[has_paths, np.newaxis] + np.arange(3)]
+            self.received_power = stats[:, 0]
+            self.mean_arrival_time = stats[:, 1]
+            self.spread_delay = stats[:, 2]
+
+            rays = tokens[ray_pos[:, np.newaxis] + np.arange(width)]
+            self.ray_n = rays[:, 0].astype(np.int32)
+            self.n_interactions = rays[:, 1].astype(np.int32)
+            if np.any(self.n_interactions != n_points - 2):
+                bad = np.flatnonzero(self.n_interactions != n_points - 2)[0]
+                raise ParsingError('Ray {} has {} interactions but its interactions list is {}'.format(
+                    self.ray_n[bad], self.n_interactions[bad],
+                    self.interaction_sequences[self.interaction_ids[bad]]))
+            self.srcvdpower = rays[:, 2].copy()
+            if self.has_phase:
+                self.phase = rays[:, 3].copy()
+                rays = rays[:, 1:]
             else:
-                raise Exception(line + ' has ' + len(line_values_as_list) + ' but was expecting 8 or 9!')
-            interactions_list = self._get_next_line().strip()
-            ray_n = int(ray_n)
-            n_interactions = int(n_interactions)
-            self.data[receiver][ray_n] = collections.OrderedDict()
-            self.data[receiver][ray_n]['srcvdpower'] = srcvdpower
-            if len(line_values_as_list) == 9: #version 3.3
-                self.data[receiver][ray_n]['phase'] = phase
-            self.data[receiver][ray_n]['arrival_time'] = arrival_time
-            self.data[receiver][ray_n]['arrival_angle1'] = arrival_angle1
-            self.data[receiver][ray_n]['arrival_angle2'] = arrival_angle2
-            self.data[receiver][ray_n]['departure_angle1'] = departure_angle1
-            self.data[receiver][ray_n]['departure_angle2'] = departure_angle2
-            self.data[receiver][ray_n]['interactions_list'] = interactions_list
-            self.data[receiver][ray_n]['interactions'] = collections.OrderedDict()
-            self.data[receiver][ray_n]['n_interactions'] = n_interactions #store integer
+                self.phase = None
+            self.arrival_time = rays[:, 3].copy()
+            self.arrival_angle = rays[:, 4:6].copy()
+            self.departure_angle = rays[:, 6:8].copy()
+
             """Get coordinates of interactions"""
-            for i in range(n_interactions+2): #add 2 to take in account Tx and Rx
-                line = self._get_next_line()
-                sp_line = line.split()
-                interaction = i 
-                coordinates = np.array([float(j) for j in sp_line[0:]])
-                #self.data[receiver][ray_n]['interactions'][interactions_list.split('-')[i]] = coordinates
-                self.data[receiver][ray_n]['interactions'][str(interaction)] = coordinates
+            self.point_offsets = np.zeros((len(n_points) + 1,), dtype=np.int64)
+            np.cumsum(n_points, out=self.point_offsets[1:])
+            point_ray = np.repeat(np.arange(len(n_points)), n_points)
+            point_pos = (ray_pos[point_ray] + width +
+                         3 * (np.arange(self.point_offsets[-1]) - self.point_offsets[point_ray]))
+            self.points = tokens[point_pos[:, np.newaxis] + np.arange(3)]
+
+    @classmethod
+    def _concatenate(cls, parts):
+        """Also join the points and the interaction tables"""
+        # a part without rays cannot tell the version of the file
+        has_phase = any(part.has_phase for part in parts)
+        if has_phase:
+            for part in parts:
+                if part.phase is None:
+                    part.phase = np.zeros((0,))
+        parser = super()._concatenate(parts)
+        parser.has_phase = has_phase
+        parser._set_interactions(InteractionTable.concatenate([part.interactions for part in parts]))
+        n_points = np.concatenate([np.diff(part.point_offsets) for part in parts])
+        parser.point_offsets = np.zeros((len(n_points) + 1,), dtype=np.int64)
+        np.cumsum(n_points, out=parser.point_offsets[1:])
+        parser.points = np.concatenate([part.points for part in parts])
+        return parser
+
+    def _receiver_arrays(self, idx):
+        """Also return the interactions lists and the points of the rays, with
+        point_offsets relative to them"""
+        arrays = super()._receiver_arrays(idx)
+        rays = slice(self.ray_offsets[idx], self.ray_offsets[idx + 1])
+        arrays['interactions_list'] = self.interactions[rays].strings()
+        point_offsets = self.point_offsets[rays.start:rays.stop + 1]
+        arrays['point_offsets'] = point_offsets - point_offsets[0]
+        arrays['points'] = self.points[point_offsets[0]:point_offsets[-1]]
+        return arrays
+
+    @classmethod
+    def _read_receiver_lines(cls, lines):
+        """Read the lines of the next receiver, its stats and for each ray the
+        values, interactions and points lines"""
+        header = cls._next_line(lines)
+        n_paths = int(header.split()[1])
+        if n_paths == 0:
+            return [header]
+        record = [header, cls._next_line(lines)]
+        for ray in range(n_paths):
+            record.append(cls._next_line(lines))
+            interactions = cls._next_line(lines)
+            record.append(interactions)
+            record.extend(cls._next_line(lines) for _ in range(interactions.count(b'-') + 1))
+        return record
+
+    @staticmethod
+    def _last_row_width(text, line_starts, n_paths):
+        """A receiver with paths ends with the x y z of a point"""
+        return 2 if n_paths == 0 else 3
+
+    @classmethod
+    def _receiver_lines_counter(cls, text, line_starts):
+        """The receiver ends with the points of its last ray, which follow its
+        interactions line"""
+        starts = []
+        n_points = []
+        for match in cls._interactions_re.finditer(text):
+            starts.append(text.rfind(b'\n', 0, match.start()) + 1)
+            n_points.append(match.group().count(b'-') + 1)
+        starts = np.array(starts, dtype=np.int64)
+        interactions_lines = np.searchsorted(line_starts, starts)
+        # comments, such as the name of the receiver set, may hold a Tx too
+        uncommented = interactions_lines < len(line_starts)
+        uncommented[uncommented] = line_starts[interactions_lines[uncommented]] == starts[uncommented]
+        interactions_lines = interactions_lines[uncommented]
+        n_points = np.array(n_points, dtype=np.int64)[uncommented]
+        rays = 0
+
+        def receiver_lines(line, n_paths):
+            nonlocal rays
+            if n_paths == 0:
+                return 0
+            rays += n_paths
+            if rays > len(n_points):
+                raise ParsingError('Unexpected end of file')
+            return int(interactions_lines[rays - 1] + n_points[rays - 1]) - line
+
+        return receiver_lines
+
+    @classmethod
+    def _file_layout(cls, filename):
+        """The version of the file, from its first ray, so that the receivers
+        parsed apart have a phase even if they have no rays"""
+        previous = None
+        with open(filename, 'rb') as file:
+            for line in file:
+                if line.lstrip().startswith(b'#'):
+                    continue
+                if cls._interactions_re.match(line.lstrip()) and previous is not None:
+                    return {'has_phase': len(previous.split()) == 9}
+                previous = line
+        return {}
+
+    def _ray_width(self, body):
+        """Number of values in a ray line, 8 for version 3.2 and 9 for 3.3"""
+        match = self._interactions_re.search(body)
+        if match is None:
+            # no ray to tell, keep the version of the file if it is known
+            return 9 if self.has_phase else 8
+        line_end = body.rfind(b'\n', 0, match.start())
+        line_start = body.rfind(b'\n', 0, line_end) + 1
+        line = body[line_start:line_end]
+        if len(line.split()) not in (8, 9):
+            raise ParsingError('{} has {} values but was expecting 8 or 9!'.format(
+                line.strip().decode(), len(line.split())))
+        return len(line.split())
+
+    @property
+    def interactions(self):
+        """InteractionTable of all the rays, index it with the rays of a receiver"""
+        return self._interactions
+
+    @property
+    def interactions_list(self):
+        """The interactions list of each ray, built on first access: an object
+        array of one entry per ray, the rays share the str of their sequence"""
+        if self._interactions_list is None:
+            self._interactions_list = self._interactions.strings()
+        return self._interactions_list
+
+    def _set_interactions(self, table):
+        self._interactions = table
+        self.interaction_sequences = table.sequences
+        self.interaction_ids = table.ids
+        self._interactions_list = None
+
+    def to_arrays(self):
+        arrays = super().to_arrays()
+        # a single buffer is much cheaper to store than one object per sequence
+        arrays['interaction_sequences'] = self._join_strings(self.interaction_sequences)
+        return arrays
+
+    def _set_arrays(self, arrays):
+        arrays = dict(arrays)
+        if 'interactions_list' in arrays:
+            # stored before the interactions were interned
+            table = InteractionTable.from_strings(self._split_strings(arrays.pop('interactions_list')))
+        else:
+            table = InteractionTable(self._split_strings(arrays.pop('interaction_sequences')),
+                                     arrays.pop('interaction_ids'))
+        super()._set_arrays(arrays)
+        self._set_interactions(table)
+        if 'phase' not in arrays:
+            # InSite 3.2 files
+            self.phase = None
+
+    def _build_data_dict(self):
+        data = collections.OrderedDict()
+        # the keys of the points, shared by all the rays
+        point_keys = [str(i) for i in range(int(np.diff(self.point_offsets).max(initial=0)))]
+        for idx, receiver in enumerate(self.receiver_ids.tolist()):
+            start, stop = self.ray_offsets[idx], self.ray_offsets[idx + 1]
+            if start == stop:
+                data[receiver] = None
+                continue
+            receiver_dict = collections.OrderedDict()
+            receiver_dict['received_power'] = float(self.received_power[idx])
+            receiver_dict['arrival_time'] = float(self.mean_arrival_time[idx])
+            receiver_dict['spread_delay'] = float(self.spread_delay[idx])
+            receiver_dict['paths_number'] = int(stop - start)
+            for ray in range(start, stop):
+                ray_dict = collections.OrderedDict()
+                ray_dict['srcvdpower'] = float(self.srcvdpower[ray])
+                if self.phase is not None:
+                    ray_dict['phase'] = float(self.phase[ray])
+                ray_dict['arrival_time'] = float(self.arrival_time[ray])
+                ray_dict['arrival_angle1'] = float(self.arrival_angle[ray, 0])
+                ray_dict['arrival_angle2'] = float(self.arrival_angle[ray, 1])
+                ray_dict['departure_angle1'] = float(self.departure_angle[ray, 0])
+                ray_dict['departure_angle2'] = float(self.departure_angle[ray, 1])
+                ray_dict['interactions_list'] = self.interactions_list[ray]
+                points = self.points[self.point_offsets[ray]:self.point_offsets[ray + 1]]
+                ray_dict['interactions'] = collections.OrderedDict(zip(point_keys, points))
+                ray_dict['n_interactions'] = int(self.n_interactions[ray])
+                receiver_dict[int(self.ray_n[ray])] = ray_dict
+            data[receiver] = receiver_dict
+        return data
+
+    def _ray_index(self, antenna_number, ray_number):
+        """Return the index in the ray arrays of a ray of a receiver"""
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
+            return None
+        # rays are numbered from 1 in file order, search only if they are not
+        guess = rays.start + ray_number - 1
+        if rays.start <= guess < rays.stop and self.ray_n[guess] == ray_number:
+            return guess
+        found = np.flatnonzero(self.ray_n[rays] == ray_number)
+        if len(found) == 0:
+            raise KeyError(ray_number)
+        return rays.start + found[0]
 
     def get_total_received_power(self, antenna_number):
-        if self.data[antenna_number] is None:
+        if self._ray_slice(antenna_number) is None:
             return None
-        return self.data[antenna_number]['received_power']
+        return self.received_power[self._receiver_index[antenna_number]]
 
     def get_mean_time_of_arrival(self, antenna_number):
-        if self.data[antenna_number] is None:
+        if self._ray_slice(antenna_number) is None:
             return None
-        return self.data[antenna_number]['arrival_time']
+        return self.mean_arrival_time[self._receiver_index[antenna_number]]
 
     def get_spread_delay(self, antenna_number):
-        if self.data[antenna_number] is None:
+        if self._ray_slice(antenna_number) is None:
             return None
-        return self.data[antenna_number]['spread_delay']
+        return self.spread_delay[self._receiver_index[antenna_number]]
 
     def get_arrival_time_ndarray(self, antenna_number):
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        data_ndarray = np.zeros((self.data[antenna_number]['paths_number'],))
-        for paths in range(self.data[antenna_number]['paths_number']):
-            data_ndarray[paths] = self.data[antenna_number][paths+1]['arrival_time']
-        return data_ndarray
+        return self.arrival_time[rays]
 
     def get_interactions_list(self, antenna_number):
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        data = []
-        for paths in range(self.data[antenna_number]['paths_number']):
-            data.append(self.data[antenna_number][paths+1]['interactions_list'])
-        return data
+        return self.interactions[rays].strings().tolist()
 
     def get_interactions_positions(self, antenna_number, ray_number):
-        if self.data[antenna_number] is None:
+        ray = self._ray_index(antenna_number, ray_number)
+        if ray is None:
             return None
-        if self.data[antenna_number][ray_number] is None:
-            return None
-        data = []
-        #self.data[receiver][ray_n]['interactions'][interaction]
-        #add 2 to take in account Tx and Rx
-        for paths in range(2 + self.data[antenna_number][ray_number]['n_interactions']):
-            data.append(self.data[antenna_number][ray_number]['interactions'][str(paths)])
-        return data
+        #includes the Tx and Rx positions
+        return list(self.points[self.point_offsets[ray]:self.point_offsets[ray + 1]])
 
     def get_interactions_positions_as_string(self, antenna_number, ray_number):
-        data = self.get_interactions_positions(antenna_number, ray_number)
-        outputString = ''
-        for i in range(len(data)-1):
-            outputString = outputString + str(data[i][0]) + ' ' + str(data[i][1]) + ' ' + str(data[i][2]) + ','
-        i = len(data)-1
-        outputString += str(data[i][0]) + ' ' + str(data[i][1]) + ' ' + str(data[i][2])
-        return outputString
+        ray = self._ray_index(antenna_number, ray_number)
+        data = self.points[self.point_offsets[ray]:self.point_offsets[ray + 1]].tolist()
+        return ','.join(' '.join(str(value) for value in point) for point in data)
 
     def get_departure_angle_ndarray(self, antenna_number):
         """ return the daparture angles as a ndarray        
         The array is shaped (number_paths, departure_angle1, departure_angle2)
         """
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        data_ndarray = np.zeros((self.data[antenna_number]['paths_number'], 2))
-        for paths in range(self.data[antenna_number]['paths_number']):
-            data_ndarray[paths][0]= self.data[antenna_number][paths+1]['departure_angle1']
-            data_ndarray[paths][1]= self.data[antenna_number][paths+1]['departure_angle2']
-        return data_ndarray
+        return self.departure_angle[rays]
 
     def get_arrival_angle_ndarray(self, antenna_number):
         """Return the arrival angles as a ndarray
         The array is shaped (number_paths, arrival_angle1, arrival_angle2)
         """
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        data_ndarray = np.zeros((self.data[antenna_number]['paths_number'], 2))
-        for paths in range(self.data[antenna_number]['paths_number']):
-            data_ndarray[paths][0]= self.data[antenna_number][paths+1]['arrival_angle1']
-            data_ndarray[paths][1]= self.data[antenna_number][paths+1]['arrival_angle2']
-        return data_ndarray
+        return self.arrival_angle[rays]
 
     def get_p_gain_ndarray(self, antenna_number):
         """Return the gains as a ndarray
         The array is shaped (number_paths, arrival_angle1, arrival_angle2)
         """
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        data_ndarray = np.zeros((self.data[antenna_number]['paths_number']))
-        for paths in range(self.data[antenna_number]['paths_number']):
-            data_ndarray[paths] = self.data[antenna_number][paths+1]['srcvdpower']
-        return data_ndarray
+        return self.srcvdpower[rays]
 
     def get_p_phase_ndarray(self, antenna_number):
         """Return the phases as a ndarray.
         """
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        data_ndarray = np.zeros((self.data[antenna_number]['paths_number']))
-        for paths in range(self.data[antenna_number]['paths_number']):
-            data_ndarray[paths] = self.data[antenna_number][paths+1]['phase']
-        return data_ndarray
+        if self.phase is None:
+            # InSite 3.2 files do not inform the phase
+            raise KeyError('phase')
+        return self.phase[rays]
 
     def is_los(self, antenna_number):
         '''Check if each ray  (not the whole channel) is LOS or not'''
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        num_paths = self.data[antenna_number]['paths_number']
-        data_ndarray = np.zeros((num_paths,))
-        for path_i in range(num_paths):
-            interaction = self.data[antenna_number][path_i+1]['interactions_list']
-            if interaction == 'Tx-Rx':
-                data_ndarray[path_i] = 1 #it is LOS
-            else:
-                data_ndarray[path_i] = 0 #it is not LOS
-        return data_ndarray
+        return self.interactions[rays].los().astype(np.float64)
 
     def is_los_through_foliage(self, antenna_number):
         '''Check if each ray  (not the whole channel) is LOS or not'''
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        num_paths = self.data[antenna_number]['paths_number']
-        data_ndarray = np.zeros((num_paths,))
-        for path_i in range(num_paths):
-            interaction = self.data[antenna_number][path_i+1]['interactions_list']
-            if interaction == 'Tx-F-Rx' or interaction == 'Tx-F-X-Rx':
-                data_ndarray[path_i] = 1 #it is LOS
-            else:
-                data_ndarray[path_i] = 0 #it is not LOS
-        return data_ndarray
+        return self.interactions[rays].matches('Tx-F-Rx', 'Tx-F-X-Rx').astype(np.float64)
 
     def get_6_parameters_for_all_rays(self, antenna_number):
         """Useful for version 3.2, which does not inform the phase on .p2m files.
@@ -207,9 +401,10 @@ class P2mPaths(P2mFileParser):
                             if numParametersPerRay == 8:
                                 thisRayInfo[7] = ray.phaseInDegrees
         """
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        num_paths = self.data[antenna_number]['paths_number']
+        num_paths = rays.stop - rays.start
         data_ndarray = np.zeros((num_paths,6))
         data_ndarray[:,0]=self.get_p_gain_ndarray(antenna_number)
         data_ndarray[:,1]=self.get_arrival_time_ndarray(antenna_number)
@@ -230,9 +425,10 @@ class P2mPaths(P2mFileParser):
                             thisRayInfo[5] = ray.arrival_azimuth
                             thisRayInfo[6] = ray.path_phase
         """
-        if self.data[antenna_number] is None:
+        rays = self._ray_slice(antenna_number)
+        if rays is None:
             return None
-        num_paths = self.data[antenna_number]['paths_number']
+        num_paths = rays.stop - rays.start
         data_ndarray = np.zeros((num_paths,7))
         data_ndarray[:,0]=self.get_p_gain_ndarray(antenna_number)
         data_ndarray[:,1]=self.get_arrival_time_ndarray(antenna_number)
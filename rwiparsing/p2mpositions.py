@@ -1,118 +1,173 @@
 import collections
+
 import numpy as np
-# from .p2mdoa import P2mFileParser
-import re
-import os
-
-
-class ParsingError(Exception):
-    pass
-
-
-class P2mFileParser:
-    """Parser for p2m files"""
-
-    # project.type.tx_y.rz.p2m
-    _filename_match_re = (r'^(?P<project>.*)' +
-                          r'\.' +
-                          r'(?P<type>((doa)|(paths)|(positions)))' +
-                          r'\.' +
-                          r't(?P<transmitter>\d+)' +
-                          r'_' +
-                          r'(?P<transmitter_set>\d+)' +
-                          r'\.' +
-                          r'r(?P<receiver_set>\d+)' +
-                          r'\.' +
-                          r'p2m$')
-
-    def __init__(self, filename):
-        self.filename = filename
-        self.file = None
-        self._parse()
-
-    def get_data_dict(self):
-        return self.data
-
-    def _parse_meta(self):
-        match = re.match(P2mFileParser._filename_match_re,
-                         os.path.basename(self.filename))
-        self.project = match.group('project')
-        self.transmitter_set = int(match.group('transmitter_set'))
-        self.transmitter = int(match.group('transmitter'))
-        self.receiver_set = int(match.group('receiver_set'))
-
-    def _parse(self):
-        with open(self.filename) as self.file:
-            self._parse_meta()
-            self._parse_header()
-            self.data = collections.OrderedDict()
-            for rec in range(self.n_receivers):
-                self._parse_receiver()
-
-    def _parse_header(self):
-        """read the first line of the file, indicating the number of receivers"""
-        line = self._get_next_line()
-        self.n_receivers = int(line.strip())
-
-    def _parse_receiver(self):
-        raise NotImplementedError()
-
-    def _get_next_line(self):
-        """Get the next uncommedted line of the file
-
-        Call this only if a new line is expected
-        """
-        if self.file is None:
-            raise ParsingError('File is closed')
-        while True:
-            next_line = self.file.readline()
-            if next_line == '':
-                raise ParsingError('Unexpected end of file')
-            if re.search(r'^\s*#', next_line, re.DOTALL):
+
+from .p2mdoa import P2mFileParser, ParsingError
+
+
+class P2mPositions(P2mFileParser):
+    """Parse a p2m positions file, the vehicles of each timestep
+
+    The file has the number of timesteps, then for each timestep its time,
+    its number of vehicles and for each vehicle a line with its name and a
+    line with 'x y z vel acel'.
+
+    The timesteps are stored as the receivers of the other files:
+    receiver_ids are their times (also available as times) and
+    ray_offsets maps each timestep to its vehicles, whose arrays are
+    position (n_vehicles, 3), vel, acel and name_ids, the index of the
+    name of each vehicle in vehicle_names.
+    > P2mPositions('model.positions.t001_01.r002.p2m').get_positions_ndarray(0)
+    """
+
+    _ray_fields = ('position', 'vel', 'acel')
+
+    @property
+    def times(self):
+        return self.receiver_ids
+
+    def _parse_body(self, body):
+        """The names are the only non numeric lines, every other line of a
+        timestep after its header: the timesteps are walked line by line
+        and the values of all the vehicles converted at once"""
+        with self._phase('locate'):
+            lines = [line for line in body.split(b'\n') if line.strip()]
+            times = np.zeros((self.n_receivers,), dtype=np.int64)
+            n_vehicles = np.zeros((self.n_receivers,), dtype=np.int64)
+            names = []
+            values = []
+            pos = 0
+            for step in range(self.n_receivers):
+                if pos + 2 > len(lines):
+                    raise ParsingError('Unexpected end of file')
+                times[step] = int(lines[pos])
+                n_vehicles[step] = int(lines[pos + 1])
+                pos += 2
+                stop = pos + 2 * n_vehicles[step]
+                if stop > len(lines):
+                    raise ParsingError('Unexpected end of file')
+                names.extend(lines[pos:stop:2])
+                values.extend(lines[pos + 1:stop:2])
+                pos = stop
+            self._set_receivers(times, n_vehicles)
+
+        with self._phase('tokenize'):
+            tokens = self._tokenize(b'\n'.join(values))
+        if len(tokens) != 5 * len(values):
+            raise ParsingError('Expected 5 values per vehicle, found {} for {} vehicles'.format(
+                len(tokens), len(values)))
+        tokens = tokens.reshape((-1, 5))
+        self.position = tokens[:, :3].copy()
+        self.vel = tokens[:, 3].copy()
+        self.acel = tokens[:, 4].copy()
+
+        with self._phase('names'):
+            vehicle_names = {}
+            self.name_ids = np.fromiter((vehicle_names.setdefault(name.strip(), len(vehicle_names))
+                                         for name in names), dtype=np.int32, count=len(names))
+            self.vehicle_names = np.array([name.decode() for name in vehicle_names], dtype=object)
+
+    def _receiver_arrays(self, idx):
+        """Also return the names of the vehicles, name_ids only make sense with vehicle_names"""
+        arrays = super()._receiver_arrays(idx)
+        arrays['names'] = self.vehicle_names[self.name_ids[self.ray_offsets[idx]:self.ray_offsets[idx + 1]]]
+        return arrays
+
+    @classmethod
+    def _read_receiver_lines(cls, lines):
+        """Read the lines of the next timestep: time, number of vehicles and
+        two lines per vehicle"""
+        time = cls._next_line(lines)
+        header = cls._next_line(lines)
+        return [time, header] + [cls._next_line(lines) for _ in range(2 * int(header))]
+
+    @classmethod
+    def _concatenate(cls, parts):
+        """Also merge the vehicle names, each part numbers its own"""
+        parser = super()._concatenate(parts)
+        vehicle_names = {}
+        name_ids = []
+        for part in parts:
+            ids = np.array([vehicle_names.setdefault(name, len(vehicle_names))
+                            for name in part.vehicle_names.tolist()], dtype=np.int32)
+            name_ids.append(ids[part.name_ids])
+        parser.name_ids = np.concatenate(name_ids)
+        parser.vehicle_names = np.array(list(vehicle_names), dtype=object)
+        return parser
+
+    @staticmethod
+    def _receiver_header(text, line_starts, line):
+        """A timestep starts with its time and number of vehicles lines"""
+        time = int(text[line_starts[line]:line_starts[line + 1]])
+        return time, int(text[line_starts[line + 1]:line_starts[line + 1] + 64].split()[0]), 2
+
+    @staticmethod
+    def _last_row_width(text, line_starts, n_vehicles):
+        """A timestep ends with its number of vehicles or x y z vel acel"""
+        return 1 if n_vehicles == 0 else 5
+
+    @classmethod
+    def _receiver_lines_counter(cls, text, line_starts):
+        """Name and values lines of each vehicle"""
+        return lambda line, n_vehicles: 2 * n_vehicles
+
+    def to_arrays(self):
+        arrays = super().to_arrays()
+        arrays['vehicle_names'] = self._join_strings(self.vehicle_names)
+        return arrays
+
+    def _set_arrays(self, arrays):
+        arrays = dict(arrays)
+        vehicle_names = self._split_strings(arrays.pop('vehicle_names'))
+        super()._set_arrays(arrays)
+        self.vehicle_names = np.array(vehicle_names, dtype=object)
+
+    def _build_data_dict(self):
+        data = collections.OrderedDict()
+        for idx, time in enumerate(self.receiver_ids.tolist()):
+            start, stop = self.ray_offsets[idx], self.ray_offsets[idx + 1]
+            if start == stop:
+                data[time] = None
                 continue
-            else:
-                return next_line
-
-
-class P2mCir(P2mFileParser):
-    """Parse a p2m cir file"""
-
-    def _parse_receiver(self):
-        """Get receiver and number of paths (pair Tx-Rx)"""
-        line = self._get_next_line()
-        time = int(line)
-        line = self._get_next_line()
-        n_veh = int(line)
-        print('time = ', time)  # TODO take out
-        print('print n_veh = ', n_veh)
-        self.data["positions"] = collections.OrderedDict()
-        self.data["positions"]["time"] = time
-        if n_veh == 0:
-            self.data["positions"] = None
-            return
-        """Read: phase, arrival_time and power of a ray"""
-        for veh in range(n_veh):
-            self.data["positions"][veh] = collections.OrderedDict()
-            line = self._get_next_line()
-            veh_name = str(line)
-            self.data["positions"][veh]['name'] = veh_name
-            line = self._get_next_line()
-            x, y, z, vel, acel = [float(i) for i in line.split()]
-            self.data["positions"][veh]['x'] = x
-            self.data["positions"][veh]['y'] = y
-            self.data["positions"][veh]['z'] = z
-            self.data["positions"][veh]['vel'] = vel
-            self.data["positions"][veh]['acel'] = acel
-
-    def get_phase_ndarray(self, antenna_number):
-        if self.data[antenna_number] is None:
+            data[time] = collections.OrderedDict()
+            for vehicle in range(start, stop):
+                vehicle_dict = collections.OrderedDict()
+                vehicle_dict['name'] = self.vehicle_names[self.name_ids[vehicle]]
+                vehicle_dict['x'] = float(self.position[vehicle, 0])
+                vehicle_dict['y'] = float(self.position[vehicle, 1])
+                vehicle_dict['z'] = float(self.position[vehicle, 2])
+                vehicle_dict['vel'] = float(self.vel[vehicle])
+                vehicle_dict['acel'] = float(self.acel[vehicle])
+                data[time][int(vehicle - start)] = vehicle_dict
+        return data
+
+    def get_vehicle_names(self, time):
+        vehicles = self._ray_slice(time)
+        if vehicles is None:
+            return None
+        return self.vehicle_names[self.name_ids[vehicles]].tolist()
+
+    def get_positions_ndarray(self, time):
+        """Return the positions of the vehicles of a timestep, shaped (n_vehicles, 3)"""
+        vehicles = self._ray_slice(time)
+        if vehicles is None:
+            return None
+        return self.position[vehicles]
+
+    def get_velocities_ndarray(self, time):
+        vehicles = self._ray_slice(time)
+        if vehicles is None:
+            return None
+        return self.vel[vehicles]
+
+    def get_accelerations_ndarray(self, time):
+        vehicles = self._ray_slice(time)
+        if vehicles is None:
             return None
-        data_ndarray = np.zeros((self.data[antenna_number]['paths_number'],))
-        for paths in range(self.data[antenna_number]['paths_number']):
-            data_ndarray[paths] = self.data[antenna_number][paths + 1]['phase']
-        return data_ndarray
+        return self.acel[vehicles]
 
 
 if __name__ == '__main__':
-    cir = P2mCir('../example/model.positions.t001_01.r002.p2m')
-    print('Phase: ', cir.get_phase_ndarray(1))  # Pass the antenna_number as argument
+    positions = P2mPositions('../example/model.positions.t001_01.r002.p2m')
+    print('Times: ', positions.times)
+    print('Positions: ', positions.get_positions_ndarray(positions.times[0]))
@@ -0,0 +1,122 @@
+"""Timers and counters of the parsing of p2m files
+
+> metrics = MetricsAggregator()
+> add_hook(metrics)
+> load_study('results')
+> print(metrics.to_prometheus())
+
+While no hook is registered the parsers do not measure anything. Once
+one is, each parsed file creates a ParseStats with the time spent in each
+phase (read, comments, interactions, tokenize, locate, arrays,
+cache_load, cache_store, precision) and counters (bytes, lines,
+comment_lines, receivers, rays, interaction_points, cache_hits), passed
+to every hook when the file is parsed. The dictionary view of
+get_data_dict is built later, on first access, and reported separately
+with a data_dict phase.
+"""
+import json
+import time
+import logging
+import contextlib
+import collections
+
+_hooks = []
+
+
+def add_hook(hook):
+    """Call hook(stats) with the ParseStats of every parsed file"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def enabled():
+    return bool(_hooks)
+
+
+def emit(stats):
+    for hook in list(_hooks):
+        hook(stats)
+
+
+@contextlib.contextmanager
+def capture():
+    """Collect the stats in a list instead of calling the hooks, as the
+    workers of load_study do to send them back"""
+    saved = _hooks[:]
+    captured = []
+    _hooks[:] = [captured.append]
+    try:
+        yield captured
+    finally:
+        _hooks[:] = saved
+
+
+class ParseStats:
+    """Seconds spent in each phase and counters of the parsing of one file"""
+
+    def __init__(self, parser, filename):
+        self.parser = parser
+        self.filename = filename
+        self.timings = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def as_dict(self):
+        return collections.OrderedDict([('parser', self.parser), ('filename', self.filename),
+                                        ('timings', self.timings), ('counters', self.counters)])
+
+
+class MetricsAggregator:
+    """Hook summing the stats of all the files, per parser"""
+
+    def __init__(self):
+        self.files = collections.Counter()
+        self.seconds = collections.defaultdict(collections.Counter)
+        self.counters = collections.defaultdict(collections.Counter)
+
+    def __call__(self, stats):
+        if 'data_dict' not in stats.timings or len(stats.timings) > 1:
+            self.files[stats.parser] += 1
+        self.seconds[stats.parser].update(stats.timings)
+        self.counters[stats.parser].update(stats.counters)
+
+    def to_prometheus(self, prefix='rwiparsing'):
+        """The totals in the Prometheus text exposition format"""
+        lines = ['# TYPE {}_files_total counter'.format(prefix)]
+        lines.extend('{}_files_total{{parser="{}"}} {}'.format(prefix, parser, n)
+                     for parser, n in sorted(self.files.items()))
+        lines.append('# TYPE {}_phase_seconds_total counter'.format(prefix))
+        for parser, timings in sorted(self.seconds.items()):
+            lines.extend('{}_phase_seconds_total{{parser="{}",phase="{}"}} {!r}'.format(
+                prefix, parser, phase, seconds) for phase, seconds in sorted(timings.items()))
+        # the samples of a metric must be consecutive
+        names = sorted(set(name for counters in self.counters.values() for name in counters))
+        for name in names:
+            lines.append('# TYPE {}_{}_total counter'.format(prefix, name))
+            lines.extend('{}_{}_total{{parser="{}"}} {}'.format(prefix, name, parser, counters[name])
+                         for parser, counters in sorted(self.counters.items()) if name in counters)
+        return '\n'.join(lines) + '\n'
+
+
+class LogHook:
+    """Hook logging the stats of each file as one json line"""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('rwiparsing')
+        self.level = level
+
+    def __call__(self, stats):
+        self.logger.log(self.level, json.dumps(stats.as_dict()))
@@ -0,0 +1,196 @@
+"""Spatial index over the receivers and interaction points of paths files
+
+> paths = P2mPaths('model.paths.t001_01.r002.p2m')
+> receivers, distances = nearest_receivers(paths, (10, 20, 2), k=5)
+> receivers_in_box(paths, (0, 0, 0), (50, 50, 10))
+> strongest_receiver(paths, (0, 0, 0), (50, 50, 10))
+> rays_in_box(paths, (0, 0, 0), (50, 50, 10))  # rays with an interaction inside
+
+The position of a receiver is the last point of its rays, receivers
+without rays have none and are never returned. The indexes are uniform
+grids built on first use and kept with the parser, so the following
+queries only look at the cells they overlap. CampaignIndex does the same
+over the receivers of all the files of a study.
+"""
+import numpy as np
+
+from .geometry import bounce_points
+
+
+class GridIndex:
+    """Uniform grid over (n, 3) points, NaN points are left out
+
+    Queries return indices into points. cell_size defaults to a size giving
+    about two points per cell over the extent of the points.
+    """
+
+    def __init__(self, points, cell_size=None):
+        self.points = np.asarray(points, dtype=np.float64).reshape((-1, 3))
+        valid = np.flatnonzero(~np.isnan(self.points).any(axis=1))
+        valid_points = self.points[valid]
+        if len(valid_points):
+            self.lower = valid_points.min(axis=0)
+            extent = valid_points.max(axis=0) - self.lower
+        else:
+            self.lower = np.zeros((3,))
+            extent = np.zeros((3,))
+        if cell_size is None:
+            spread = extent[extent > 0]
+            if len(spread):
+                cell_size = (np.prod(spread) * 2 / len(valid_points)) ** (1 / len(spread))
+            cell_size = max(cell_size or 1.0, 1e-9)
+        self.cell_size = float(cell_size)
+        cells = self._cells(valid_points)
+        self.shape = cells.max(axis=0) + 1 if len(cells) else np.ones((3,), dtype=np.int64)
+        keys = np.ravel_multi_index(cells.T, self.shape) if len(cells) else np.zeros((0,), dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        self._sorted = valid[order]
+        self._keys, self._starts = np.unique(keys[order], return_index=True)
+        self._stops = np.append(self._starts[1:], len(order))
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def _cells(self, points):
+        return np.floor((points - self.lower) / self.cell_size).astype(np.int64)
+
+    def _cube(self, low, high):
+        """Indices of the points in the cells from low to high, included"""
+        low = np.maximum(low, 0)
+        high = np.minimum(high, self.shape - 1)
+        if np.any(low > high) or len(self._keys) == 0:
+            return np.zeros((0,), dtype=np.int64)
+        if np.prod(high - low + 1) >= len(self._keys):
+            # more cells than occupied ones, the caller filters exactly
+            return self._sorted
+        grid = np.meshgrid(*[np.arange(l, h + 1) for l, h in zip(low, high)], indexing='ij')
+        keys = np.ravel_multi_index([g.ravel() for g in grid], self.shape)
+        pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        pos = pos[self._keys[pos] == keys]
+        starts, stops = self._starts[pos], self._stops[pos]
+        n = stops - starts
+        return self._sorted[np.repeat(starts - np.cumsum(n) + n, n) + np.arange(n.sum())]
+
+    def box(self, lower, upper):
+        """Indices of the points inside the box of corners lower and upper"""
+        lower = np.asarray(lower, dtype=np.float64)
+        upper = np.asarray(upper, dtype=np.float64)
+        candidates = self._cube(self._cells(lower), self._cells(upper))
+        points = self.points[candidates]
+        return np.sort(candidates[np.all((points >= lower) & (points <= upper), axis=1)])
+
+    def nearest(self, point, k=1):
+        """The indices of the k points nearest to point, closest first, and
+        their distances"""
+        point = np.asarray(point, dtype=np.float64)
+        k = min(k, len(self))
+        if k == 0:
+            return np.zeros((0,), dtype=np.int64), np.zeros((0,))
+        center = self._cells(point)
+        # the rings before the first one reaching the grid are empty
+        radius = int(max(0, np.max(np.maximum(-center, center - (self.shape - 1)))))
+        while True:
+            candidates = self._cube(center - radius, center + radius)
+            if len(candidates) >= k:
+                distances = np.linalg.norm(self.points[candidates] - point, axis=1)
+                order = np.argsort(distances, kind='stable')[:k]
+                # the cube holds every point closer than radius cells
+                if distances[order[-1]] <= radius * self.cell_size or len(candidates) == len(self):
+                    return candidates[order], distances[order]
+            radius += 1
+
+
+def _cached(parser, name, build):
+    """The index name of parser, built on first use"""
+    indexes = parser.__dict__.setdefault('_spatial', {})
+    if name not in indexes:
+        indexes[name] = build()
+    return indexes[name]
+
+
+def receiver_positions(paths):
+    """(n_receivers, 3) position of each receiver, NaN without rays"""
+    positions = np.full((len(paths.receiver_ids), 3), np.nan)
+    has_rays = np.diff(paths.ray_offsets) > 0
+    # the Rx is the last point of the first ray of the receiver
+    first_ray = paths.ray_offsets[:-1][has_rays]
+    positions[has_rays] = paths.points[paths.point_offsets[first_ray + 1] - 1]
+    return positions
+
+
+def receiver_index(paths):
+    """The GridIndex over the receivers of paths, indexed as receiver_ids"""
+    return _cached(paths, 'receivers', lambda: GridIndex(receiver_positions(paths)))
+
+
+def bounce_index(paths):
+    """The GridIndex over the interaction points of paths and the ray of each"""
+    def build():
+        points, offsets = bounce_points(paths)
+        return GridIndex(points), np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    return _cached(paths, 'bounces', build)
+
+
+def nearest_receivers(paths, point, k=1):
+    """Ids of the k receivers nearest to point, closest first, and their distances"""
+    indices, distances = receiver_index(paths).nearest(point, k)
+    return paths.receiver_ids[indices], distances
+
+
+def receivers_in_box(paths, lower, upper):
+    """Ids of the receivers inside the box of corners lower and upper"""
+    return paths.receiver_ids[receiver_index(paths).box(lower, upper)]
+
+
+def strongest_receiver(paths, lower, upper):
+    """Id of the receiver of the box with the highest received power, None if
+    the box has none"""
+    indices = receiver_index(paths).box(lower, upper)
+    if len(indices) == 0:
+        return None
+    return int(paths.receiver_ids[indices[np.nanargmax(paths.received_power[indices])]])
+
+
+def rays_in_box(paths, lower, upper):
+    """Indices of the rays with an interaction inside the box"""
+    index, point_rays = bounce_index(paths)
+    return np.unique(point_rays[index.box(lower, upper)])
+
+
+def ray_slices(paths, receivers):
+    """The slice of the rays of each of the receivers, in the per ray arrays"""
+    idx = [paths._receiver_index[receiver] for receiver in np.asarray(receivers).tolist()]
+    return [slice(int(paths.ray_offsets[i]), int(paths.ray_offsets[i + 1])) for i in idx]
+
+
+class CampaignIndex:
+    """Index over the receivers of several paths files
+
+    parsers maps a key, such as the (run, transmitter, transmitter_set,
+    receiver_set) of load_study, to a P2mPaths. Queries return (key,
+    receiver id) pairs.
+    """
+
+    def __init__(self, parsers):
+        self.keys = list(parsers)
+        positions = [receiver_positions(parsers[key]) for key in self.keys]
+        self._file = np.repeat(np.arange(len(positions)), [len(p) for p in positions])
+        self._receiver = np.concatenate([parsers[key].receiver_ids for key in self.keys] or
+                                        [np.zeros((0,), dtype=np.int32)])
+        self.index = GridIndex(np.concatenate(positions or [np.zeros((0, 3))]))
+
+    @classmethod
+    def from_study(cls, study, file_type='paths'):
+        """Index the files of file_type of a load_study result"""
+        return cls({key: files[file_type] for key, files in study.items() if file_type in files})
+
+    def _labels(self, indices):
+        return [(self.keys[f], r) for f, r in zip(self._file[indices].tolist(),
+                                                   self._receiver[indices].tolist())]
+
+    def nearest(self, point, k=1):
+        indices, distances = self.index.nearest(point, k)
+        return self._labels(indices), distances
+
+    def box(self, lower, upper):
+        return self._labels(self.index.box(lower, upper))
@@ -0,0 +1,152 @@
+"""Load all the p2m files of an InSite study in parallel
+
+The simulations are organized as root/run00000/study/model.paths.t001_01.r002.p2m,
+one run directory per scene.
+> load_study('results', types=('paths', 'cir'), workers=4)
+"""
+import re
+import os
+import contextlib
+import collections
+import concurrent.futures
+
+from . import profiling
+from .p2mdoa import P2mFileParser, ParsingError
+from .formats import FORMATS
+from .util import parse_file
+
+# every registered format can be loaded, see formats.register_format
+PARSERS = FORMATS
+
+_run_re = re.compile(r'^run(?P<run>\d+)$')
+
+
+def _run_of(root, dirpath):
+    """Identify the run of a directory: the number of the first runXXXXX
+    directory in its path, or the path relative to root otherwise"""
+    relative = os.path.relpath(dirpath, root)
+    for part in relative.split(os.sep):
+        match = _run_re.match(part)
+        if match:
+            return int(match.group('run'))
+    return relative
+
+
+def find_study_files(root, types=('paths', 'cir', 'doa')):
+    """Find the p2m files of the given types under root
+
+    Return a list of ((run, transmitter, transmitter_set, receiver_set), type, filename)
+    sorted by key and type.
+    """
+    types = tuple(types)
+    for file_type in types:
+        if file_type not in PARSERS:
+            raise ValueError('Unknown p2m type {}, expected one of {}'.format(
+                file_type, ', '.join(PARSERS)))
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in filenames:
+            match = re.match(P2mFileParser._filename_match_re, filename)
+            if match is None or match.group('type') not in types:
+                continue
+            key = (_run_of(root, dirpath),
+                   int(match.group('transmitter')),
+                   int(match.group('transmitter_set')),
+                   int(match.group('receiver_set')))
+            found.append((key, match.group('type'), os.path.join(dirpath, filename)))
+    # runs are numbers, unless the files are not inside runXXXXX directories
+    found.sort(key=lambda f: (not isinstance(f[0][0], int), f[0], types.index(f[1])))
+    return found
+
+
+def _error_record(file_type, filename, error=None, truncation=None):
+    return collections.OrderedDict([
+        ('type', file_type),
+        ('filename', filename),
+        ('error', None if error is None else type(error).__name__),
+        ('message', str(error) if error is not None else truncation['error']),
+        ('truncation', truncation),
+    ])
+
+
+def _load_file(file_type, filename, cache, dtype, recover, validate, isolate, profile):
+    """Parse a file in a worker, return the parser (None if it failed), its
+    error record (None if it has no problem) and its profiling stats
+
+    The truncation report and the stats do not travel with the parser, they
+    are sent back separately.
+    """
+    with (profiling.capture() if profile else contextlib.nullcontext([])) as captured:
+        try:
+            if validate and not recover:
+                # fail before converting any value
+                report = PARSERS[file_type].validate_file(filename)
+                if report['error'] is not None:
+                    raise ParsingError('{}: {}'.format(filename, report['error']))
+            parser = parse_file(file_type, filename, cache, dtype, recover)
+        except Exception as error:
+            # whatever goes wrong with a file, the others are loaded
+            if not isolate:
+                raise
+            return None, _error_record(file_type, filename, error), captured
+    if parser.truncation is None:
+        return parser, None, captured
+    return parser, _error_record(file_type, filename, truncation=parser.truncation), captured
+
+
+def load_study(root, types=('paths', 'cir', 'doa'), workers=None, cache=None, dtype=None,
+               errors=None, recover=False, validate=False):
+    """Parse all the p2m files of the given types under root
+
+    The files are parsed in a pool of workers processes (os.cpu_count() if
+    None, in this process if 1). cache is an optional
+    rwiparsing.cache.ParseCache shared by the workers. dtype=np.float32
+    halves the memory of the study, see P2mFileParser.set_precision.
+    The profiling hooks registered in this process also receive the stats
+    of the files parsed by the workers.
+
+    A bad file raises a ParsingError unless errors is a list: the record of
+    each file that failed or was recovered is then appended to it and the
+    failed files are left out. Records are OrderedDicts with the key, type,
+    filename, error (exception class name, None for a recovered file),
+    message and truncation (see P2mFileParser.validate_file). With recover
+    the files cut while InSite was writing them are loaded up to their last
+    complete receiver (see P2mFileParser). With validate the structure of
+    each file is checked first, so a truncated file fails before its values
+    are converted.
+
+    Return an OrderedDict indexed by (run, transmitter, transmitter_set, receiver_set)
+    whose values map the file type to its parser, e.g.
+    load_study('results')[(0, 1, 1, 2)]['paths'].get_p_gain_ndarray(1)
+    """
+    files = find_study_files(root, types)
+    isolate = errors is not None
+    options = (cache, dtype, recover, validate, isolate)
+    if workers == 1 or len(files) <= 1:
+        # the profiling hooks are called directly
+        loaded = [_load_file(file_type, filename, *options, profile=False)
+                  for _, file_type, filename in files]
+    else:
+        n_workers = workers or os.cpu_count() or 1
+        n_files = len(files)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            loaded = list(executor.map(_load_file, [f[1] for f in files], [f[2] for f in files],
+                                       *[[option] * n_files for option in options + (profiling.enabled(),)],
+                                       chunksize=max(1, n_files // (4 * n_workers))))
+        for _, _, captured in loaded:
+            for stats in captured:
+                profiling.emit(stats)
+
+    study = collections.OrderedDict()
+    for (key, file_type, _), (parser, record, _) in zip(files, loaded):
+        if record is not None:
+            if parser is not None:
+                parser._truncation = record['truncation']
+            if isolate:
+                record['key'] = key
+                record.move_to_end('key', last=False)
+                errors.append(record)
+        if parser is not None:
+            study.setdefault(key, collections.OrderedDict())[file_type] = parser
+    return study
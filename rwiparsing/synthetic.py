@@ -0,0 +1,166 @@
+"""Synthetic p2m files of any size, for benchmarks
+
+> rays = synthetic_rays(n_receivers=1000, max_rays=25, max_interactions=4)
+> files = write_synthetic_files('/tmp/synthetic', rays, version='3.2')
+> P2mPaths(files['paths'])
+
+The doa, paths and cir files written from the same rays describe the same
+channel, as the files InSite writes for one transmitter and receiver set.
+The values are random but in the ranges of real simulations: the rays of
+a receiver are sorted by decreasing power and their interactions lists
+and points agree with their number of interactions.
+"""
+import os
+import collections
+
+import numpy as np
+
+# InSite interaction codes: Reflection, Diffraction, Transmission, Foliage
+INTERACTION_CODES = ('R', 'R', 'R', 'D', 'T', 'F')
+
+
+def synthetic_rays(n_receivers, max_rays, max_interactions=3, empty_fraction=0.1, seed=0):
+    """Random rays, returned as the arrays of P2mPaths
+
+    Each receiver has 1 to max_rays rays, or none with probability
+    empty_fraction, and each ray 0 to max_interactions interactions.
+    """
+    random = np.random.default_rng(seed)
+    n_paths = random.integers(1, max_rays + 1, n_receivers)
+    n_paths[random.random(n_receivers) < empty_fraction] = 0
+    ray_offsets = np.zeros((n_receivers + 1,), dtype=np.int64)
+    np.cumsum(n_paths, out=ray_offsets[1:])
+    n_rays = int(ray_offsets[-1])
+    receiver = np.repeat(np.arange(n_receivers), n_paths)
+
+    srcvdpower = -80 - 70 * random.random(n_rays)
+    # decreasing power inside each receiver, as InSite writes them
+    srcvdpower = srcvdpower[np.lexsort((-srcvdpower, receiver))]
+    n_interactions = random.integers(0, max_interactions + 1, n_rays)
+    codes = np.array(INTERACTION_CODES)[random.integers(0, len(INTERACTION_CODES), int(n_interactions.sum()))]
+    interaction_offsets = np.concatenate(([0], np.cumsum(n_interactions)))
+    interactions_list = np.array(['-'.join(['Tx'] + codes[start:stop].tolist() + ['Rx'])
+                                  for start, stop in zip(interaction_offsets[:-1], interaction_offsets[1:])],
+                                 dtype=object)
+
+    transmitter_position = np.array([50.0, 17.0, 5.0])
+    receiver_position = random.random((n_receivers, 3)) * [100, 100, 2]
+    n_points = n_interactions + 2
+    point_offsets = np.concatenate(([0], np.cumsum(n_points)))
+    points = random.random((int(point_offsets[-1]), 3)) * [100, 100, 20]
+    points[point_offsets[:-1]] = transmitter_position
+    points[point_offsets[1:] - 1] = receiver_position[receiver]
+
+    return collections.OrderedDict([
+        ('receiver_ids', np.arange(1, n_receivers + 1, dtype=np.int32)),
+        ('ray_offsets', ray_offsets),
+        ('ray_n', (np.arange(n_rays) - ray_offsets[receiver] + 1).astype(np.int32)),
+        ('n_interactions', n_interactions.astype(np.int32)),
+        ('srcvdpower', srcvdpower),
+        ('phase', random.uniform(-180, 180, n_rays)),
+        ('arrival_time', random.uniform(1e-7, 2e-6, n_rays)),
+        ('arrival_angle', np.column_stack((random.uniform(0, 180, n_rays), random.uniform(0, 360, n_rays)))),
+        ('departure_angle', np.column_stack((random.uniform(0, 180, n_rays), random.uniform(0, 360, n_rays)))),
+        ('interactions_list', interactions_list),
+        ('point_offsets', point_offsets),
+        ('points', points),
+    ])
+
+
+def _receiver_stats(rays):
+    """received_power, mean_arrival_time and spread_delay of each receiver"""
+    n_paths = np.diff(rays['ray_offsets'])
+    has_paths = n_paths > 0
+    starts = rays['ray_offsets'][:-1][has_paths]
+    linear_power = 10 ** (rays['srcvdpower'] / 10)
+    stats = np.full((len(n_paths), 3), np.nan)
+    if len(starts):
+        total = np.add.reduceat(linear_power, starts)
+        mean_time = np.add.reduceat(linear_power * rays['arrival_time'], starts) / total
+        second_moment = np.add.reduceat(linear_power * rays['arrival_time'] ** 2, starts) / total
+        stats[has_paths, 0] = 10 * np.log10(total)
+        stats[has_paths, 1] = mean_time
+        stats[has_paths, 2] = np.sqrt(np.maximum(second_moment - mean_time ** 2, 0))
+    return stats
+
+
+def _write(filename, lines):
+    with open(filename, 'w') as file:
+        file.write('# Receiver Set: synthetic\n')
+        file.writelines(lines)
+
+
+def write_paths(filename, rays, version='3.3'):
+    """Write a paths file, version '3.2' has no phase column"""
+    if version not in ('3.2', '3.3'):
+        raise ValueError('Unknown InSite version {}'.format(version))
+    stats = _receiver_stats(rays)
+    ray_offsets = rays['ray_offsets']
+    point_offsets = rays['point_offsets']
+    lines = ['{:7d}\n'.format(len(rays['receiver_ids']))]
+    for idx, receiver in enumerate(rays['receiver_ids'].tolist()):
+        first, last = int(ray_offsets[idx]), int(ray_offsets[idx + 1])
+        lines.append('{:6d} {:5d}\n'.format(receiver, last - first))
+        if last == first:
+            continue
+        lines.append(' {:.2f}   {:.5E}   {:.5E}\n'.format(*stats[idx]))
+        for ray in range(first, last):
+            values = ['{:5d} {:3d}   {:.4f}'.format(rays['ray_n'][ray], rays['n_interactions'][ray],
+                                                    rays['srcvdpower'][ray])]
+            if version == '3.3':
+                values.append('{:.4f}'.format(rays['phase'][ray]))
+            values.append('{:.5E}    {:.4f}   {:.4f}    {:.4f}   {:.4f}\n'.format(
+                rays['arrival_time'][ray], *rays['arrival_angle'][ray], *rays['departure_angle'][ray]))
+            lines.append('   '.join(values))
+            lines.append(rays['interactions_list'][ray] + ' \n')
+            lines.extend(' {:.7E}   {:.7E}   {:.7E}\n'.format(*point)
+                         for point in rays['points'][point_offsets[ray]:point_offsets[ray + 1]].tolist())
+    _write(filename, lines)
+
+
+def write_doa(filename, rays):
+    """Write a doa file: path_n, azimuth, elevation and power of the arrivals"""
+    ray_offsets = rays['ray_offsets']
+    lines = ['{:7d}\n'.format(len(rays['receiver_ids']))]
+    for idx, receiver in enumerate(rays['receiver_ids'].tolist()):
+        first, last = int(ray_offsets[idx]), int(ray_offsets[idx + 1])
+        lines.append('{:6d} {:6d}\n'.format(receiver, last - first))
+        lines.extend('{:5d} {:9.3f} {:9.3f} {:9.3f}\n'.format(ray_n, azimuth, elevation, power)
+                     for ray_n, (elevation, azimuth), power in zip(
+                         rays['ray_n'][first:last].tolist(), rays['arrival_angle'][first:last].tolist(),
+                         rays['srcvdpower'][first:last].tolist()))
+    _write(filename, lines)
+
+
+def write_cir(filename, rays):
+    """Write a cir file: ray_n, phase, arrival_time and power of the rays"""
+    ray_offsets = rays['ray_offsets']
+    lines = ['{:d}\n'.format(len(rays['receiver_ids']))]
+    for idx, receiver in enumerate(rays['receiver_ids'].tolist()):
+        first, last = int(ray_offsets[idx]), int(ray_offsets[idx + 1])
+        lines.append('{:d} {:d}\n'.format(receiver, last - first))
+        lines.extend('{:d} {:.4f} {:.5E} {:.4f}\n'.format(*values) for values in zip(
+            rays['ray_n'][first:last].tolist(), rays['phase'][first:last].tolist(),
+            rays['arrival_time'][first:last].tolist(), rays['srcvdpower'][first:last].tolist()))
+    _write(filename, lines)
+
+
+def write_synthetic_files(directory, rays, types=('paths', 'cir', 'doa'), version='3.3',
+                          project='synthetic', transmitter=1, transmitter_set=1, receiver_set=2):
+    """Write the files of the given types for the rays, named as InSite does
+    (project.type.tTTT_SS.rRRR.p2m), and return a dict type -> filename"""
+    os.makedirs(directory, exist_ok=True)
+    filenames = collections.OrderedDict()
+    for type_ in types:
+        filename = os.path.join(directory, '{}.{}.t{:03d}_{:02d}.r{:03d}.p2m'.format(
+            project, type_, transmitter, transmitter_set, receiver_set))
+        if type_ == 'paths':
+            write_paths(filename, rays, version)
+        elif type_ == 'doa':
+            write_doa(filename, rays)
+        elif type_ == 'cir':
+            write_cir(filename, rays)
+        else:
+            raise ValueError('Unknown file type {}'.format(type_))
+        filenames[type_] = filename
+    return filenames
@@ -0,0 +1,33 @@
+"""Helpers shared by the modules reading and writing whole studies
+
+> parse_file('paths', 'model.paths.t001_01.r002.p2m', cache=None)
+> replace_atomically('index.json', lambda tmp: write_index(tmp))
+"""
+import os
+import tempfile
+
+from .formats import FORMATS
+
+
+def parse_file(file_type, filename, cache=None, dtype=None, recover=False):
+    """Parse filename with the parser of the registered file_type
+
+    It is a module level function so that pools of processes can run it,
+    the parser is sent back as arrays (see P2mFileParser.__getstate__).
+    """
+    return FORMATS[file_type](filename, cache=cache, dtype=dtype, recover=recover)
+
+
+def replace_atomically(filename, write):
+    """Call write(tmp) on a temporary file next to filename and rename it to
+    filename, so readers and crashes never see a partial file"""
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
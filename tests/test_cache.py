@@ -0,0 +1,88 @@
+"""Entries of the parse cache follow their source files
+
+python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from rwiparsing import P2MDoA
+from rwiparsing.cache import ParseCache
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ParseCache(os.path.join(self.directory, 'cache'), max_bytes=None)
+        self.filenames = []
+        for receiver_set in (1, 2, 3):
+            filename = os.path.join(self.directory, 'iter0.doa.t001_05.r00{}.p2m'.format(receiver_set))
+            shutil.copy(os.path.join(EXAMPLE, 'iter0.doa.t001_05.r006.p2m'), filename)
+            self.filenames.append(filename)
+        self.filename = self.filenames[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def set_mtime(self, path, seconds):
+        os.utime(path, ns=(seconds * 10**9, seconds * 10**9))
+
+    def test_hit(self):
+        expected = P2MDoA(self.filename)
+        self.assertIsNone(self.cache.load(P2MDoA, self.filename))
+        P2MDoA(self.filename, cache=self.cache)
+        self.assertIsNotNone(self.cache.load(P2MDoA, self.filename))
+        cached = P2MDoA(self.filename, cache=self.cache)
+        np.testing.assert_array_equal(cached.directions, expected.directions)
+        self.assertEqual(cached.data.keys(), expected.data.keys())
+
+    def test_modified_file(self):
+        P2MDoA(self.filename, cache=self.cache)
+        with open(self.filename, 'rb') as file:
+            text = file.read()
+        with open(self.filename, 'wb') as file:
+            file.write(text.replace(b'166.464', b'1166.464'))
+        self.assertIsNone(self.cache.load(P2MDoA, self.filename))
+        directions = P2MDoA(self.filename, cache=self.cache).directions
+        self.assertIn(1166.464, directions)
+        self.assertNotIn(166.464, directions)
+
+    def test_same_size_new_content(self):
+        P2MDoA(self.filename, cache=self.cache)
+        with open(self.filename, 'rb') as file:
+            text = file.read()
+        with open(self.filename, 'wb') as file:
+            file.write(text.replace(b'166.464', b'166.465'))
+        self.set_mtime(self.filename, 2000000000)
+        self.assertIsNone(self.cache.load(P2MDoA, self.filename))
+
+    def test_touched_file(self):
+        P2MDoA(self.filename, cache=self.cache)
+        self.set_mtime(self.filename, 2000000000)
+        self.assertIsNotNone(self.cache.load(P2MDoA, self.filename))
+        # the fingerprint was refreshed, the content is not hashed again
+        with np.load(self.cache.entry_path(P2MDoA, self.filename)) as npz:
+            self.assertEqual(npz['__mtime_ns__'].item(), 2000000000 * 10**9)
+
+    def test_lru_eviction(self):
+        first, second, third = self.filenames
+        for filename in (first, second):
+            P2MDoA(filename, cache=self.cache)
+        entries = [self.cache.entry_path(P2MDoA, filename) for filename in self.filenames]
+        self.set_mtime(entries[0], 1000)
+        self.set_mtime(entries[1], 2000)
+        # the first one is used again, the second one is now the least recently used
+        self.assertIsNotNone(self.cache.load(P2MDoA, first))
+        self.cache.max_bytes = 2 * os.path.getsize(entries[0])
+        P2MDoA(third, cache=self.cache)
+        self.assertEqual([os.path.exists(entry) for entry in entries], [True, False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""The channels computed for all the receivers at once must be the sums
+over the rays of each receiver
+
+python -m unittest discover tests
+"""
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from rwiparsing import P2mPaths
+from rwiparsing import channel
+from rwiparsing.channel import ChannelRays, ULA, ofdm_frequencies
+from rwiparsing.synthetic import synthetic_rays, write_synthetic_files
+
+
+class TestChannelRays(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        rays = synthetic_rays(n_receivers=25, max_rays=6, max_interactions=2, empty_fraction=0.2)
+        cls.paths = P2mPaths(write_synthetic_files(cls.directory, rays, types=('paths',))['paths'])
+        cls.rays = ChannelRays.from_paths(cls.paths)
+        cls.frequencies = ofdm_frequencies(16, 240e3)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def loop_frequency_response(self, relative_delay):
+        expected = np.zeros((self.paths.n_receivers, len(self.frequencies)), dtype=np.complex128)
+        for idx in range(self.paths.n_receivers):
+            rays = range(self.paths.ray_offsets[idx], self.paths.ray_offsets[idx + 1])
+            first = min((self.paths.arrival_time[ray] for ray in rays), default=0)
+            for ray in rays:
+                gain = 10 ** (self.paths.srcvdpower[ray] / 20) * np.exp(1j * np.radians(self.paths.phase[ray]))
+                delay = self.paths.arrival_time[ray] - (first if relative_delay else 0)
+                expected[idx] += gain * np.exp(-2j * np.pi * delay * self.frequencies)
+        return expected
+
+    def test_frequency_response(self):
+        for relative_delay in (False, True):
+            with self.subTest(relative_delay=relative_delay):
+                np.testing.assert_allclose(self.rays.frequency_response(self.frequencies, relative_delay),
+                                           self.loop_frequency_response(relative_delay), rtol=1e-12, atol=1e-20)
+
+    def test_blocks(self):
+        # a few receivers per block
+        expected = self.rays.frequency_response(self.frequencies)
+        with mock.patch.object(channel, '_BLOCK_ELEMENTS', 4 * len(self.frequencies)):
+            np.testing.assert_allclose(self.rays.frequency_response(self.frequencies), expected, rtol=1e-12)
+
+    def test_empty_receivers(self):
+        empty = np.diff(self.paths.ray_offsets) == 0
+        self.assertTrue(empty.any())
+        self.assertFalse(self.rays.frequency_response(self.frequencies)[empty].any())
+
+    def test_mimo_narrowband(self):
+        rx, tx = ULA(2), ULA(4)
+        H = self.rays.mimo_narrowband(rx, tx)
+        gains = self.rays.complex_gains()
+        for idx in range(self.paths.n_receivers):
+            expected = np.zeros((2, 4), dtype=np.complex128)
+            for ray in range(self.paths.ray_offsets[idx], self.paths.ray_offsets[idx + 1]):
+                a_rx = rx.steering(*self.paths.arrival_angle[ray])
+                a_tx = tx.steering(*self.paths.departure_angle[ray])
+                expected += gains[ray] * np.outer(a_rx, a_tx.conj())
+            np.testing.assert_allclose(H[idx], expected, rtol=1e-12, atol=1e-20)
+
+
+if __name__ == '__main__':
+    unittest.main()
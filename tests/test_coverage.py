@@ -0,0 +1,67 @@
+"""The coverage matrices follow the paths files of the transmitters
+
+python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from rwiparsing import P2mPaths
+from rwiparsing.coverage import Coverage
+from rwiparsing.synthetic import synthetic_rays, write_synthetic_files
+
+
+class TestCoverage(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filenames = [self.write(transmitter, seed=transmitter) for transmitter in (1, 2, 3)]
+        self.coverage = Coverage()
+        for filename in self.filenames:
+            self.coverage.add_file(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, transmitter, seed):
+        rays = synthetic_rays(n_receivers=20, max_rays=4, max_interactions=2, empty_fraction=0.2, seed=seed)
+        return write_synthetic_files(self.directory, rays, types=('paths',), transmitter=transmitter)['paths']
+
+    def assertRows(self, filenames):
+        for row, filename in enumerate(filenames):
+            paths = P2mPaths(filename)
+            columns = np.searchsorted(self.coverage.receiver_ids, paths.receiver_ids)
+            np.testing.assert_array_equal(self.coverage.received_power[row, columns], paths.received_power)
+            np.testing.assert_array_equal(self.coverage.spread_delay[row, columns], paths.spread_delay)
+
+    def test_add_file(self):
+        self.assertEqual(self.coverage.transmitters, [(1, 1), (2, 1), (3, 1)])
+        self.assertRows(self.filenames)
+
+    def test_refresh(self):
+        before = self.coverage.received_power.copy()
+        self.assertEqual(self.coverage.refresh(), [])
+        self.write(2, seed=10)
+        # the size may be the same, the modification time tells the change
+        os.utime(self.filenames[1], ns=(10**18, 10**18))
+        self.assertEqual(self.coverage.refresh(), [(2, 1)])
+        self.assertEqual(self.coverage.transmitters, [(1, 1), (2, 1), (3, 1)])
+        self.assertRows(self.filenames)
+        np.testing.assert_array_equal(self.coverage.received_power[[0, 2]], before[[0, 2]])
+        self.assertFalse(np.array_equal(self.coverage.received_power[1], before[1], equal_nan=True))
+        self.assertEqual(self.coverage.refresh(), [])
+
+    def test_best_server(self):
+        servers, power = self.coverage.best_server()
+        matrix = np.where(np.isnan(self.coverage.received_power), -np.inf, self.coverage.received_power)
+        covered = np.isfinite(matrix).any(axis=0)
+        np.testing.assert_array_equal(servers[covered], matrix[:, covered].argmax(axis=0))
+        np.testing.assert_array_equal(servers[~covered], -1)
+        np.testing.assert_array_equal(power[covered], matrix[:, covered].max(axis=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
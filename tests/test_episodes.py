@@ -0,0 +1,125 @@
+"""The episode index maps the vehicles of the scenes to their receivers
+
+python -m unittest discover tests
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+from rwiparsing import P2mPaths
+from rwiparsing.episodes import EpisodeIndex
+from rwiparsing.synthetic import synthetic_rays, write_synthetic_files
+
+
+def _receiver_position(rays, receiver):
+    idx = int(np.flatnonzero(rays['receiver_ids'] == receiver)[0])
+    first_ray = rays['ray_offsets'][idx]
+    return rays['points'][rays['point_offsets'][first_ray + 1] - 1]
+
+
+def write_scene(directory, rays, vehicles):
+    """paths and cir files of receiver set 3 and the positions file, of
+    receiver set 2, of vehicles (name -> position) at time 0"""
+    write_synthetic_files(directory, rays, types=('paths', 'cir'), receiver_set=3)
+    lines = ['# positions\n1\n0\n{}\n'.format(len(vehicles))]
+    for name, position in vehicles.items():
+        lines.append('{}\n {:.4f} {:.4f} {:.4f} 5.0 0.1\n'.format(name, *position))
+    with open(os.path.join(directory, 'synthetic.positions.t001_01.r002.p2m'), 'w') as file:
+        file.writelines(lines)
+
+
+class TestEpisodeIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.root = os.path.join(cls.directory, 'study')
+        cls.receivers = {}
+        for run in range(3):
+            rays = synthetic_rays(n_receivers=30, max_rays=3, empty_fraction=0, seed=run)
+            # car1 drives near receiver 3 then 7, truck2 is out of the receivers grid
+            receiver = 3 + 4 * run
+            cls.receivers[run] = receiver
+            vehicles = {'car1': _receiver_position(rays, receiver) + [0.5, 0, 0],
+                        'truck2': np.array([1000.0, 1000.0, 1.5])}
+            write_scene(os.path.join(cls.root, 'run{:05d}'.format(run)), rays, vehicles)
+        # a run which positions file is missing
+        os.remove(os.path.join(cls.root, 'run00002', 'synthetic.positions.t001_01.r002.p2m'))
+        with warnings.catch_warnings(record=True) as cls.warnings:
+            warnings.simplefilter('always')
+            cls.index = EpisodeIndex.build(cls.root, episode_of=lambda run: divmod(run, 2))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.index.close()
+        shutil.rmtree(cls.directory)
+
+    def test_build(self):
+        self.assertEqual(self.index.episodes(), [0])
+        self.assertEqual(self.index.vehicles(0), ['car1'])
+        self.assertEqual([entry['run'] for entry in self.index.scenes(0, 'car1')], [0, 1])
+        for scene in (0, 1):
+            entry = self.index.lookup(0, scene, 'car1')
+            self.assertEqual(entry['receiver'], self.receivers[scene])
+            self.assertEqual(list(entry['files']), ['paths', 'cir'])
+            self.assertEqual(entry['files']['paths'],
+                             os.path.join('run{:05d}'.format(scene), 'synthetic.paths.t001_01.r003.p2m'))
+        with self.assertRaises(KeyError):
+            self.index.lookup(0, 0, 'truck2')
+        self.assertEqual([str(warning.message) for warning in self.warnings],
+                         ['run 2 has no positions file, it is not indexed'])
+
+    def test_iter_vehicle(self):
+        scenes = self.index.vehicle_rays(0, 'car1')
+        self.assertEqual([scene for scene, _ in scenes], [0, 1])
+        for scene, arrays in scenes:
+            entry = self.index.lookup(0, scene, 'car1')
+            expected = P2mPaths(os.path.join(self.root, entry['files']['paths'])).get_receiver_arrays(
+                entry['receiver'])
+            self.assertEqual(list(arrays), list(expected))
+            for name in expected:
+                np.testing.assert_array_equal(arrays[name], expected[name], name)
+
+    def test_save_load(self):
+        filename = os.path.join(self.directory, 'episodes.json')
+        self.index.save(filename)
+        moved = os.path.join(self.directory, 'moved')
+        loaded = EpisodeIndex.load(filename, root=moved)
+        self.assertEqual(loaded.root, moved)
+        self.assertEqual(loaded.entries, self.index.entries)
+        self.assertEqual(loaded.lookup(0, 1, 'car1'), self.index.lookup(0, 1, 'car1'))
+        self.assertEqual(EpisodeIndex.load(filename).root, os.path.abspath(self.root))
+
+    def test_load_version(self):
+        filename = os.path.join(self.directory, 'future.json')
+        with open(filename, 'w') as file:
+            json.dump({'version': 0, 'root': self.root, 'entries': []}, file)
+        with self.assertRaises(ValueError):
+            EpisodeIndex.load(filename)
+
+
+class TestOutsideRuns(unittest.TestCase):
+    """The run of files outside runXXXXX directories is their directory"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        rays = synthetic_rays(n_receivers=10, max_rays=2, empty_fraction=0)
+        write_scene(os.path.join(self.directory, 'morning'), rays, {'car1': _receiver_position(rays, 5)})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_build(self):
+        index = EpisodeIndex.build(self.directory)
+        entry = index.lookup(0, 'morning', 'car1')
+        self.assertEqual(entry['run'], 'morning')
+        self.assertEqual(entry['receiver'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""The format of a file told by its content
+
+python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from rwiparsing import P2MDoA
+from rwiparsing.formats import sniff_format, open_p2m
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+class TestSniffFormat(unittest.TestCase):
+
+    def read(self, file_type):
+        with open(os.path.join(EXAMPLE, 'iter0.{}.t001_05.r006.p2m'.format(file_type)), 'rb') as file:
+            return file.read()
+
+    def test_examples(self):
+        for file_type in ('paths', 'doa'):
+            self.assertEqual(sniff_format(self.read(file_type)), file_type)
+
+    def test_receiver_set_name(self):
+        # the comment looks like an interactions list
+        text = b'# Receiver Set: Tx-Rx street grid\n' + self.read('doa').split(b'\n', 1)[1]
+        self.assertEqual(sniff_format(text), 'doa')
+
+
+class TestOpenP2m(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(EXAMPLE, 'iter0.doa.t001_05.r006.p2m'), 'rb') as file:
+            text = file.read()
+        # cut in the last receiver, under a name that does not tell the format
+        self.filename = os.path.join(self.directory, 'renamed.p2m')
+        with open(self.filename, 'wb') as file:
+            file.write(text[:len(text) - 40])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_dtype(self):
+        doa = open_p2m(os.path.join(EXAMPLE, 'iter0.doa.t001_05.r006.p2m'), dtype=np.float32)
+        self.assertEqual(doa.directions.dtype, np.float32)
+
+    def test_recover(self):
+        doa = open_p2m(self.filename, recover=True)
+        self.assertIsInstance(doa, P2MDoA)
+        self.assertTrue(doa.truncation['truncated'])
+        self.assertEqual(doa.n_receivers, doa.truncation['complete_receivers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
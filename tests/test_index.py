@@ -0,0 +1,169 @@
+"""The receiver index must agree with the full parse
+
+python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from rwiparsing import P2mPaths, P2mPositions, LazyP2mFile, parse_parallel
+from rwiparsing.formats import FORMATS
+from rwiparsing.synthetic import synthetic_rays, write_synthetic_files
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+class TestTxInComments(unittest.TestCase):
+    """InSite writes the name of the receiver set in a comment, which may
+    look like an interactions list"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.filename = os.path.join(cls.directory, 'iter0.paths.t001_05.r006.p2m')
+        with open(os.path.join(EXAMPLE, 'iter0.paths.t001_05.r006.p2m'), 'rb') as file:
+            lines = file.readlines()
+        with open(cls.filename, 'wb') as file:
+            file.write(b'# Receiver Set: Tx-Rx street grid\n')
+            file.writelines(lines[1:])
+        cls.paths = P2mPaths(cls.filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_validate_file(self):
+        report = P2mPaths.validate_file(self.filename)
+        self.assertIsNone(report['error'])
+        self.assertEqual(report['rays'], self.paths.ray_offsets[-1])
+
+    def test_recover(self):
+        self.assertIsNone(P2mPaths(self.filename, recover=True).truncation)
+
+    def test_lazy(self):
+        lazy = LazyP2mFile(P2mPaths, self.filename)
+        for receiver in self.paths.receiver_ids.tolist():
+            expected = self.paths.get_receiver_arrays(receiver)
+            arrays = lazy.get_receiver_arrays(receiver)
+            self.assertEqual(list(arrays), list(expected))
+            for name in expected:
+                np.testing.assert_array_equal(arrays[name], expected[name], name)
+
+    def test_parse_parallel(self):
+        parsed = parse_parallel(P2mPaths, self.filename, workers=1)
+        for name, value in self.paths.to_arrays().items():
+            np.testing.assert_array_equal(parsed.to_arrays()[name], value, name)
+
+
+class TestCommentsInTheBody(unittest.TestCase):
+    """Comment lines may be anywhere in a file, not only at its top"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.filenames = {}
+        for file_type in ('paths', 'doa'):
+            filename = os.path.join(cls.directory, 'iter0.{}.t001_05.r006.p2m'.format(file_type))
+            with open(os.path.join(EXAMPLE, os.path.basename(filename)), 'rb') as file:
+                lines = file.readlines()
+            lines.insert(len(lines) // 2, b'# a comment in the middle\n')
+            with open(filename, 'wb') as file:
+                file.writelines(lines)
+            cls.filenames[file_type] = filename
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_lazy(self):
+        for file_type, filename in self.filenames.items():
+            parser_class = FORMATS[file_type]
+            parsed = parser_class(filename)
+            lazy = LazyP2mFile(parser_class, filename)
+            for receiver in parsed.receiver_ids.tolist():
+                expected = parsed.get_receiver_arrays(receiver)
+                arrays = lazy.get_receiver_arrays(receiver)
+                self.assertEqual(list(arrays), list(expected))
+                for name in expected:
+                    np.testing.assert_array_equal(arrays[name], expected[name], name)
+
+    def test_parse_parallel(self):
+        for file_type, filename in self.filenames.items():
+            parser_class = FORMATS[file_type]
+            expected = parser_class(filename).to_arrays()
+            arrays = parse_parallel(parser_class, filename, workers=2).to_arrays()
+            self.assertEqual(sorted(arrays), sorted(expected))
+            for name in expected:
+                np.testing.assert_array_equal(arrays[name], expected[name], name)
+
+
+class TestEmptyReceivers(unittest.TestCase):
+    """The receivers without rays of an InSite 3.3 file parsed apart have a phase"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        rays = synthetic_rays(n_receivers=100, max_rays=5, empty_fraction=0.3)
+        cls.filename = write_synthetic_files(cls.directory, rays, types=('paths',))['paths']
+        cls.paths = P2mPaths(cls.filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def assertSameReceivers(self, receivers):
+        for receiver in self.paths.receiver_ids.tolist():
+            self.assertEqual(list(receivers[receiver]), list(self.paths.get_receiver_arrays(receiver)))
+            self.assertEqual(len(receivers[receiver]['phase']), len(receivers[receiver]['srcvdpower']))
+
+    def test_lazy(self):
+        lazy = LazyP2mFile(P2mPaths, self.filename)
+        self.assertSameReceivers({receiver: lazy.get_receiver_arrays(receiver)
+                                  for receiver in self.paths.receiver_ids.tolist()})
+
+    def test_iter_receivers(self):
+        # one receiver per batch
+        self.assertSameReceivers(dict(P2mPaths.iter_receivers(self.filename, batch_bytes=1)))
+
+
+class TestPositions(unittest.TestCase):
+    """The timesteps of the positions files start with two lines"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.filename = os.path.join(cls.directory, 'model.positions.t001_01.r002.p2m')
+        with open(cls.filename, 'w') as file:
+            file.write('# positions\n3\n'
+                       '0\n2\ncar1\n 10.0 20.0 1.5 5.0 0.1\ntruck7\n 30.5 -2.0 2.5 3.2 -0.2\n'
+                       '1\n0\n'
+                       '2\n2\nbus3\n 1.0 2.0 3.0 0.0 0.0\ncar1\n 15.0 20.0 1.5 5.1 0.1\n')
+        cls.positions = P2mPositions(cls.filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_validate_file(self):
+        report = P2mPositions.validate_file(self.filename)
+        self.assertIsNone(report['error'])
+        self.assertEqual(report['rays'], 4)
+
+    def test_lazy(self):
+        lazy = LazyP2mFile(P2mPositions, self.filename)
+        for time in self.positions.times.tolist():
+            self.assertEqual(lazy.get_receiver_arrays(time)['names'].tolist(),
+                             self.positions.get_receiver_arrays(time)['names'].tolist())
+
+    def test_parse_parallel(self):
+        parsed = parse_parallel(P2mPositions, self.filename, workers=1, chunks_per_worker=3)
+        for time in self.positions.times.tolist():
+            self.assertEqual(parsed.get_vehicle_names(time), self.positions.get_vehicle_names(time))
+        np.testing.assert_array_equal(parsed.position, self.positions.position)
+
+
+if __name__ == '__main__':
+    unittest.main()
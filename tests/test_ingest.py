@@ -0,0 +1,77 @@
+"""Ingestion of a study with bad files
+
+python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from rwiparsing import ingest
+from rwiparsing.ingest import StudyIngestor, read_manifest, read_failures
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.root = os.path.join(self.directory, 'study')
+        self.dataset = os.path.join(self.directory, 'dataset')
+        for run in range(3):
+            study = os.path.join(self.root, 'run{:05d}'.format(run), 'study')
+            os.makedirs(study)
+            shutil.copy(os.path.join(EXAMPLE, 'iter0.doa.t001_05.r006.p2m'), study)
+        # cut right after the number of receivers
+        self.source = os.path.join('run00001', 'study', 'iter0.doa.t001_05.r007.p2m')
+        with open(os.path.join(self.root, self.source), 'wb') as file:
+            file.write(b'# Receiver Set: cut\n     30\n ')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def ingestor(self):
+        return StudyIngestor(self.root, self.dataset, types=('doa',), settle_seconds=0)
+
+    def test_bad_file(self):
+        ingestor = self.ingestor()
+        self.assertEqual(len(ingestor.ingest()), 3)
+        self.assertEqual(list(ingestor.failed), [self.source])
+        self.assertEqual(len(read_manifest(self.dataset)), 3)
+        self.assertEqual(read_failures(self.dataset), ingestor.failed)
+        self.assertEqual(ingestor.pending(), [])
+
+    def test_restart(self):
+        self.ingestor().ingest()
+        # the bad file is not parsed again until it changes
+        ingestor = self.ingestor()
+        self.assertEqual(list(ingestor.failed), [self.source])
+        self.assertEqual(ingestor.pending(), [])
+        shutil.copy(os.path.join(EXAMPLE, 'iter0.doa.t001_05.r006.p2m'), os.path.join(self.root, self.source))
+        entries = self.ingestor().ingest()
+        self.assertEqual([entry['source'] for entry in entries], [self.source])
+        self.assertEqual(len(read_manifest(self.dataset)), 4)
+        self.assertEqual(read_failures(self.dataset), {})
+
+    def test_interrupted(self):
+        write_p2mbin = ingest.write_p2mbin
+        written = []
+
+        def interrupt(parser, filename):
+            if written:
+                raise KeyboardInterrupt()
+            written.append(filename)
+            write_p2mbin(parser, filename)
+
+        with mock.patch.object(ingest, 'write_p2mbin', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.ingestor().ingest()
+        # the file ingested before the interruption is not parsed again
+        self.assertEqual(len(read_manifest(self.dataset)), 1)
+        self.assertEqual(len(self.ingestor().ingest()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""Queries on the interactions lists of the rays
+
+python -m unittest discover tests
+"""
+import unittest
+
+import numpy as np
+
+from rwiparsing.interactions import InteractionTable
+
+
+class TestInteractionTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = InteractionTable.from_strings(
+            ['Tx-Rx', 'Tx-R-Rx', 'Tx-DS-Rx', 'Tx-D-R-Rx', 'Tx-R-Rx', 'Tx-D-Rx'])
+
+    def test_from_strings(self):
+        self.assertEqual(self.table.sequences.tolist(),
+                         ['Tx-Rx', 'Tx-R-Rx', 'Tx-DS-Rx', 'Tx-D-R-Rx', 'Tx-D-Rx'])
+        np.testing.assert_array_equal(self.table.ids, [0, 1, 2, 3, 1, 4])
+
+    def test_only(self):
+        np.testing.assert_array_equal(self.table.only(['R']), [1, 1, 0, 0, 1, 0])
+        np.testing.assert_array_equal(self.table.only(('D', 'R')), [1, 1, 0, 1, 1, 1])
+
+    def test_only_one_code(self):
+        # a str is a single code, DS is not D and S
+        np.testing.assert_array_equal(self.table.only('R'), self.table.only(['R']))
+        np.testing.assert_array_equal(self.table.only('DS'), [1, 0, 1, 0, 0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""p2mbin files give back the parsed arrays, memory mapped
+
+python -m unittest discover tests
+"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from rwiparsing import P2mPaths, write_p2mbin, open_p2mbin
+from rwiparsing.formats import FORMATS
+from rwiparsing.synthetic import synthetic_rays, write_synthetic_files
+
+
+def write_version_1(paths, filename):
+    """Write paths as p2mbin version 1 did, with the interactions list of every ray"""
+    arrays = paths.to_arrays()
+    del arrays['interaction_sequences'], arrays['interaction_ids']
+    arrays['interactions_list'] = P2mPaths._join_strings(paths.interactions_list)
+    write_p2mbin(type('P2mPaths', (), {'to_arrays': lambda self: arrays})(), filename)
+    with open(filename, 'r+b') as file:
+        file.seek(8)
+        file.write(struct.pack('<I', 1))
+
+
+class TestP2mBin(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        rays = synthetic_rays(n_receivers=30, max_rays=6, max_interactions=3, empty_fraction=0.2)
+        cls.files = write_synthetic_files(cls.directory, rays, types=('paths', 'cir', 'doa'))
+        cls.parsed = {file_type: FORMATS[file_type](filename) for file_type, filename in cls.files.items()}
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def write(self, file_type):
+        filename = self.files[file_type] + 'bin'
+        write_p2mbin(self.parsed[file_type], filename)
+        return filename
+
+    def assertSameReceivers(self, opened, parsed):
+        for receiver in parsed.receiver_ids.tolist():
+            expected = parsed.get_receiver_arrays(receiver)
+            arrays = opened.get_receiver_arrays(receiver)
+            self.assertEqual(list(arrays), list(expected))
+            for name in expected:
+                np.testing.assert_array_equal(arrays[name], expected[name], name)
+
+    def test_round_trip(self):
+        for file_type, parsed in self.parsed.items():
+            with self.subTest(file_type=file_type):
+                opened = open_p2mbin(self.write(file_type))
+                self.assertIs(type(opened), type(parsed))
+                expected = parsed.to_arrays()
+                arrays = opened.to_arrays()
+                self.assertEqual(sorted(arrays), sorted(expected))
+                for name in expected:
+                    np.testing.assert_array_equal(arrays[name], expected[name], name)
+
+    def test_memmap_receivers(self):
+        for file_type, parsed in self.parsed.items():
+            with self.subTest(file_type=file_type):
+                opened = open_p2mbin(self.write(file_type))
+                self.assertIsInstance(opened.ray_offsets, np.memmap)
+                self.assertSameReceivers(opened, parsed)
+
+    def test_version_1(self):
+        filename = self.files['paths'] + 'bin'
+        write_version_1(self.parsed['paths'], filename)
+        opened = open_p2mbin(filename)
+        self.assertEqual(opened.interactions_list.tolist(), self.parsed['paths'].interactions_list.tolist())
+        self.assertSameReceivers(opened, self.parsed['paths'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+"""The bulk parsers must give the results of the original line by line ones
+
+The reference functions below read the files as rwiparsing did before
+the bulk tokenizer, one uncommented line at a time, and build the same
+nested dictionaries. They are compared to the data of the parsers on the
+example files and on synthetic InSite 3.2 and 3.3 files.
+
+python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import collections
+
+import numpy as np
+
+from rwiparsing import P2MDoA, P2MDoD, P2mPaths, P2mCir
+from rwiparsing.synthetic import synthetic_rays, write_synthetic_files
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+def _lines(filename):
+    with open(filename) as file:
+        for line in file:
+            if not line.lstrip().startswith('#'):
+                yield line
+
+
+def reference_paths(filename):
+    lines = _lines(filename)
+    data = collections.OrderedDict()
+    for _ in range(int(next(lines))):
+        receiver, n_paths = [int(i) for i in next(lines).split()]
+        if n_paths == 0:
+            data[receiver] = None
+            continue
+        received_power, arrival_time, spread_delay = [float(i) for i in next(lines).split()]
+        receiver_dict = data[receiver] = collections.OrderedDict()
+        receiver_dict['received_power'] = received_power
+        receiver_dict['arrival_time'] = arrival_time
+        receiver_dict['spread_delay'] = spread_delay
+        receiver_dict['paths_number'] = n_paths
+        for _ in range(n_paths):
+            values = [float(i) for i in next(lines).split()]
+            ray_n, n_interactions = int(values[0]), int(values[1])
+            ray = receiver_dict[ray_n] = collections.OrderedDict()
+            ray['srcvdpower'] = values[2]
+            if len(values) == 9:
+                ray['phase'] = values.pop(3)
+            ray['arrival_time'] = values[3]
+            ray['arrival_angle1'], ray['arrival_angle2'] = values[4:6]
+            ray['departure_angle1'], ray['departure_angle2'] = values[6:8]
+            ray['interactions_list'] = next(lines).strip()
+            ray['interactions'] = collections.OrderedDict(
+                (str(i), np.array([float(j) for j in next(lines).split()]))
+                for i in range(n_interactions + 2))
+            ray['n_interactions'] = n_interactions
+    return data
+
+
+def reference_doa(filename):
+    lines = _lines(filename)
+    data = collections.OrderedDict()
+    for _ in range(int(next(lines))):
+        receiver, n_paths = [int(i) for i in next(lines).split()]
+        data[receiver] = collections.OrderedDict()
+        for _ in range(n_paths):
+            values = next(lines).split()
+            data[receiver][int(values[0])] = np.array([float(j) for j in values[1:]])
+    return data
+
+
+def reference_cir(filename):
+    lines = _lines(filename)
+    data = collections.OrderedDict()
+    for _ in range(int(next(lines))):
+        receiver, n_paths = [int(i) for i in next(lines).split()]
+        if n_paths == 0:
+            data[receiver] = None
+            continue
+        data[receiver] = collections.OrderedDict([('paths_number', n_paths)])
+        for _ in range(n_paths):
+            ray_n, phase, arrival_time, srcvdpower = [float(i) for i in next(lines).split()]
+            data[receiver][ray_n] = collections.OrderedDict([
+                ('ray_n', ray_n), ('phase', phase), ('arrival_time', arrival_time),
+                ('srcvdpower', srcvdpower)])
+    return data
+
+
+class ReferenceTestCase(unittest.TestCase):
+
+    def assertSameData(self, data, expected, path=''):
+        if isinstance(expected, dict):
+            self.assertIsInstance(data, dict, path)
+            self.assertEqual(list(data), list(expected), path)
+            for key in expected:
+                self.assertSameData(data[key], expected[key], '{}/{}'.format(path, key))
+        elif isinstance(expected, np.ndarray):
+            np.testing.assert_array_equal(data, expected, path)
+        else:
+            self.assertEqual(type(data), type(expected), path)
+            self.assertEqual(data, expected, path)
+
+
+class TestExampleFiles(ReferenceTestCase):
+
+    def test_paths(self):
+        filename = os.path.join(EXAMPLE, 'iter0.paths.t001_05.r006.p2m')
+        self.assertSameData(P2mPaths(filename).data, reference_paths(filename))
+
+    def test_doa(self):
+        filename = os.path.join(EXAMPLE, 'iter0.doa.t001_05.r006.p2m')
+        self.assertSameData(P2MDoA(filename).data, reference_doa(filename))
+
+    def test_dod(self):
+        filename = os.path.join(EXAMPLE, 'iter0.dod.t001_05.r006.p2m')
+        self.assertSameData(P2MDoD(filename).data, reference_doa(filename))
+
+
+class TestSyntheticFiles(ReferenceTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        rays = synthetic_rays(n_receivers=60, max_rays=8, max_interactions=4, empty_fraction=0.2)
+        cls.files = {version: write_synthetic_files(os.path.join(cls.directory, version), rays,
+                                                    version=version)
+                     for version in ('3.2', '3.3')}
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_paths(self):
+        for version, files in self.files.items():
+            with self.subTest(version=version):
+                paths = P2mPaths(files['paths'])
+                self.assertEqual(paths.has_phase, version == '3.3')
+                self.assertSameData(paths.data, reference_paths(files['paths']))
+
+    def test_cir(self):
+        filename = self.files['3.3']['cir']
+        self.assertSameData(P2mCir(filename).data, reference_cir(filename))
+
+    def test_doa(self):
+        filename = self.files['3.3']['doa']
+        self.assertSameData(P2MDoA(filename).data, reference_doa(filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""The grid index must answer as a brute force search
+
+python -m unittest discover tests
+"""
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from rwiparsing import P2mPaths
+from rwiparsing.spatial import (GridIndex, CampaignIndex, receiver_positions, nearest_receivers,
+                                receivers_in_box)
+from rwiparsing.synthetic import synthetic_rays, write_synthetic_files
+
+
+class TestGridIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.points = rng.uniform(-50, 50, (500, 3)) * (1, 1, 0.1)
+        self.points[::17] = np.nan
+        self.queries = np.concatenate([rng.uniform(-60, 60, (20, 3)), [(500, -500, 0)]])
+
+    def brute_nearest(self, point, k):
+        distances = np.linalg.norm(self.points - point, axis=1)
+        order = np.argsort(np.where(np.isnan(distances), np.inf, distances), kind='stable')[:k]
+        return distances[order]
+
+    def test_nearest(self):
+        for cell_size in (None, 0.5, 30.0):
+            index = GridIndex(self.points, cell_size)
+            for point in self.queries:
+                for k in (1, 7):
+                    indices, distances = index.nearest(point, k)
+                    np.testing.assert_allclose(distances, self.brute_nearest(point, k))
+                    np.testing.assert_allclose(np.linalg.norm(self.points[indices] - point, axis=1), distances)
+
+    def test_box(self):
+        for cell_size in (None, 0.5, 30.0):
+            index = GridIndex(self.points, cell_size)
+            for lower, upper in [((-10, -10, -1), (20, 5, 1)), ((-100, -100, -100), (100, 100, 100)),
+                                 ((60, 60, 0), (70, 70, 1)), ((5, 5, 5), (-5, -5, -5))]:
+                with np.errstate(invalid='ignore'):
+                    inside = np.all((self.points >= lower) & (self.points <= upper), axis=1)
+                np.testing.assert_array_equal(index.box(lower, upper), np.flatnonzero(inside))
+
+    def test_no_points(self):
+        index = GridIndex(np.full((3, 3), np.nan))
+        self.assertEqual(len(index.nearest((0, 0, 0), 2)[0]), 0)
+        self.assertEqual(len(index.box((-1, -1, -1), (1, 1, 1))), 0)
+
+
+class TestReceivers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        rays = synthetic_rays(n_receivers=80, max_rays=3, max_interactions=2, empty_fraction=0.2)
+        cls.paths = P2mPaths(write_synthetic_files(cls.directory, rays, types=('paths',))['paths'])
+        cls.positions = receiver_positions(cls.paths)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_positions(self):
+        # the Rx is the last point of every ray of the receiver
+        for idx in range(self.paths.n_receivers):
+            for ray in range(self.paths.ray_offsets[idx], self.paths.ray_offsets[idx + 1]):
+                np.testing.assert_array_equal(self.paths.points[self.paths.point_offsets[ray + 1] - 1],
+                                              self.positions[idx])
+
+    def test_nearest_receivers(self):
+        point = np.nanmean(self.positions, axis=0)
+        receivers, distances = nearest_receivers(self.paths, point, k=5)
+        all_distances = np.linalg.norm(self.positions - point, axis=1)
+        np.testing.assert_allclose(distances, np.sort(all_distances[~np.isnan(all_distances)])[:5])
+        idx = [self.paths._receiver_index[receiver] for receiver in receivers.tolist()]
+        np.testing.assert_allclose(all_distances[idx], distances)
+
+    def test_receivers_in_box(self):
+        lower = np.nanpercentile(self.positions, 25, axis=0)
+        upper = np.nanpercentile(self.positions, 75, axis=0)
+        with np.errstate(invalid='ignore'):
+            inside = np.all((self.positions >= lower) & (self.positions <= upper), axis=1)
+        np.testing.assert_array_equal(receivers_in_box(self.paths, lower, upper), self.paths.receiver_ids[inside])
+
+    def test_campaign(self):
+        campaign = CampaignIndex({'a': self.paths, 'b': self.paths})
+        point = np.nanmean(self.positions, axis=0)
+        labels, distances = campaign.nearest(point, k=2)
+        receiver = nearest_receivers(self.paths, point)[0][0]
+        # the same receiver in both files
+        self.assertEqual(sorted(labels), [('a', receiver), ('b', receiver)])
+        self.assertEqual(distances[0], distances[1])
+        self.assertEqual(len(campaign.box((-1e9,) * 3, (1e9,) * 3)),
+                         2 * np.count_nonzero(~np.isnan(self.positions[:, 0])))
+
+
+if __name__ == '__main__':
+    unittest.main()
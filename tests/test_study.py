@@ -0,0 +1,86 @@
+"""Loading a study with bad files
+
+python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from rwiparsing import load_study
+from rwiparsing.formats import FORMATS
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+
+class TestErrors(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        study = os.path.join(self.root, 'run00000', 'study')
+        os.makedirs(study)
+        shutil.copy(os.path.join(EXAMPLE, 'iter0.doa.t001_05.r006.p2m'), study)
+        # cut right after the number of receivers
+        self.cut = os.path.join(study, 'iter0.doa.t001_05.r007.p2m')
+        with open(self.cut, 'wb') as file:
+            file.write(b'# Receiver Set: cut\n     30\n ')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_errors_are_recorded(self):
+        errors = []
+        study = load_study(self.root, types=('doa',), workers=1, errors=errors)
+        self.assertEqual(list(study), [(0, 1, 5, 6)])
+        self.assertEqual([(record['filename'], record['error']) for record in errors],
+                         [(self.cut, 'ParsingError')])
+
+    def test_recover(self):
+        errors = []
+        study = load_study(self.root, types=('doa',), workers=1, errors=errors, recover=True)
+        self.assertEqual(study[(0, 1, 5, 7)]['doa'].n_receivers, 0)
+        self.assertTrue(errors[0]['truncation']['truncated'])
+
+
+class TestNoFinalEndOfLine(unittest.TestCase):
+    """A complete file may end without an end of line"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        study = os.path.join(cls.root, 'run00000', 'study')
+        os.makedirs(study)
+        cls.filenames = {}
+        for file_type in ('paths', 'doa'):
+            basename = 'iter0.{}.t001_05.r006.p2m'.format(file_type)
+            with open(os.path.join(EXAMPLE, basename), 'rb') as file:
+                text = file.read()
+            cls.filenames[file_type] = os.path.join(study, basename)
+            with open(cls.filenames[file_type], 'wb') as file:
+                file.write(text.rstrip(b'\n'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_validate_file(self):
+        for file_type, filename in self.filenames.items():
+            report = FORMATS[file_type].validate_file(filename)
+            self.assertIsNone(report['error'], file_type)
+            self.assertEqual(report['complete_receivers'], report['expected_receivers'])
+
+    def test_recover(self):
+        for file_type, filename in self.filenames.items():
+            parser = FORMATS[file_type](filename, recover=True)
+            self.assertIsNone(parser.truncation, file_type)
+            self.assertEqual(parser.n_receivers, FORMATS[file_type](filename).n_receivers)
+
+    def test_load_study(self):
+        errors = []
+        study = load_study(self.root, types=('paths', 'doa'), workers=1, errors=errors, validate=True)
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(study[(0, 1, 5, 6)]), ['doa', 'paths'])
+
+
+if __name__ == '__main__':
+    unittest.main()